@@ -0,0 +1,338 @@
+# Import needed modules
+import asyncio
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# Every message is framed by its payload length and its type
+HEADER = struct.Struct("<IB")
+
+# Message types
+COMMAND = 1  # Client -> server, JSON: {"id": 1, "command": "takeoff", "args": {}}
+REPLY = 2  # Server -> client, JSON: {"id": 1, "result": null, "error": null}
+SUBSCRIBE = 3  # Client -> server, float32: rate of state messages in Hz, 0 to unsubscribe
+STATE = 4  # Server -> client, binary state of the swarm, see encode_state()
+
+# Header of a state message: frame time, amount of drones
+STATE_HEADER = struct.Struct("<dI")
+
+
+def encode_state(frame_time, positions, targets, in_flight):
+	"""
+	Encode the state of the swarm into the payload of a state message.
+	The header is followed by the positions and the targets as float32 arrays of shape (N, 3) and the flight flags as
+	uint8 array of shape (N,).
+	"""
+	return b"".join((
+		STATE_HEADER.pack(frame_time, len(positions)),
+		positions.astype(np.float32).tobytes(),
+		targets.astype(np.float32).tobytes(),
+		in_flight.astype(np.uint8).tobytes()))
+
+
+def decode_state(payload):
+	"""
+	Decode the payload of a state message, see encode_state().
+	:return: Tuple of the frame time, positions, targets and flight flags.
+	"""
+	frame_time, amount = STATE_HEADER.unpack_from(payload)
+	arrays = np.frombuffer(payload, dtype=np.float32, count=amount * 6, offset=STATE_HEADER.size).reshape(2, amount, 3)
+	in_flight = np.frombuffer(payload, dtype=np.uint8, offset=STATE_HEADER.size + amount * 24).astype(bool)
+	return frame_time, arrays[0], arrays[1], in_flight
+
+
+def _error_reply(message_id, error):
+	"""
+	Encode the reply to a message that could not be executed.
+	:param message_id: Id of the message, None if it could not be read.
+	:param error: Description of the error.
+	:return: Encoded reply.
+	"""
+	return json.dumps({"id": message_id, "result": None, "error": error}).encode()
+
+
+class _Client:
+	"""
+	Connection of a single client, only the newest state is kept for it so slow clients skip states instead of piling
+	them up.
+	"""
+
+	def __init__(self, writer):
+		self.writer = writer
+		self.interval = None  # Seconds between two state messages, None if not subscribed
+		self.last_state = 0  # Time the last state message was sent
+		self.latest_state = None  # Newest state that was not sent yet
+		self.state_ready = asyncio.Event()
+
+	def offer_state(self, payload, now):
+		"""
+		Hand a new state to the client, replacing an older one that was not sent yet.
+		"""
+		if self.interval is not None and now - self.last_state >= self.interval:
+			self.latest_state = payload
+			self.state_ready.set()
+
+	async def send_states(self):
+		"""
+		Send the newest state whenever there is one, waits for the client to keep up before sending the next one.
+		"""
+		while True:
+			await self.state_ready.wait()
+			self.state_ready.clear()
+			payload, self.latest_state = self.latest_state, None
+			self.last_state = time.monotonic()
+			self.writer.write(HEADER.pack(len(payload), STATE) + payload)
+			await self.writer.drain()
+
+	def send_reply(self, reply):
+		self.writer.write(HEADER.pack(len(reply), REPLY) + reply)
+
+
+class ApiServer:
+	"""
+	Local API to script the simulation from other processes through a Unix socket.
+
+	The socket is served by an asyncio loop in its own thread. Commands are only queued there and executed by a Panda
+	task, so neither the drone manager is called from another thread nor does a client ever block the simulation.
+	"""
+
+	SOCKET_PATH = "/tmp/swarmulator.sock"  # Default path of the socket
+	MAX_COMMANDS_PER_FRAME = 100  # Further commands wait for the next frame to keep the frame time bounded
+
+	# Commands of the drone manager that can be called through the API
+	COMMANDS = (
+		"takeoff", "land", "stop_movement", "stop_rotors", "update_drone_amount",
+		"default_formation", "spiral_formation", "random_formation", "set_formation",
+		"set_movement", "set_rotation", "stop_rotation", "play_mission", "stop_mission",
+		"save_checkpoint", "load_checkpoint", "set_setpoint_mode", "get_convergence", "load_obstacles",
+		"get_metrics", "record_metrics", "stop_recording_metrics")
+
+	# Commands of the clock of the simulation that can be called through the API
+	CLOCK_COMMANDS = ("pause", "resume", "step", "set_speed")
+
+	def __init__(self, base, drone_manager, path=SOCKET_PATH):
+		"""
+		:param base: The simulation, to add the task to.
+		:param drone_manager: The drone manager commands are sent to.
+		:param path: Path of the Unix socket.
+		"""
+		self.base = base
+		self.drone_manager = drone_manager
+		self.path = path
+		self.commands = queue.SimpleQueue()  # (client, command message) to execute in the Panda task
+		self.clients = set()
+		self.loop = None
+
+	def start(self):
+		"""
+		Start serving the socket in a background thread and add the task executing the commands.
+		"""
+		if os.path.exists(self.path):
+			# Only a socket left behind by a simulation that is gone may be replaced, not the one of a running simulation
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.path)
+			except ConnectionRefusedError:
+				os.remove(self.path)
+			else:
+				raise RuntimeError("Another simulation serves the API at {}, choose another path".format(self.path))
+			finally:
+				probe.close()
+
+		loop = asyncio.new_event_loop()
+		started = threading.Event()
+		errors = []
+
+		def serve():
+			asyncio.set_event_loop(loop)
+			try:
+				loop.run_until_complete(asyncio.start_unix_server(self._handle_client, path=self.path))
+			except Exception as error:
+				errors.append(error)
+				return
+			finally:
+				started.set()
+			loop.run_forever()
+
+		threading.Thread(target=serve, name="ApiServer", daemon=True).start()
+		started.wait()
+		if errors:
+			loop.close()
+			raise errors[0]
+		self.loop = loop
+
+		self.base.taskMgr.add(self._api_task, "ApiServerTask")
+
+	def stop(self):
+		"""
+		Stop serving the socket and remove the task.
+		"""
+		self.base.taskMgr.remove("ApiServerTask")
+		if self.loop is not None:
+			self.loop.call_soon_threadsafe(self.loop.stop)
+			self.loop = None
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+	async def _handle_client(self, reader, writer):
+		"""
+		Read the messages of a client until it disconnects.
+		"""
+		client = _Client(writer)
+		self.clients.add(client)
+		sender = asyncio.ensure_future(client.send_states())
+
+		try:
+			while True:
+				length, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+				payload = await reader.readexactly(length)
+
+				if kind == COMMAND:
+					# Broken messages are answered right away, the connection stays open
+					try:
+						message = json.loads(payload)
+					except ValueError as error:
+						client.send_reply(_error_reply(None, "Invalid JSON: " + str(error)))
+						continue
+					self.commands.put((client, message))
+				elif kind == SUBSCRIBE:
+					rate = struct.unpack("<f", payload)[0]
+					client.interval = 1 / rate if rate > 0 else None
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			sender.cancel()
+			self.clients.discard(client)
+			writer.close()
+
+	def _api_task(self, task):
+		"""
+		Execute queued commands and hand the current state to subscribed clients.
+		"""
+		for _ in range(self.MAX_COMMANDS_PER_FRAME):
+			try:
+				client, message = self.commands.get_nowait()
+			except queue.Empty:
+				break
+			self.loop.call_soon_threadsafe(client.send_reply, self._execute(message))
+
+		# Only encode the state if anyone listens
+		if any(client.interval is not None for client in list(self.clients)):
+			manager = self.drone_manager
+			in_flight = np.array([drone.in_flight for drone in manager.drones], dtype=bool)
+			payload = encode_state(self.base.clock.time, manager.get_positions(), manager.get_targets(), in_flight)
+			self.loop.call_soon_threadsafe(self._offer_state, payload)
+
+		return task.cont
+
+	def _offer_state(self, payload):
+		now = time.monotonic()
+		for client in list(self.clients):
+			client.offer_state(payload, now)
+
+	def _execute(self, message):
+		"""
+		Call a command of the drone manager.
+		:param message: Decoded command message.
+		:return: Encoded reply to send back, with the error instead if the command failed or its result is no JSON.
+		"""
+		if not isinstance(message, dict):
+			return _error_reply(None, "Command message has to be a JSON object, got " + type(message).__name__)
+
+		reply = {"id": message.get("id"), "result": None, "error": None}
+		command = message.get("command")
+
+		if command in self.COMMANDS:
+			target = self.drone_manager
+		elif command in self.CLOCK_COMMANDS:
+			target = self.base.clock
+		else:
+			reply["error"] = "Unknown command: " + str(command)
+			return json.dumps(reply).encode()
+
+		try:
+			reply["result"] = getattr(target, command)(**message.get("args", {}))
+			return json.dumps(reply).encode()
+		except Exception as error:
+			reply["result"] = None
+			reply["error"] = repr(error)
+		return json.dumps(reply).encode()
+
+
+class ApiClient:
+	"""
+	Blocking client for the API, to script the simulation from another process.
+	"""
+
+	def __init__(self, path=ApiServer.SOCKET_PATH):
+		self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.socket.connect(path)
+		self.next_id = 0
+		self.states = []  # State messages received while waiting for replies
+
+	def close(self):
+		self.socket.close()
+
+	def _send(self, kind, payload):
+		self.socket.sendall(HEADER.pack(len(payload), kind) + payload)
+
+	def _receive_exactly(self, size):
+		data = b""
+		while len(data) < size:
+			chunk = self.socket.recv(size - len(data))
+			if not chunk:
+				raise ConnectionError("Connection to the simulation was closed")
+			data += chunk
+		return data
+
+	def _receive(self):
+		length, kind = HEADER.unpack(self._receive_exactly(HEADER.size))
+		return kind, self._receive_exactly(length)
+
+	def command(self, command, **args):
+		"""
+		Call a command of the drone manager and wait for its reply.
+		:param command: Name of the command, see ApiServer.COMMANDS.
+		:param args: Keyword arguments of the command.
+		:return: Result of the command.
+		"""
+		self.next_id += 1
+		self._send(COMMAND, json.dumps({"id": self.next_id, "command": command, "args": args}).encode())
+
+		while True:
+			kind, payload = self._receive()
+			if kind == STATE:
+				self.states.append(payload)
+				continue
+			reply = json.loads(payload)
+			if reply["id"] == self.next_id:
+				if reply["error"] is not None:
+					raise RuntimeError(reply["error"])
+				return reply["result"]
+
+	def subscribe(self, rate):
+		"""
+		Receive the state of the swarm with a certain rate.
+		:param rate: States per second, 0 to unsubscribe.
+		"""
+		self._send(SUBSCRIBE, struct.pack("<f", rate))
+
+	def read_state(self):
+		"""
+		Wait for the next state of the swarm.
+		:return: Tuple of the frame time, positions, targets and flight flags.
+		"""
+		if self.states:
+			return decode_state(self.states.pop(0))
+
+		while True:
+			kind, payload = self._receive()
+			if kind == STATE:
+				return decode_state(payload)
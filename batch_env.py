@@ -0,0 +1,236 @@
+# Load  Panda3D modules
+from panda3d.core import Filename
+from panda3d.core import Loader
+from panda3d.core import NodePath
+
+# Load classes from other files
+from controller import DefaultController
+from controller import SwarmState
+from convergence import ConvergenceTracker
+from drone import Drone
+from point_mass import integrate
+from point_mass import resolve_contacts
+from room_sdf import RoomSDF
+from spatial_index import neighbour_pairs
+
+# Import needed modules
+import time
+
+import numpy as np
+
+
+class BatchSwarmEnv:
+	"""
+	Many small, independent swarms flown at once in a single process, without any ShowBase, e.g. for parameter sweeps or
+	randomised starts.
+
+	All environments share one set of arrays with shape (K, N, 3) for K environments of N drones. The drones are point
+	masses (see point_mass.py) flown by a single controller call for all environments. Drones of different environments
+	never see each other: for the neighbour search every environment is shifted along the x axis far enough from the
+	others. Every environment draws its starts and targets from its own random generator, so its episodes do not depend
+	on the other environments. An episode is done once all drones arrived at their targets (with the tolerances of the
+	ConvergenceTracker) or it ran out of steps, the environment is reset right away within the same step.
+	"""
+
+	DT = 1 / 100  # Seconds per step, the physics rate of the simulation (see render_governor.py)
+	MAX_STEPS = 2000  # Steps an episode may take before it is cut off
+	MIN_HEIGHT = .3  # Lowest height of starts and targets, as for random formations
+	BOUNDS = ((-2, -2, 0), (2, 2, 2))  # Corners of the space drones are put in if there is no room
+	MIN_SPACING = Drone.AVOIDANCE_PROXIMITY_RADIUS  # Smallest distance between random starts or random targets
+	PLACEMENT_ROUNDS = 100  # Rounds of candidates drawn for random positions before giving up
+
+	def __init__(self, environments, drones, room_sdf=None, controller=None, seed=None, max_steps=MAX_STEPS, dt=DT,
+			scenario=None):
+		"""
+		Create all environments and start their first episodes.
+		:param environments: Amount of environments K.
+		:param drones: Amount of drones N in every environment.
+		:param room_sdf: RoomSDF of the room to fly in (see load_room), None for an open space without walls.
+		:param controller: Controller for the drones of all environments, the default control law by default.
+		:param seed: Seed of all random generators, every environment gets its own generator derived from it.
+		:param max_steps: Steps an episode may take before it is cut off.
+		:param dt: Seconds per step.
+		:param scenario: Function getting the random generator of an environment and the environment itself, returning
+		the starts and targets of a new episode as arrays with shape (N, 3). Random positions in the room by default.
+		"""
+		self.environments = environments
+		self.drones = drones
+		self.room_sdf = room_sdf
+		self.controller = controller or DefaultController.from_drone(Drone)
+		self.max_steps = max_steps
+		self.dt = dt
+		self.scenario = scenario or BatchSwarmEnv.random_scenario
+		self.neighbour_radius = max(Drone.AVOIDANCE_PROXIMITY_RADIUS, 2 * Drone.COLLISION_SPHERE_RADIUS)
+
+		if room_sdf is None:
+			self.lower, self.upper = (np.array(corner, dtype=float) for corner in self.BOUNDS)
+		else:
+			self.lower, self.upper = room_sdf.lower.astype(float), room_sdf.upper.astype(float)
+
+		# State of all drones of all environments
+		shape = (environments, drones, 3)
+		self.positions = np.zeros(shape)
+		self.velocities = np.zeros(shape)
+		self.forces = np.zeros(shape)
+		self.targets = np.zeros(shape)
+		self.avoidance_vectors = np.zeros(shape)
+		self.inverse_masses = np.full((environments, drones), 1 / Drone.RIGID_BODY_MASS)
+		self.radii = np.full((environments, drones), Drone.COLLISION_SPHERE_RADIUS)
+		self.damping = np.full((environments, drones), Drone.LINEAR_DAMPING)
+		self.settled = np.zeros((environments, drones))  # Seconds every drone is within the tolerances
+
+		# State of the episodes
+		self.steps = np.zeros(environments, dtype=np.int64)  # Steps of the current episode of every environment
+		self.episodes = np.zeros(environments, dtype=np.int64)  # Finished episodes of every environment
+		self.randoms = [np.random.default_rng(sequence) for sequence in np.random.SeedSequence(seed).spawn(environments)]
+
+		self.reset()
+
+	@staticmethod
+	def load_room(model_path):
+		"""
+		Load the distance field of a room without any ShowBase.
+		:param model_path: Path of the room model, e.g. Simulator.ROOM_MODEL_PATH.
+		:return: The RoomSDF of the room.
+		"""
+		model = NodePath(Loader.getGlobalPtr().loadSync(Filename.fromOsSpecific(model_path)))
+		return RoomSDF(model)
+
+	def per_environment(self, values):
+		"""
+		Spread one value per environment to all of its drones, e.g. for the parameters of a DefaultController.
+		:param values: Sequence with one value per environment.
+		:return: Array with one value per drone of all environments.
+		"""
+		return np.repeat(np.asarray(values, dtype=float), self.drones)
+
+	def random_scenario(self, random):
+		"""
+		Draw random starts and targets within the room, outside of the safety margin of its walls. Neither two starts nor
+		two targets are closer than MIN_SPACING, so the drones are not held apart by their avoidance at their targets.
+		:param random: Random generator of the environment.
+		:return: Tuple of starts and targets, arrays with shape (N, 3).
+		"""
+		return self._spaced_positions(random), self._spaced_positions(random)
+
+	def _spaced_positions(self, random):
+		"""
+		Draw random positions for all drones of an environment, at least MIN_SPACING apart from each other.
+		:param random: Random generator of the environment.
+		:return: Array of positions with shape (N, 3).
+		"""
+		lower = (self.lower[0], self.lower[1], max(self.lower[2], self.MIN_HEIGHT))
+		positions = np.zeros((0, 3))
+		for _ in range(self.PLACEMENT_ROUNDS):
+			if len(positions) == self.drones:
+				break
+			candidates = random.uniform(lower, self.upper, (self.drones, 3))
+			if self.room_sdf is not None:
+				candidates = candidates[self.room_sdf.distance(candidates) > self.room_sdf.WALL_SAFETY_MARGIN]
+
+			# Candidates are taken one after another, each has to keep its distance to all taken before
+			for candidate in candidates:
+				distances = np.linalg.norm(positions - candidate, axis=1)
+				if len(positions) < self.drones and np.all(distances >= self.MIN_SPACING):
+					positions = np.concatenate((positions, candidate[np.newaxis]))
+
+		if len(positions) < self.drones:
+			raise ValueError("Could not place {} drones at least {} apart".format(self.drones, self.MIN_SPACING))
+		return positions
+
+	def reset(self, environments=None):
+		"""
+		Start new episodes.
+		:param environments: Numbers of the environments to reset, None resets all environments.
+		"""
+		if environments is None:
+			environments = range(self.environments)
+
+		for number in environments:
+			random = self.randoms[number]
+			self.positions[number], self.targets[number] = self.scenario(self, random)
+			vectors = random.normal(size=(self.drones, 3))
+			self.avoidance_vectors[number] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+		self.velocities[environments] = 0
+		self.forces[environments] = 0
+		self.settled[environments] = 0
+		self.steps[environments] = 0
+
+	def step(self):
+		"""
+		Advance all environments by a single step and reset those whose episode is done.
+		:return: Tuple of the numbers of the environments whose episode ended in this step, the steps these episodes took,
+		whether they converged (otherwise they ran out of steps) and the mean distance of their drones to the targets.
+		"""
+		positions = self.positions.reshape(-1, 3)
+		velocities = self.velocities.reshape(-1, 3)
+
+		if self.room_sdf is None:
+			wall_forces = np.zeros_like(positions)
+		else:
+			wall_forces = self.room_sdf.repulsion(positions)
+
+		# Differences of positions within an environment stay the same, so shifting the environments apart keeps the
+		# forces as they are while drones of different environments are never neighbours
+		shifts = self._shifts()
+		shifted = (self.positions + shifts).reshape(-1, 3)
+		state = SwarmState(shifted, velocities, (self.targets + shifts).reshape(-1, 3),
+			self.avoidance_vectors.reshape(-1, 3), wall_forces, self.neighbour_radius)
+		self.forces.reshape(-1, 3)[:] = self.controller.compute(state)
+
+		integrate(self.positions, self.velocities, self.forces, self.inverse_masses, self.damping, 0, self.dt)
+		i, j = neighbour_pairs((self.positions + shifts).reshape(-1, 3), 2 * self.radii.max())
+		resolve_contacts(positions, velocities, self.inverse_masses.reshape(-1), self.radii.reshape(-1), i, j)
+		self.steps += 1
+
+		# Same checks as the ConvergenceTracker, targets never move within an episode
+		errors = np.linalg.norm(self.positions - self.targets, axis=2)
+		within = errors < ConvergenceTracker.POSITION_TOLERANCE
+		within &= np.linalg.norm(self.velocities, axis=2) < ConvergenceTracker.VELOCITY_TOLERANCE
+		self.settled = np.where(within, self.settled + self.dt, 0)
+		converged = (self.settled >= ConvergenceTracker.SETTLE_TIME).all(axis=1)
+
+		done = np.flatnonzero(converged | (self.steps >= self.max_steps))
+		results = done, self.steps[done].copy(), converged[done], errors[done].mean(axis=1)
+		if len(done) > 0:
+			self.episodes[done] += 1
+			self.reset(done)
+		return results
+
+	def run(self, episodes):
+		"""
+		Step all environments until enough episodes are done.
+		:param episodes: Amount of episodes to finish, over all environments.
+		:return: Tuple of arrays as returned by step, with one entry for every finished episode in the order they ended.
+		"""
+		results = []
+		finished = 0
+		while finished < episodes:
+			result = self.step()
+			results.append(result)
+			finished += len(result[0])
+		return tuple(np.concatenate(column)[:episodes] for column in zip(*results))
+
+	def _shifts(self):
+		"""
+		Offsets along the x axis moving the environments apart, so no drone is within the neighbour radius of a drone of
+		another environment.
+		:return: Array of offsets with shape (K, 1, 3).
+		"""
+		x = self.positions[..., 0]
+		spacing = x.max() - x.min() + 2 * max(self.neighbour_radius, 2 * self.radii.max())
+		shifts = np.zeros((self.environments, 1, 3))
+		shifts[:, 0, 0] = np.arange(self.environments) * spacing
+		return shifts
+
+
+if __name__ == "__main__":
+	# Fly many short episodes of small swarms and report how fast they are done
+	for environments, drones in ((1000, 5), (100, 20)):
+		env = BatchSwarmEnv(environments, drones, seed=0)
+		start = time.perf_counter()
+		numbers, steps, converged, errors = env.run(2 * environments)
+		print("{} environments of {} drones: {} episodes in {:.1f}s, {:.1%} converged after {:.0f} steps on average, "
+			"mean distance to targets at the end {:.3f}".format(environments, drones, len(numbers),
+			time.perf_counter() - start, converged.mean(), steps[converged].mean(), errors.mean()))
@@ -2,10 +2,19 @@
 from direct.gui.DirectGui import DirectFrame
 from direct.gui.DirectButton import DirectButton
 from direct.showbase import DirectObject
+from direct.showbase.ShowBaseGlobal import globalClock
 from panda3d.core import Vec3
+from panda3d.core import Point3
+from panda3d.core import OrthographicLens
 
 from handler import Handler
 
+# Import needed modules
+import math
+
+import numpy as np
+
+
 def reset_camera(base):
 	"""
 	Set camera to default position.
@@ -18,8 +27,27 @@ class CameraControl(DirectObject.DirectObject, Handler):
 	"""
 	This class takes care of the commands to the camera, e.g. event handling, setting up the update task and more.
 	The accept-calls are only working if panda has its own top level window and key presses are propagated to it.
+
+	The camera is either moved freely by keyboard or follows the swarm in one of the follow modes. All movement is
+	integrated over the frame time, so the speed does not depend on the frame rate. If there is neither input nor a
+	change of the followed target, the camera is not touched at all.
 	"""
 
+	# Modes of the camera
+	FREE = 0  # Moved by keyboard
+	FOLLOW = 1  # Follows a single drone
+	FIT = 2  # Keeps the whole swarm in view
+	TOP_DOWN = 3  # Looks straight down on the swarm with an orthographic lens
+
+	MOVE_SPEED = 3  # Maximum speed of the camera in free mode (units per second)
+	TURN_SPEED = 60  # Maximum turn rate of the camera in free mode (degrees per second)
+	ACCELERATION = 8  # How fast the camera reaches the wanted speed (1 / seconds)
+	DAMPING = 8  # How fast the camera stops without input (1 / seconds)
+	SMOOTHING = 4  # How fast the camera reaches its pose in the follow modes (1 / seconds)
+	FOLLOW_OFFSET = Vec3(0, -2, 1)  # Position of the camera relative to a followed drone
+	TOP_DOWN_HEIGHT = 10  # Height of the camera in top-down mode
+	EPSILON = 1e-3  # Movements below this are treated as no movement
+
 	def __init__(self, base, handler):
 		"""
 		Set up trigger, get movement directions and create event handling.
@@ -28,6 +56,7 @@ class CameraControl(DirectObject.DirectObject, Handler):
 
 		# Save handler instance to update debug mode
 		self.handler = handler
+		self.base = base
 
 		# Trigger to tell where the camera is supposed to go
 		self.forward_trig = 0
@@ -36,10 +65,15 @@ class CameraControl(DirectObject.DirectObject, Handler):
 		self.heading_trig = 0
 		self.pitch_trig = 0
 
-		# Store the movement needed to go in each direction (updated in task)
-		self.forward = 0
-		self.right = 0
-		self.up = 0
+		# Current speed of the camera in free mode, in camera coordinates (right, forward, up) and (heading, pitch)
+		self.velocity = Vec3(0, 0, 0)
+		self.turn_velocity = Vec3(0, 0, 0)
+
+		# State of the follow modes
+		self.mode = self.FREE
+		self.follow_drone = 0  # Number of the followed drone
+		self.perspective_lens = base.camLens  # To switch back after top-down mode
+		self.orthographic_lens = OrthographicLens()
 
 		# Event handling for key down events
 		self.accept('w', self.set_forward_trig, [1])
@@ -53,6 +87,9 @@ class CameraControl(DirectObject.DirectObject, Handler):
 		self.accept('r', self.set_pitch_trig, [1])
 		self.accept('f', self.set_pitch_trig, [-1])
 		self.accept('f1', self.debug)
+		self.accept('f2', self.follow_next_drone)
+		self.accept('f3', self.set_mode, [self.FIT])
+		self.accept('f4', self.set_mode, [self.TOP_DOWN])
 
 		# Event handling for key up events
 		self.accept('w-up', self.set_forward_trig, [0])
@@ -71,7 +108,7 @@ class CameraControl(DirectObject.DirectObject, Handler):
 
 		# Create button to reset camera position and orientation
 		frame = DirectFrame(frameColor=(.1, .1, .1, .7), frameSize=(-.22, .22, -.05, .08), pos=(-1.1, 0, -0.94))
-		button = DirectButton(text="Reset Camera", frameSize=(-4, 4, -.5, 1), scale=.05, command=reset_camera, extraArgs=[base])
+		button = DirectButton(text="Reset Camera", frameSize=(-4, 4, -.5, 1), scale=.05, command=self.reset)
 		button.reparentTo(frame)
 
 	def set_forward_trig(self, trig):
@@ -79,30 +116,75 @@ class CameraControl(DirectObject.DirectObject, Handler):
 		Event handling function for for/backward movement command.
 		"""
 		self.forward_trig = trig
+		self._take_control(trig)
 
 	def set_right_trig(self, trig):
 		"""
 		Event handling function for left/right movement command.
 		"""
 		self.right_trig = trig
+		self._take_control(trig)
 
 	def set_up_trig(self, trig):
 		"""
 		Event handling function for up/downward movement command.
 		"""
 		self.up_trig = trig
+		self._take_control(trig)
 
 	def set_heading_trig(self, trig):
 		"""
 		Event handling function for heading rotation command.
 		"""
 		self.heading_trig = trig
+		self._take_control(trig)
 
 	def set_pitch_trig(self, trig):
 		"""
 		Event handling function for pitch rotation command.
 		"""
 		self.pitch_trig = trig
+		self._take_control(trig)
+
+	def _take_control(self, trig):
+		"""
+		Any movement command switches back to free mode.
+		"""
+		if trig != 0 and self.mode != self.FREE:
+			self.set_mode(self.FREE)
+
+	def set_mode(self, mode):
+		"""
+		Switch the mode of the camera.
+		:param mode: One of FREE, FOLLOW, FIT and TOP_DOWN.
+		"""
+		# Only the top-down mode uses the orthographic lens
+		if mode == self.TOP_DOWN:
+			self.base.cam.node().setLens(self.orthographic_lens)
+		elif self.mode == self.TOP_DOWN:
+			self.base.cam.node().setLens(self.perspective_lens)
+			self.base.camera.setHpr(0, -30, 0)
+
+		self.mode = mode
+		self.velocity = Vec3(0, 0, 0)
+		self.turn_velocity = Vec3(0, 0, 0)
+
+	def follow_next_drone(self):
+		"""
+		Follow a drone, every further call switches to the next drone.
+		"""
+		if self.mode == self.FOLLOW:
+			self.follow_drone += 1
+		else:
+			self.follow_drone = 0
+			self.set_mode(self.FOLLOW)
+
+	def reset(self):
+		"""
+		Switch back to free mode and set the camera to its default position.
+		"""
+		self.set_mode(self.FREE)
+		reset_camera(self.base)
 
 	def debug(self):
 		"""
@@ -119,39 +201,82 @@ class CameraControl(DirectObject.DirectObject, Handler):
 		"""
 		Task function for actually updating the position of the camera.
 		"""
-		# Get current position, reset delta
-		cur_pos = base.camera.getPos()
-		cur_hpr = base.camera.getHpr()
-		delta_pos = Vec3(0, 0, 0)
-
-		# Update the movement needed to go in each direction (rotation changes these)
-		self.forward = base.camera.getQuat().getForward()
-		self.right = base.camera.getQuat().getRight()
-		self.up = base.camera.getQuat().getUp()
-
-		# Check if movement is wanted
-		if self.forward_trig == 1:
-			delta_pos += self.forward
-		elif self.forward_trig == -1:
-			delta_pos -= self.forward
-		if self.right_trig == 1:
-			delta_pos += self.right
-		elif self.right_trig == -1:
-			delta_pos -= self.right
-		if self.up_trig == 1:
-			delta_pos += self.up
-		elif self.up_trig == -1:
-			delta_pos -= self.up
-
-		# Fine tune delta and move camera
-		delta_pos.normalize()
-		delta_pos *= .05
-		base.camera.setPos(cur_pos + delta_pos)
-
-		# Rotate camera as wanted
-		delta_heading = self.heading_trig
-		delta_pitch = self.pitch_trig
-		base.camera.setHpr(cur_hpr.getX() + delta_heading, cur_hpr.getY() + delta_pitch, 0)
+		dt = globalClock.getDt()
+
+		if self.mode == self.FREE:
+			self._update_free(base, dt)
+		else:
+			positions = self.handler.drone_manager.get_positions()
+			if len(positions) > 0:
+				self._update_follow(base, positions, dt)
 
 		# As its a task, continue with next iteration
 		return task.cont
+
+	def _update_free(self, base, dt):
+		"""
+		Accelerate the camera towards the wanted speed, or damp it without input, and move it accordingly.
+		"""
+		wanted = Vec3(self.right_trig, self.forward_trig, self.up_trig)
+		if wanted.length() > 0:
+			wanted.normalize()
+		wanted *= self.MOVE_SPEED
+		wanted_turn = Vec3(self.heading_trig, self.pitch_trig, 0) * self.TURN_SPEED
+
+		# Idle: nothing pressed and the camera stands still, so do not touch it at all
+		if wanted.length() == 0 and wanted_turn.length() == 0:
+			if self.velocity.length() < self.EPSILON and self.turn_velocity.length() < self.EPSILON:
+				return
+			rate = self.DAMPING
+		else:
+			rate = self.ACCELERATION
+
+		# Approach the wanted speed exponentially, independent of the frame rate
+		blend = 1 - math.exp(-rate * dt)
+		self.velocity += (wanted - self.velocity) * blend
+		self.turn_velocity += (wanted_turn - self.turn_velocity) * blend
+
+		# Movement is relative to the orientation of the camera
+		quat = base.camera.getQuat()
+		delta_pos = quat.getRight() * self.velocity.x + quat.getForward() * self.velocity.y + quat.getUp() * self.velocity.z
+		base.camera.setPos(base.camera.getPos() + delta_pos * dt)
+
+		hpr = base.camera.getHpr()
+		base.camera.setHpr(hpr.x + self.turn_velocity.x * dt, hpr.y + self.turn_velocity.y * dt, 0)
+
+	def _update_follow(self, base, positions, dt):
+		"""
+		Move the camera smoothly to the pose of the current follow mode, if it is not there yet.
+		:param positions: Positions of all drones, shape (N, 3).
+		"""
+		if self.mode == self.FOLLOW:
+			focus = Point3(*positions[self.follow_drone % len(positions)])
+			wanted_pos = focus + self.FOLLOW_OFFSET
+		else:
+			# Bounding sphere of the swarm
+			lower, upper = positions.min(axis=0), positions.max(axis=0)
+			focus = Point3(*((lower + upper) / 2))
+			radius = max(np.linalg.norm(upper - lower) / 2, .5)
+
+			if self.mode == self.FIT:
+				# Back off along the current view direction until the sphere fits into the narrower field of view
+				fov = min(self.perspective_lens.getFov())
+				distance = radius / math.sin(math.radians(fov / 2))
+				wanted_pos = focus - base.camera.getQuat().getForward() * distance
+			else:
+				wanted_pos = focus + Vec3(0, 0, self.TOP_DOWN_HEIGHT)
+				film_size = 2.4 * radius
+				if abs(self.orthographic_lens.getFilmSize().x - film_size) > self.EPSILON:
+					self.orthographic_lens.setFilmSize(film_size, film_size / self.perspective_lens.getAspectRatio())
+
+		# Already there, nothing to do
+		offset = wanted_pos - base.camera.getPos()
+		if offset.length() < self.EPSILON:
+			return
+
+		blend = 1 - math.exp(-self.SMOOTHING * dt)
+		base.camera.setPos(base.camera.getPos() + offset * blend)
+		if self.mode == self.TOP_DOWN:
+			base.camera.setHpr(0, -90, 0)
+		else:
+			base.camera.lookAt(focus)
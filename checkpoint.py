@@ -0,0 +1,175 @@
+# Load  Panda3D modules
+from panda3d.core import LPoint3f
+from panda3d.core import LVector3f
+
+# Load classes from other files
+from mission import CompiledMission
+from rotation import RotationGroup
+from trajectory_planner import Trajectory
+
+# Import needed modules
+import math
+import random
+
+import numpy as np
+
+
+def _concatenate(arrays, shape, dtype=float):
+	"""
+	Concatenate arrays of different lengths, which may be none at all.
+	:param shape: Shape of a single element, needed if there are no arrays.
+	:param dtype: Type of the elements.
+	:return: The concatenated array and the offsets of the single arrays within it (one more than there are arrays).
+	"""
+	offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+	offsets[1:] = np.cumsum([len(array) for array in arrays])
+	if not arrays:
+		return np.zeros((0,) + shape, dtype=dtype), offsets
+	return np.concatenate([np.asarray(array, dtype=dtype).reshape((-1,) + shape) for array in arrays]), offsets
+
+
+class Checkpoint:
+	"""
+	Snapshot of the complete state of the simulated swarm, to pause, resume or fork experiments.
+
+	It contains the drones (positions and velocities of their physics objects, targets, avoidance vectors, flight state
+	and if they are landing), trajectories and missions in progress, rotation groups and the state of the random number generator.
+	Everything is stored as flat arrays, so a snapshot is written to and read from a single .npz file without any
+	pickling. A loaded snapshot can be restored any number of times. Running planning requests are not part of it,
+	the drones hold their targets instead. Which drones arrived is not stored either, the drones arrive anew after
+	restoring, sending their events again.
+	"""
+
+	VERSION = 2  # Version of the layout of the arrays
+
+	def __init__(self, arrays):
+		"""
+		:param arrays: All arrays of the snapshot by their name, as created by capture.
+		"""
+		self.arrays = arrays
+
+	@classmethod
+	def capture(cls, drone_manager):
+		"""
+		Take a snapshot of the current state.
+		:param drone_manager: The drone manager whose swarm is captured.
+		"""
+		drones = drone_manager.drones
+		now = drone_manager.base.clock.time
+
+		# Trajectories have different lengths, so they are stored back to back with their offsets
+		trajectories = [drone.trajectory for drone in drones if drone.trajectory is not None]
+		trajectory_times, _ = _concatenate([trajectory.times for trajectory in trajectories], ())
+		trajectory_positions, _ = _concatenate([trajectory.positions for trajectory in trajectories], (3,))
+		trajectory_lengths = [len(drone.trajectory.times) if drone.trajectory is not None else 0 for drone in drones]
+		trajectory_elapsed = [now - drone.trajectory_start if drone.trajectory is not None else math.nan
+			for drone in drones]
+
+		rotations = drone_manager.rotations
+		groups = list(rotations.groups.values())
+		rotation_members, rotation_offsets = _concatenate([group.members for group in groups], (), np.int64)
+
+		mission = drone_manager.mission
+		rng_version, rng_state, rng_gauss = random.getstate()
+
+		return cls({
+			"version": np.array(cls.VERSION),
+			"positions": drone_manager.get_positions(),
+			"velocities": drone_manager.get_velocities(),
+			"angular_velocities": np.array([drone.drone_node_bullet.getAngularVelocity() for drone in drones]).reshape(-1, 3),
+			"targets": drone_manager.get_targets(),
+			"avoidance_vectors": np.array([drone.avoidance_vector for drone in drones]).reshape(-1, 3),
+			"in_flight": np.array([drone.in_flight for drone in drones], dtype=bool),
+			"landing": np.isin(np.arange(len(drones)), list(drone_manager.landing)),
+			"trajectory_lengths": np.array(trajectory_lengths, dtype=np.int64),
+			"trajectory_elapsed": np.array(trajectory_elapsed),
+			"trajectory_times": trajectory_times,
+			"trajectory_positions": trajectory_positions,
+			"rotation_ids": np.array(list(rotations.groups), dtype=np.int64),
+			"rotation_next_id": np.array(rotations.next_id),
+			"rotation_members": rotation_members,
+			"rotation_offsets": rotation_offsets,
+			"rotation_origins": np.array([group.origin for group in groups]).reshape(-1, 3),
+			"rotation_speeds": np.degrees([group.speed for group in groups]),
+			"rotation_axes": np.array([group.axis for group in groups]).reshape(-1, 3),
+			"mission_setpoints": mission.setpoints if mission is not None else np.zeros((0, len(drones), 3)),
+			"mission_rate": np.array(mission.rate if mission is not None else 0),
+			"mission_elapsed": np.array(now - drone_manager.mission_start),
+			"mission_stream": np.array(drone_manager.mission_stream),
+			"rng_version": np.array(rng_version),
+			"rng_state": np.array(rng_state, dtype=np.uint32),
+			"rng_gauss": np.array(math.nan if rng_gauss is None else rng_gauss)})
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Read a snapshot from a file.
+		:param path: Path of the .npz file.
+		"""
+		with np.load(path, allow_pickle=False) as data:
+			arrays = {name: data[name] for name in data.files}
+
+		if int(arrays["version"]) != cls.VERSION:
+			raise ValueError("Checkpoint {} has version {}, expected {}".format(path, int(arrays["version"]), cls.VERSION))
+		return cls(arrays)
+
+	def save(self, path):
+		"""
+		Write the snapshot into a file, uncompressed so it is read back as fast as possible.
+		:param path: Path of the .npz file.
+		"""
+		with open(path, "wb") as file:
+			np.savez(file, **self.arrays)
+
+	def restore(self, drone_manager):
+		"""
+		Set the swarm back to the state of the snapshot.
+		:param drone_manager: The drone manager whose swarm is restored.
+		"""
+		arrays = self.arrays
+		now = drone_manager.base.clock.time
+
+		# Stop everything in progress, and without drones in flight changing the amount does not plan a transition
+		drone_manager.cancel_plan()
+		drone_manager.stop_mission()
+		drone_manager.stop_rotation()
+		for drone in drone_manager.drones:
+			drone.in_flight = False
+		drone_manager.update_drone_amount(len(arrays["positions"]))
+
+		trajectory_offsets = np.concatenate(([0], np.cumsum(arrays["trajectory_lengths"])))
+		for i, drone in enumerate(drone_manager.drones):
+			drone.set_pos(LPoint3f(*arrays["positions"][i]))
+			drone.drone_node_bullet.clearForces()
+			drone.drone_node_bullet.setLinearVelocity(LVector3f(*arrays["velocities"][i]))
+			drone.drone_node_bullet.setAngularVelocity(LVector3f(*arrays["angular_velocities"][i]))
+			drone.set_target(LPoint3f(*arrays["targets"][i]))
+			drone.avoidance_vector = LVector3f(*arrays["avoidance_vectors"][i])
+			drone.in_flight = bool(arrays["in_flight"][i])
+
+			if not math.isnan(arrays["trajectory_elapsed"][i]):
+				start, end = trajectory_offsets[i], trajectory_offsets[i + 1]
+				drone.follow_trajectory(Trajectory(arrays["trajectory_times"][start:end],
+					arrays["trajectory_positions"][start:end]))
+				drone.trajectory_start = now - arrays["trajectory_elapsed"][i]
+		drone_manager.avoidance_vectors = None
+
+		rotations = drone_manager.rotations
+		offsets = arrays["rotation_offsets"]
+		for number, group_id in enumerate(arrays["rotation_ids"]):
+			rotations.groups[int(group_id)] = RotationGroup(arrays["rotation_members"][offsets[number]:offsets[number + 1]],
+				arrays["rotation_origins"][number], arrays["rotation_speeds"][number], arrays["rotation_axes"][number])
+		rotations.next_id = int(arrays["rotation_next_id"])
+
+		if len(arrays["mission_setpoints"]) > 0:
+			drone_manager.mission = CompiledMission(arrays["mission_setpoints"], float(arrays["mission_rate"]))
+			drone_manager.mission_start = now - float(arrays["mission_elapsed"])
+			drone_manager.mission_stream = bool(arrays["mission_stream"])
+
+		gauss = float(arrays["rng_gauss"])
+		random.setstate((int(arrays["rng_version"]), tuple(int(value) for value in arrays["rng_state"]),
+			None if math.isnan(gauss) else gauss))
+
+		# Landing drones stop flying once they arrived again
+		drone_manager.landing = set(np.flatnonzero(arrays["landing"]).tolist())
+		drone_manager.convergence.reset()
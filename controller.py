@@ -0,0 +1,204 @@
+# Import needed modules
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from spatial_index import neighbour_pairs
+
+
+class SwarmState:
+	"""
+	Batched inputs of a controller for a single tick, all arrays are indexed by the number of the drone.
+	"""
+
+	def __init__(self, positions, velocities, targets, avoidance_vectors, wall_forces, neighbour_radius):
+		self.positions = positions  # (N, 3)
+		self.velocities = velocities  # (N, 3)
+		self.targets = targets  # (N, 3)
+		self.avoidance_vectors = avoidance_vectors  # (N, 3), individual direction of every drone to avoid others
+		self.wall_forces = wall_forces  # (N, 3), forces to stay away from walls, see room_sdf.py
+		self.neighbour_radius = neighbour_radius
+		self._neighbours = None
+
+	@property
+	def neighbours(self):
+		"""
+		All ordered pairs of drones closer to each other than the neighbour radius, only computed when needed.
+		:return: Tuple of index arrays (i, j).
+		"""
+		if self._neighbours is None:
+			self._neighbours = neighbour_pairs(self.positions, self.neighbour_radius)
+		return self._neighbours
+
+
+class Controller:
+	"""
+	Interface of a controller computing the forces of the whole swarm at once, once every tick.
+	To try another control law, subclass this and set it as controller of the drone manager.
+	"""
+
+	def compute(self, state):
+		"""
+		Compute the force to apply to every drone.
+		:param state: The SwarmState of the current tick.
+		:return: Array of forces with shape (N, 3).
+		"""
+		raise NotImplementedError
+
+
+class DefaultController(Controller):
+	"""
+	The control law of the drones (see Drone.update), computed for all drones at once.
+	Every parameter is either a single value for all drones or an array with one value per drone, e.g. to compare
+	parameters side by side (see batch_env.py).
+	"""
+
+	def __init__(self, target_multiplier, target_radius, avoidance_multiplier, avoidance_radius):
+		"""
+		:param target_multiplier: Influence of the force to get to the target.
+		:param target_radius: Drones slow down within this distance to their target.
+		:param avoidance_multiplier: Influence of the force to avoid collisions.
+		:param avoidance_radius: Distance when an avoidance manoeuvre has to be done.
+		"""
+		self.target_multiplier = target_multiplier
+		self.target_radius = target_radius
+		self.avoidance_multiplier = avoidance_multiplier
+		self.avoidance_radius = avoidance_radius
+
+	@classmethod
+	def from_drone(cls, drone_class):
+		"""
+		Create the controller with the constants of the drone class.
+		"""
+		return cls(drone_class.TARGET_FORCE_MULTIPLIER, drone_class.TARGET_PROXIMITY_RADIUS,
+			drone_class.AVOIDANCE_FORCE_MULTIPLIER, drone_class.AVOIDANCE_PROXIMITY_RADIUS)
+
+	def compute(self, state):
+		# Force to the target, normalised unless in close proximity of the target
+		distances = state.targets - state.positions
+		lengths = np.linalg.norm(distances, axis=1, keepdims=True)
+		forces = np.where(lengths > _per_drone(self.target_radius), distances / np.maximum(lengths, 1e-9), distances)
+		forces *= _per_drone(self.target_multiplier)
+
+		# Forces to avoid all neighbours
+		i, j = state.neighbours
+		if len(i) > 0:
+			opponent_vectors = state.positions[j] - state.positions[i]
+			opponent_lengths = np.linalg.norm(opponent_vectors, axis=1, keepdims=True)
+			multipliers = _per_drone(self.avoidance_radius, i) - opponent_lengths
+			directions = state.avoidance_vectors[i] * 2 - opponent_vectors / np.maximum(opponent_lengths, 1e-9) * 10
+			directions /= np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-9)
+			np.add.at(forces, i, directions * multipliers * _per_drone(self.avoidance_multiplier, i))
+
+		forces += state.wall_forces
+
+		# Normalise large forces to retain small movements only
+		lengths = np.linalg.norm(forces, axis=1, keepdims=True)
+		return np.where(lengths > 2, forces / np.maximum(lengths, 1e-9), forces)
+
+
+def _per_drone(value, indices=slice(None)):
+	"""
+	Get a parameter of a controller for the given drones, as column to multiply rows of vectors with.
+	:param value: Single value or array with one value per drone.
+	:param indices: Drones to get the value of, all by default.
+	"""
+	if np.ndim(value) == 0:
+		return value
+	return np.asarray(value)[indices, None]
+
+
+# Arrays exchanged with a controller process, in this order
+_PROCESS_ARRAYS = ("positions", "velocities", "targets", "avoidance_vectors", "wall_forces", "forces")
+
+
+def _process_views(buffer, capacity):
+	"""
+	Create the numpy views of all exchanged arrays on the shared memory.
+	"""
+	size = capacity * 3
+	return {name: np.ndarray((capacity, 3), dtype=np.float64, buffer=buffer, offset=number * size * 8)
+		for number, name in enumerate(_PROCESS_ARRAYS)}
+
+
+def _run_controller_process(controller, memory_name, capacity, neighbour_radius, connection):
+	"""
+	Main function of a controller process: computes the forces whenever the amount of drones is received.
+	"""
+	memory = shared_memory.SharedMemory(name=memory_name)
+	views = _process_views(memory.buf, capacity)
+
+	while True:
+		amount = connection.recv()
+		if amount is None:
+			break
+		state = SwarmState(*(views[name][:amount] for name in _PROCESS_ARRAYS[:-1]), neighbour_radius)
+		views["forces"][:amount] = controller.compute(state)
+		connection.send(True)
+
+	views = None
+	memory.close()
+
+
+class ProcessController(Controller):
+	"""
+	Runs another controller in a separate process, exchanging the arrays through shared memory.
+	The simulation waits for the forces at most a timeout per tick and keeps the former forces if they are late.
+	"""
+
+	CAPACITY = 4096  # Maximum amount of drones
+	TIMEOUT = .05  # Seconds to wait for the forces of the controller
+
+	def __init__(self, controller, neighbour_radius, capacity=CAPACITY, timeout=TIMEOUT):
+		"""
+		Start the controller process.
+		:param controller: The controller to run, has to be picklable.
+		:param neighbour_radius: Radius to find the neighbours of a drone within, as in SwarmState.
+		:param capacity: Maximum amount of drones.
+		:param timeout: Seconds to wait for the forces every tick.
+		"""
+		self.capacity = capacity
+		self.timeout = timeout
+		self.memory = shared_memory.SharedMemory(create=True, size=len(_PROCESS_ARRAYS) * capacity * 3 * 8)
+		self.views = _process_views(self.memory.buf, capacity)
+		self.waiting = False  # If the process is still computing the forces of a former tick
+
+		context = multiprocessing.get_context("spawn")
+		self.connection, child_connection = context.Pipe()
+		self.process = context.Process(target=_run_controller_process, daemon=True,
+			args=(controller, self.memory.name, capacity, neighbour_radius, child_connection))
+		self.process.start()
+
+	def compute(self, state):
+		amount = len(state.positions)
+		if amount > self.capacity:
+			raise ValueError("Controller process only handles {} drones".format(self.capacity))
+
+		# Only hand out a new tick once the former one is done
+		if self.waiting and self.connection.poll(0):
+			self.connection.recv()
+			self.waiting = False
+
+		if not self.waiting:
+			for name in _PROCESS_ARRAYS[:-1]:
+				self.views[name][:amount] = getattr(state, name)
+			self.connection.send(amount)
+			self.waiting = True
+
+			if self.connection.poll(self.timeout):
+				self.connection.recv()
+				self.waiting = False
+
+		return self.views["forces"][:amount].copy()
+
+	def close(self):
+		"""
+		Stop the controller process and release the shared memory.
+		"""
+		if self.process.is_alive():
+			self.connection.send(None)
+			self.process.join(1)
+		self.views = None
+		self.memory.close()
+		self.memory.unlink()
@@ -0,0 +1,90 @@
+# Import needed modules
+import numpy as np
+
+
+class ConvergenceTracker:
+	"""
+	Detects when the drones reached their targets, checked for all drones at once every update.
+
+	A drone has arrived once it stayed close to its target, nearly stopped and with a target not moving for a short
+	while, so drones overshooting their target or following a trajectory, rotation or mission do not count. Arrivals are
+	sent as Panda3D events, which can be accepted like any other event or awaited with messenger.future in coroutine
+	tasks:
+	- ARRIVED_EVENT with the number of the drone, once a drone arrived
+	- FORMATION_EVENT, once all drones arrived
+	Both are only sent when the state changes. Drones added by a change of the amount of drones (all drones in the first
+	update) have not arrived yet, so they send their events once they settled like any other drone.
+	"""
+
+	POSITION_TOLERANCE = .05  # Maximum distance to the target
+	VELOCITY_TOLERANCE = .05  # Maximum speed
+	TARGET_TOLERANCE = 1e-4  # Targets moving less than this in an update count as standing still
+	SETTLE_TIME = .3  # Seconds a drone has to stay within the tolerances to arrive
+
+	ARRIVED_EVENT = "droneArrived"  # Sent with the number of the drone
+	FORMATION_EVENT = "formationReached"  # Sent once all drones arrived
+
+	def __init__(self, messenger):
+		"""
+		:param messenger: Messenger of the simulation, to send the events.
+		"""
+		self.messenger = messenger
+		self.last_targets = None  # Targets of the last update
+		self.settled = np.zeros(0)  # Seconds every drone is within the tolerances
+		self.arrived = np.zeros(0, dtype=bool)
+		self.formation_reached = False
+
+	def reset(self, drones=None):
+		"""
+		Forget that drones arrived, so their arrival is sent again, e.g. for targets the same as before.
+		:param drones: Numbers of the drones to reset, None resets all drones.
+		"""
+		if drones is None:
+			drones = slice(None)
+		self.settled[drones] = 0
+		self.arrived[drones] = False
+		self.formation_reached = bool(self.arrived.all()) and len(self.arrived) > 0
+
+	def update(self, positions, velocities, targets, dt):
+		"""
+		Check which drones arrived and send the events of this update.
+		:param positions: Positions of all drones, shape (N, 3).
+		:param velocities: Velocities of all drones, shape (N, 3).
+		:param targets: Targets of all drones, shape (N, 3).
+		:param dt: Time since the last update.
+		"""
+		within = np.linalg.norm(positions - targets, axis=1) < self.POSITION_TOLERANCE
+		within &= np.linalg.norm(velocities, axis=1) < self.VELOCITY_TOLERANCE
+
+		if self.last_targets is None or len(self.last_targets) != len(targets):
+			self._resize(targets)
+
+		within &= np.linalg.norm(targets - self.last_targets, axis=1) < self.TARGET_TOLERANCE
+		self.last_targets = targets
+		self.settled = np.where(within, self.settled + dt, 0)
+
+		arrived = self.settled >= self.SETTLE_TIME
+		newly_arrived = np.flatnonzero(arrived & ~self.arrived)
+		self.arrived = arrived
+		for number in newly_arrived:
+			self.messenger.send(self.ARRIVED_EVENT, [int(number)])
+
+		formation_reached = bool(arrived.all())
+		if formation_reached and not self.formation_reached:
+			self.messenger.send(self.FORMATION_EVENT)
+		self.formation_reached = formation_reached
+
+	def _resize(self, targets):
+		"""
+		Follow a change of the amount of drones, the drones kept keep their state and new drones have not arrived.
+		:param targets: Targets of all drones of this update.
+		"""
+		last_targets = targets.copy()
+		settled = np.zeros(len(targets))
+		arrived = np.zeros(len(targets), dtype=bool)
+		if self.last_targets is not None:
+			kept = min(len(self.last_targets), len(targets))
+			last_targets[:kept] = self.last_targets[:kept]
+			settled[:kept] = self.settled[:kept]
+			arrived[:kept] = self.arrived[:kept]
+		self.last_targets, self.settled, self.arrived = last_targets, settled, arrived
@@ -2,10 +2,12 @@
 from panda3d.bullet import BulletSphereShape
 from panda3d.bullet import BulletRigidBodyNode
 from panda3d.core import LPoint3f
-from panda3d.core import TextNode
 from panda3d.core import LVector3f
 from panda3d.core import LineSegs
 
+# Load classes from other files
+from point_mass import PointMassWorld
+
 # Import needed modules
 import random
 
@@ -27,6 +29,8 @@ class Drone:
 	LINEAR_DAMPING = 0.95
 	LINEAR_SLEEP_THRESHOLD = 0
 
+	MODEL_PATH = "models/drones/drone_florian.egg"  # Model of the drone, loaded through the model cache of the simulation
+
 	def __init__(self, manager, number):
 		"""
 		Initialises the drone as a bullet and panda object.
@@ -38,50 +42,62 @@ class Drone:
 		self.debug = False  # If debugging info should be given
 		self.in_flight = False  # If currently in flight
 		self.number = number  # Number of drone in list
+		self.direct_setpoint = None  # Setpoint sent to the real drone instead of the simulated position, e.g. by a mission
 
 		# Every drone has its own vector to follow if an avoidance manouver has to be done
-		self.avoidance_vector = LVector3f(random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(-1, 1)).normalize()
-
-		# Create bullet rigid body for drone
-		drone_collision_shape = BulletSphereShape(self.COLLISION_SPHERE_RADIUS)
-		self.drone_node_bullet = BulletRigidBodyNode("RigidSphere")
-		self.drone_node_bullet.addShape(drone_collision_shape)
-		self.drone_node_bullet.setMass(self.RIGID_BODY_MASS)
+		self.avoidance_vector = LVector3f(random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(-1, 1)).normalized()
+
+		# The physics object is either a Bullet rigid body or a point mass of the whole swarm (see point_mass.py), both
+		# are used through the same methods
+		self.point_mass = isinstance(self.base.world, PointMassWorld)
+		if self.point_mass:
+			self.drone_node_panda = self.base.render.attachNewNode("PointMass")
+			self.drone_node_bullet = self.base.world.attach(self.drone_node_panda, self.RIGID_BODY_MASS,
+				self.COLLISION_SPHERE_RADIUS, self.LINEAR_DAMPING)
+		else:
+			# Create bullet rigid body for drone
+			drone_collision_shape = BulletSphereShape(self.COLLISION_SPHERE_RADIUS)
+			self.drone_node_bullet = BulletRigidBodyNode("RigidSphere")
+			self.drone_node_bullet.addShape(drone_collision_shape)
+			self.drone_node_bullet.setMass(self.RIGID_BODY_MASS)
 
-		# Set some values for the physics object
-		self.drone_node_bullet.setLinearSleepThreshold(self.LINEAR_SLEEP_THRESHOLD)
-		self.drone_node_bullet.setFriction(self.FRICTION)
-		self.drone_node_bullet.setLinearDamping(self.LINEAR_DAMPING)
+			# Set some values for the physics object
+			self.drone_node_bullet.setLinearSleepThreshold(self.LINEAR_SLEEP_THRESHOLD)
+			self.drone_node_bullet.setFriction(self.FRICTION)
+			self.drone_node_bullet.setLinearDamping(self.LINEAR_DAMPING)
 
-		# Attach to the simulation
-		self.drone_node_panda = self.base.render.attachNewNode(self.drone_node_bullet)
+			# Attach to the simulation
+			self.drone_node_panda = self.base.render.attachNewNode(self.drone_node_bullet)
 
-		# ...and physics engine
-		self.base.world.attachRigidBody(self.drone_node_bullet)
+			# ...and physics engine
+			self.base.world.attachRigidBody(self.drone_node_bullet)
 
 		# Add a model to the drone to be actually seen in the simulation
-		drone_model = self.base.loader.loadModel("models/drones/drone_florian.egg")
-		drone_model.setScale(0.2)
-		drone_model.reparentTo(self.drone_node_panda)
+		self.drone_model = self.base.model_cache.load(self.MODEL_PATH)
+		self.drone_model.setScale(0.2)
+		self.drone_model.reparentTo(self.drone_node_panda)
 
 		# Set the position and target position to their default (origin)
 		default_position = LPoint3f(0, 0, 0)
-		self.drone_node_panda.setPos(default_position)
+		self.set_pos(default_position)
 		self.target_position = default_position
 
+		# Trajectory to follow instead of flying straight to the target, if one was planned
+		self.trajectory = None
+		self.trajectory_start = 0  # Simulated time the trajectory was started at
+
 		# Create a line renderer to draw a line from center to target point
 		self.line_creator = LineSegs()
 		# Then draw a default line so that the update function works as expected (with the removal)
 		self.target_line_node = self.base.render.attachNewNode(self.line_creator.create(False))
 
-		# Create node for text
-		self.drone_text_node_panda = None
-
 	def get_pos(self) -> LPoint3f:
 		"""
 		Get the position of the drone.
 		:return: Position of the drone as an LPoint3 object
 		"""
+		if self.point_mass:
+			return self.drone_node_bullet.getPos()  # The node only follows the point mass for rendered frames
 		return self.drone_node_panda.getPos()
 
 	def set_pos(self, position: LPoint3f):
@@ -90,7 +106,17 @@ class Drone:
 		This directly sets the drone to that position, without any transition or flight.
 		:param position: The position the drone is supposed to be at.
 		"""
-		self.drone_node_panda.setPos(position)
+		if self.point_mass:
+			self.drone_node_bullet.setPos(position)
+		else:
+			self.drone_node_panda.setPos(position)
+
+	def get_velocity(self) -> LVector3f:
+		"""
+		Get the linear velocity of the drone.
+		:return: Velocity of the physics object as an LVector3 object
+		"""
+		return self.drone_node_bullet.getLinearVelocity()
 
 	def get_target(self) -> LPoint3f:
 		"""
@@ -102,9 +128,20 @@ class Drone:
 	def set_target(self, position: LPoint3f):
 		"""
 		Set the target position of the drone.
+		This cancels the trajectory the drone is currently following, if any.
 		:param position: The target position to be set.
 		"""
+		self.trajectory = None
 		self.target_position = position
+		self.manager.targets_changed = True
+
+	def follow_trajectory(self, trajectory):
+		"""
+		Let the drone follow a planned trajectory, starting right now.
+		:param trajectory: The trajectory to follow, see trajectory_planner.py.
+		"""
+		self.trajectory = trajectory
+		self.trajectory_start = self.base.clock.time
 
 	def set_debug(self, active):
 		"""
@@ -116,35 +153,70 @@ class Drone:
 		if active:
 			# Create a line so the updater can update it
 			self.target_line_node = self.base.render.attachNewNode(self.line_creator.create(False))
-			# Write address of drone above model
-			self._draw_cf_name(True)
 		else:
 			self.target_line_node.removeNode()
-			self._draw_cf_name(False)
 
 	def update(self):
 		"""
 		Update the drone and its forces.
 		"""
-		# Update the force needed to get to the target
-		self._update_target_force()
+		# Move the target along the trajectory, if following one
+		if self.trajectory is not None:
+			self._update_trajectory_target()
 
-		# Update the force needed to avoid other drones, if any
-		self._update_avoidance_force()
+		if self.manager.controller is None and not self.manager.partitioned:
+			# Update the force needed to get to the target
+			self._update_target_force()
 
-		# Combine all acting forces and normalize them to one acting force
-		self._combine_forces()
+			# Update the force needed to avoid other drones, if any
+			self._update_avoidance_force()
+
+			# Update the force needed to stay away from walls, if any
+			self._update_wall_force()
+
+			# Combine all acting forces and normalize them to one acting force
+			self._combine_forces()
+		elif not self.point_mass:
+			# The controller of the manager already computed the forces of all drones, point masses get them all at once
+			# and the workers of a partitioned world compute them on their own
+			controller_force = self.manager.controller_forces[self.number]
+			self.drone_node_bullet.applyCentralForce(LVector3f(*controller_force))
 
 		# Update the line drawn to the current target
 		if self.debug:
 			self._draw_target_line()
 
-		# Update real drone if connected to one
-		if self.crazyflie is not None and self.in_flight:
-			current_pos = self.get_pos()
-			self.crazyflie.cf.commander.send_position_setpoint(current_pos.y, -current_pos.x, current_pos.z, 0)
+		# Update real drone if connected to one, with the setpoint checked by the safety monitor of the manager
+		if self.crazyflie is not None and self.in_flight and self.manager.setpoints_due:
+			self._send_setpoint()
 			# print("Update!")
 
+	def _send_setpoint(self):
+		"""
+		Send the current setpoint of the manager to the real drone (whose axes are rotated against the simulation).
+		"""
+		current_pos = LPoint3f(*self.manager.setpoints[self.number])
+		commander = self.crazyflie.cf.commander
+
+		if self.manager.setpoint_mode == self.manager.FULL_STATE_SETPOINTS:
+			# The velocity is a feedforward for the controller of the drone, so it does not lag behind between packets
+			velocity = LVector3f(*self.manager.setpoint_velocities[self.number])
+			commander.send_full_state_setpoint((current_pos.y, -current_pos.x, current_pos.z),
+				(velocity.y, -velocity.x, velocity.z), (0, 0, 0), (0, 0, 0, 1), 0, 0, 0)
+		else:
+			commander.send_position_setpoint(current_pos.y, -current_pos.x, current_pos.z, 0)
+
+	def _update_trajectory_target(self):
+		"""
+		Set the target to the current setpoint of the trajectory, the trajectory is done once its end is reached.
+		"""
+		elapsed = self.base.clock.time - self.trajectory_start
+		self.target_position = LPoint3f(*self.trajectory.sample(elapsed))
+		self.manager.targets_changed = True
+
+		if elapsed >= self.trajectory.duration:
+			self.trajectory = None
+
 	def _update_target_force(self):
 		"""
 		Calculates force needed to get to the target and applies it.
@@ -154,7 +226,7 @@ class Drone:
 		# Normalise distance to get an average force for all drones, unless in close proximity of target,
 		# then slowing down is encouraged and the normalisation is no longer needed
 		# If normalisation would always take place overshoots would occur
-		if distance > self.TARGET_PROXIMITY_RADIUS:
+		if distance.length() > self.TARGET_PROXIMITY_RADIUS:
 			distance = distance.normalized()
 
 		# Apply to drone (with force multiplier in mind)
@@ -167,7 +239,7 @@ class Drone:
 		# Save all drones in near proximity with their distance
 		near = []
 		for drone in self.manager.drones:
-			distance = len(drone.get_pos() - self.get_pos())
+			distance = (drone.get_pos() - self.get_pos()).length()
 			if 0 < distance < self.AVOIDANCE_PROXIMITY_RADIUS:  # Check dist > 0 to prevent drone from detecting itself
 				near.append(drone)
 
@@ -176,13 +248,20 @@ class Drone:
 			# Vector to other drone
 			opponent_vector = opponent.get_pos() - self.get_pos()
 			# Multiplier to maximise force when opponent gets closer
-			multiplier = self.AVOIDANCE_PROXIMITY_RADIUS - len(opponent_vector)
+			multiplier = self.AVOIDANCE_PROXIMITY_RADIUS - opponent_vector.length()
 			# Calculate a direction follow (multipliers found by testing)
 			avoidance_direction = self.avoidance_vector * 2 - opponent_vector.normalized() * 10
 			avoidance_direction.normalize()
 			# Apply avoidance force
 			self.drone_node_bullet.applyCentralForce(avoidance_direction * multiplier * self.AVOIDANCE_FORCE_MULTIPLIER)
 
+	def _update_wall_force(self):
+		"""
+		Applies the force to stay away from walls, as looked up by the manager for all drones at once.
+		"""
+		wall_force = self.manager.wall_forces[self.number]
+		self.drone_node_bullet.applyCentralForce(LVector3f(*wall_force))
+
 	def _combine_forces(self):
 		"""
 		Combine all acting forces to one normalised force.
@@ -198,10 +277,11 @@ class Drone:
 		Detach drone from the simulation and physics engine, then destroy object.
 		"""
 		self.drone_node_panda.removeNode()
-		self.base.world.removeRigidBody(self.drone_node_bullet)
+		if self.point_mass:
+			self.base.world.remove(self.drone_node_bullet)
+		else:
+			self.base.world.removeRigidBody(self.drone_node_bullet)
 		self.target_line_node.removeNode()
-		if self.debug:
-			self.drone_text_node_panda.removeNode()
 
 	def _draw_target_line(self):
 		"""
@@ -218,21 +298,3 @@ class Drone:
 
 		# And attach it to the renderer
 		self.target_line_node = self.base.render.attachNewNode(line)
-
-	def _draw_cf_name(self, draw):
-		"""
-		Show the address of the connected Craziefly, if there is one, above the model.
-		"""
-		if draw:
-			address = 'Not connected'
-			if self.crazyflie is not None:
-				address = self.crazyflie.cf.link_uri
-
-			text = TextNode('droneInfo')
-			text.setText(str(self.number) + '\n' + address)
-			text.setAlign(TextNode.ACenter)
-			self.drone_text_node_panda = self.base.render.attachNewNode(text)
-			self.drone_text_node_panda.setScale(.1)
-			self.drone_text_node_panda.setPos(self.drone_node_panda, 0, 0, .3)
-		else:
-			self.drone_text_node_panda.removeNode()
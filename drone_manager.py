@@ -3,18 +3,36 @@ from direct.showbase import DirectObject
 from panda3d.core import LPoint3f
 from panda3d.core import LVector3f
 
-# Load Crazyflie modules
-from cflib.crazyflie import Crazyflie
-from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
-
 # Load classes from other files
 from drone import Drone
+from room_sdf import RoomSDF
+from obstacles import Obstacles
+from trajectory_planner import TrajectoryPlanner
+from mission import Mission
+from rotation import RotationEngine
+from selection import SelectionManager
+import state_export
+from controller import SwarmState
+from controller import DefaultController
+from label_layer import LabelLayer
+from checkpoint import Checkpoint
+from safety_monitor import SafetyMonitor
+from convergence import ConvergenceTracker
+from sim_clock import SimClock
+from swarm_metrics import SwarmMetrics
+from point_mass import PointMassWorld
+from partitioned_world import PartitionedWorld
+import reality_manager
 
 # Import needed modules
+import numpy as np
 import csv
-import random
 import math
+import os
+import random
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 
 def load_formation(name):
@@ -35,45 +53,148 @@ def load_formation(name):
 	return formation
 
 
-def rotate_z(origin, point, angle):
-	"""
-	Rotate a point counterclockwise by a given angle around a given origin.
-	Idea: https://stackoverflow.com/questions/34372480/rotate-point-about-another-point-in-degrees-python
-	:param origin: Tuple describing the origin of the rotation
-	:param point: Point to rotate
-	:param angle: Angle to rotate in degrees
-	:return: Rotated point
-	"""
-	angle = math.radians(angle)
-
-	ox, oy = origin
-	px, py = point.x, point.y
-
-	qx = ox + math.cos(angle) * (px - ox) - math.sin(angle) * (py - oy)
-	qy = oy + math.sin(angle) * (px - ox) + math.cos(angle) * (py - oy)
-	return LPoint3f(qx, qy, point.z)
-
-
 class DroneManager(DirectObject.DirectObject):
 	"""
 	This class stores the simulated drones and handles all interaction with them.
 	"""
 
-	ROOM_SIZE = LVector3f(3.4, 4.56, 2.56)  # needed to calculate random positions
 	TAKEOFF_HEIGHT = 1  # Default height where drones should fly to
+	GRID_SPACING = .7  # Distance between the drones of the default formation if there is no file for their amount,
+	# larger than the avoidance radius of the drones so they do not keep pushing each other out of the grid
+	PLAN_FORMATIONS = True  # If formation transitions in flight should follow planned collision-free trajectories
+	PLACEMENT_ROUNDS = 100  # Rounds of drawing random targets before giving up, e.g. if obstacles fill the room
+
+	# Kinds of setpoints sent to the real drones
+	POSITION_SETPOINTS = "position"  # Position only, sent every update
+	FULL_STATE_SETPOINTS = "full_state"  # Position and velocity as feedforward, sent at a lower fixed rate
+	FULL_STATE_RATE = 20  # Full state setpoints sent per second
 
 	def __init__(self, base):
 		super().__init__()
 		self.base = base  # To talk to the simulation
+		self.point_masses = isinstance(base.world, PointMassWorld)  # If the drones are point masses of the world
+		self.partitioned = isinstance(base.world, PartitionedWorld)  # If the workers of the world compute the forces
 		self.drones = []  # List of drones in simulation
+		self.selection = SelectionManager(self)  # Named groups and selections of drones to command
+		self.labels = LabelLayer(base, self)  # Labels above the drones in debug mode
+		self.state_exporter = None  # Publishes the state to shared memory every update if set, see state_export.py
+		self.room_sdf = RoomSDF(base.scene)  # Distance field of the room to avoid walls
+		self.wall_forces = np.zeros((0, 3))  # Forces to avoid walls, calculated for all drones at once every update
+		self.obstacles = None  # Static obstacles within the room, see obstacles.py
+		self.obstacle_node = None  # Node of the obstacles in the scene and physics engine
+		self.safety_monitor = SafetyMonitor.from_room(self.room_sdf)  # Checks setpoints before they are sent
+		self.setpoints = np.zeros((0, 3))  # Checked setpoints of all drones, sent to the real drones
+		self.swarm_link = None  # Links to the real drones, see swarm_link.py
+		self.convergence = ConvergenceTracker(base.messenger)  # Sends events once drones reached their targets
+		self.landing = set()  # Numbers of the landing drones, they stop flying once they arrived
+		self.metrics = SwarmMetrics(Drone.AVOIDANCE_PROXIMITY_RADIUS)  # Quality of the flight of the swarm
+		self.setpoint_velocities = np.zeros((0, 3))  # Velocities belonging to the setpoints
+		self.setpoint_mode = self.POSITION_SETPOINTS
+		self.setpoint_rate = self.FULL_STATE_RATE
+		self.setpoints_due = False  # If the drones send their setpoints in this update
+		self.setpoint_timer = 0  # Time since the last setpoints were sent
+
+		# Controller computing the forces of all drones at once instead of every drone on its own, see controller.py
+		# Point masses get the control law of the drones for all drones at once by default, large swarms are what they
+		# are used for and every drone on its own would look at all other drones
+		self.controller = DefaultController.from_drone(Drone) if self.point_masses and not self.partitioned else None
+		self.controller_forces = np.zeros((0, 3))  # Forces computed by the controller, applied by the drones
+
+		# Targets and avoidance vectors of all drones, only gathered from the drones again once they changed
+		self.targets = np.zeros((0, 3))
+		self.targets_changed = True  # Set by the drones whenever they change their target
+		self.avoidance_vectors = None  # Gathered once for every amount of drones
+
+		# Planner for formation transitions, it runs in a separate process so the simulation keeps running meanwhile
+		self.planner = TrajectoryPlanner.from_room(self.room_sdf)
+		self.planner_executor = None  # Created with the first planning request
+		self.plan_future = None  # Result of the currently running planning request
+		self.plan_goals = []  # Positions in the formation of the currently running planning request
+		self.plan_submitted = 0  # Time the current planning request was submitted at
+		self.planning_metrics = []  # (Amount of drones, planning time, time until applied) for every planning request
+
+		# Constant rotations of groups of drones, applied all at once every update
+		self.rotations = RotationEngine()
+
+		# Currently played mission, see mission.py
+		self.mission = None
+		self.mission_start = 0  # Simulated time the mission was started at
+		self.mission_stream = False  # If the setpoints of the mission are sent straight to the real drones
 		self.update_drone_amount(3)  # Start of with 3 drones
+		self.accept(ConvergenceTracker.ARRIVED_EVENT, self._drone_arrived)
+		self.accept(SimClock.CHANGED_EVENT, self._clock_changed)
 
 		def update_drones_task(task):
 			"""
 			Update every drone in the simulation.
 			"""
-			for drone in self.drones:
+			# Nothing changes while the clock of the simulation is paused
+			dt = self.base.clock.dt
+			if dt == 0:
+				return task.cont
+
+			# Hand planned trajectories to the drones as soon as the planner is done, when not at real time the plan is
+			# waited for so the simulated time it is applied at does not depend on how long planning took
+			if self.plan_future is not None and (self.plan_future.done() or not self.base.clock.real_time):
+				self._apply_plan()
+
+			# Rotate the targets of all drones in rotation groups
+			if self.rotations.groups:
+				self._update_rotations(dt)
+
+			# Set the targets of all drones to the current tick of the mission
+			if self.mission is not None:
+				self._update_mission()
+
+			# Look up the wall forces for all drones at once, the drones apply them themselves
+			positions = self.get_positions()
+			self.wall_forces = self.room_sdf.repulsion(positions)
+			if self.obstacles is not None:
+				self.wall_forces += self.obstacles.repulsion(positions)
+
+			# Let the controller compute all forces in one pass, partitioned worlds compute them within their workers
+			if self.partitioned:
+				self.base.world.set_inputs(self.get_targets(), self.get_avoidance_vectors(), self.wall_forces)
+			elif self.controller is not None:
+				self._update_controller(positions)
+
+			# Point masses get their forces all at once, so only drones following a trajectory, drawing their target
+			# line or linked to a real drone have anything to do on their own
+			if self.point_masses:
+				active = [drone for drone in self.drones if drone.trajectory is not None or drone.debug or
+					drone.crazyflie is not None]
+			else:
+				active = self.drones
+
+			# Check the setpoints of all real drones at once before they are sent, only at real time the real drones can
+			# follow the simulation
+			flying = any(drone.crazyflie is not None and drone.in_flight for drone in active)
+			if flying and self.base.clock.real_time:
+				self._update_setpoints(positions, dt)
+			else:
+				# Drones paused by the clock keep the last setpoint they were sent, so once back at real time the speed
+				# limit moves them on from there
+				if not flying:
+					self.safety_monitor.reset()
+				self.setpoints_due = False
+
+			for drone in active:
 				drone.update()
+
+			# Targets following trajectories were moved by the drones, while a transition is planned the drones only
+			# hold their targets, so they have not arrived anywhere yet
+			targets = self.get_targets()
+			if self.plan_future is None:
+				self.convergence.update(positions, self.get_velocities(), targets, dt)
+
+			# Measure the swarm with the forces the drones apply until the next update
+			arrived = self.convergence.arrived
+			self.metrics.update(self.base.clock.time, positions, targets, self.get_forces(), arrived, dt)
+
+			# Publish the state for other processes
+			if self.state_exporter is not None:
+				self._export_state(self.base.clock.time)
+
 			return task.cont
 
 		# Add task to update all drones
@@ -94,46 +215,242 @@ class DroneManager(DirectObject.DirectObject):
 				number = len(self.drones)
 				self.drones.append(Drone(self, number))
 
-		# Update their targets to the default formation
+		self.targets_changed = True
+		self.avoidance_vectors = None
+
+		# Update their targets to the default formation, right away as the drones are put there anyway, a running plan is
+		# for the former amount of drones
 		# As to not reach into the ground: height = size of collision bounds
+		self.cancel_plan()
+		self.stop_mission()
 		if len(self.drones) > 0:
-			self.default_formation(self.drones[0].COLLISION_SPHERE_RADIUS)
+			for drone, position in zip(self.drones, self._default_positions(self.drones[0].COLLISION_SPHERE_RADIUS)):
+				drone.set_target(position)
 
 		# Set them into their default formation
 		for drone in self.drones:
 			drone.set_pos(drone.get_target())
 
+	def get_positions(self):
+		"""
+		Get the positions of all drones at once.
+		:return: Array of positions with shape (N, 3).
+		"""
+		# The rows of the point masses are in the order of the drones
+		if self.point_masses:
+			return self.base.world.positions.copy()
+
+		positions = np.empty((len(self.drones), 3))
+		for i, drone in enumerate(self.drones):
+			positions[i] = drone.get_pos()
+		return positions
+
+	def get_targets(self):
+		"""
+		Get the targets of all drones at once.
+		:return: Array of targets with shape (N, 3).
+		"""
+		# Going through tuples is a lot faster than converting the Panda3D vectors one by one
+		if self.targets_changed:
+			self.targets = np.array([(target.x, target.y, target.z) for target in
+				(drone.get_target() for drone in self.drones)], dtype=float).reshape(-1, 3)
+			self.targets_changed = False
+		return self.targets.copy()
+
+	def get_avoidance_vectors(self):
+		"""
+		Get the avoidance vectors of all drones at once.
+		:return: Array of avoidance vectors with shape (N, 3).
+		"""
+		if self.avoidance_vectors is None:
+			self.avoidance_vectors = np.array([(vector.x, vector.y, vector.z) for vector in
+				(drone.avoidance_vector for drone in self.drones)], dtype=float).reshape(-1, 3)
+		return self.avoidance_vectors.copy()
+
+	def _update_controller(self, positions):
+		"""
+		Hand the batched state of the swarm to the controller and store the forces it computed.
+		:param positions: Positions of all drones of this update.
+		"""
+		state = SwarmState(positions, self.get_velocities(), self.get_targets(), self.get_avoidance_vectors(),
+			self.wall_forces, Drone.AVOIDANCE_PROXIMITY_RADIUS)
+		self.controller_forces = self.controller.compute(state)
+		if self.point_masses:
+			self.base.world.forces += self.controller_forces
+
+	def _update_setpoints(self, positions, dt):
+		"""
+		Let the safety monitor check the setpoints for the real drones and stop the drones in danger.
+		:param positions: Positions of all drones of this update.
+		:param dt: Time since the last update.
+		"""
+		setpoints = positions.copy()
+		for i, drone in enumerate(self.drones):
+			if drone.direct_setpoint is not None:
+				setpoints[i] = drone.direct_setpoint
+
+		self.setpoints, stop = self.safety_monitor.check(setpoints, dt)
+		if len(stop) > 0:
+			self.stop_rotors(stop)
+
+		# Position setpoints are sent every update, full state setpoints at their own rate
+		if self.setpoint_mode == self.FULL_STATE_SETPOINTS:
+			self.setpoint_timer += dt
+			self.setpoints_due = self.setpoint_timer >= 1 / self.setpoint_rate
+			if self.setpoints_due:
+				self.setpoint_timer = min(self.setpoint_timer - 1 / self.setpoint_rate, 1 / self.setpoint_rate)
+				self._update_setpoint_velocities()
+		else:
+			self.setpoints_due = True
+
+	def _update_setpoint_velocities(self):
+		"""
+		Get the velocities belonging to the checked setpoints, to be sent as feedforward.
+		These are the movements of the setpoints themselves, not of the physics objects, so they agree with the positions
+		sent: they stop at the walls the setpoints are clamped to, stay within the speed limit and are zero for drones
+		holding their setpoint.
+		"""
+		self.setpoint_velocities = self.safety_monitor.velocities.copy()
+
+	def set_setpoint_mode(self, mode, rate=FULL_STATE_RATE):
+		"""
+		Choose which setpoints are sent to the real drones.
+		:param mode: POSITION_SETPOINTS or FULL_STATE_SETPOINTS.
+		:param rate: Full state setpoints sent per second.
+		"""
+		if mode not in (self.POSITION_SETPOINTS, self.FULL_STATE_SETPOINTS):
+			raise ValueError("Unknown setpoint mode " + str(mode))
+
+		self.setpoint_mode = mode
+		self.setpoint_rate = rate
+		self.setpoint_timer = 0
+
+	def get_velocities(self):
+		"""
+		Get the velocities of all drones at once.
+		:return: Array of velocities with shape (N, 3).
+		"""
+		if self.point_masses:
+			return self.base.world.velocities.copy()
+
+		velocities = np.empty((len(self.drones), 3))
+		for i, drone in enumerate(self.drones):
+			velocities[i] = drone.get_velocity()
+		return velocities
+
+	def get_forces(self):
+		"""
+		Get the forces applied to all drones at once, those of the last step with partitioned dynamics.
+		:return: Array of forces with shape (N, 3).
+		"""
+		if self.partitioned:
+			return self.base.world.applied_forces
+		if self.point_masses:
+			return self.base.world.forces.copy()
+		if self.controller is not None:
+			return self.controller_forces
+
+		forces = np.empty((len(self.drones), 3))
+		for i, drone in enumerate(self.drones):
+			forces[i] = drone.drone_node_bullet.getTotalForce()
+		return forces
+
+	def _export_state(self, frame_time):
+		"""
+		Publish positions, targets, velocities and flags of all drones to the shared memory.
+		:param frame_time: Simulated time of the current frame.
+		"""
+		flags = np.zeros(len(self.drones), dtype=np.uint8)
+		for i, drone in enumerate(self.drones):
+			if drone.in_flight:
+				flags[i] |= state_export.IN_FLIGHT
+			if drone.crazyflie is not None:
+				flags[i] |= state_export.CONNECTED
+
+		self.state_exporter.publish(frame_time, self.get_positions(), self.get_targets(), self.get_velocities(), flags)
+
+	def save_checkpoint(self, path):
+		"""
+		Save the complete state of the swarm into a file, see checkpoint.py.
+		:param path: Path of the .npz file.
+		"""
+		Checkpoint.capture(self).save(path)
+
+	def load_checkpoint(self, path):
+		"""
+		Set the swarm back to the state saved in a file, see checkpoint.py.
+		:param path: Path of the .npz file.
+		"""
+		Checkpoint.load(path).restore(self)
+
+	def _clock_changed(self):
+		"""
+		Stop streaming setpoints to the real drones once the clock of the simulation leaves real time, they hand over to
+		their high level commander and hold their position. Streaming starts again once the clock is back at real time.
+		"""
+		if self.base.clock.real_time:
+			return
+
+		flying = [drone for drone in self.drones if drone.crazyflie is not None and drone.in_flight]
+		for drone in flying:
+			drone.crazyflie.cf.commander.send_notify_setpoint_stop()
+		if flying:
+			print("Radio paused for {} drones until the simulation runs at real time again".format(len(flying)))
+
+	def load_obstacles(self, path):
+		"""
+		Replace the obstacles within the room by those of a file, see obstacles.py.
+		:param path: Path of the .json-file, None removes all obstacles.
+		"""
+		if self.obstacle_node is not None:
+			if hasattr(self.base.world, "removeRigidBody"):
+				self.base.world.removeRigidBody(self.obstacle_node.node())
+			self.obstacle_node.removeNode()
+			self.obstacle_node = None
+		self.obstacles = None
+
+		if path is not None:
+			self.obstacles = Obstacles.from_file(path)
+			self.obstacle_node = self.obstacles.attach(self.base)
+
 	def connect_reality(self, uris):
 		"""
 		Set amount of drones to actual drones in reality and set up simulated drones to work with real ones.
 		:param uris: URIs of the drones to connect to.
 		"""
+		# The Crazyflie library is only loaded once real drones are used
+		reality_manager.load_cflib()
+		from swarm_link import SwarmLink
+
 		# Update amount of drones to that of real drones
 		self.update_drone_amount(len(uris))
 
-		# For every drone, create SyncCrazyflie object and store it, then connect to the drone via it
-		for num, drone in enumerate(self.drones):
-			drone.crazyflie = SyncCrazyflie(uris[num], cf=Crazyflie(rw_cache='./cache'))
-			drone.crazyflie.open_link()
+		# The links share a TOC cache, which is kept for later connections
+		if self.swarm_link is None:
+			self.swarm_link = SwarmLink()
+		self.swarm_link.connect(self.drones, uris)
 
 	def disconnect_reality(self):
 		"""
 		Disconnects all real drones and sets amount to 0 (until new drones are connected or mode is set to unlink).
 		"""
 		# Send every drone the command to stop all rotors, then disconnect and remove object from drone
-		for num, drone in enumerate(self.drones):
-			drone.crazyflie.cf.commander.send_stop_setpoint()
-			time.sleep(.1)  # Wait until command is sent as queue is not flushed before closing link
-			drone.crazyflie.close_link()
-			drone.crazyflie = None
+		if self.swarm_link is not None:
+			self.swarm_link.disconnect()
 
 		self.update_drone_amount(0)
 
-	def stop_rotors(self):
+	def stop_rotors(self, drones=None):
 		"""
 		Stop all rotors of connected drones immediately and stop updating setpoint.
+		:param drones: Only stop these drones, anything SelectionManager.resolve takes. None stops all drones.
 		"""
-		for drone in self.drones:
+		if drones is not None:
+			drones = [self.drones[i] for i in self.selection.resolve(drones)]
+		else:
+			drones = self.drones
+
+		for drone in drones:
 			drone.in_flight = False  # To stop updating in update loop of drone
 			if drone.crazyflie is not None:
 				drone.crazyflie.cf.commander.send_stop_setpoint()
@@ -146,25 +463,37 @@ class DroneManager(DirectObject.DirectObject):
 		"""
 		for drone in self.drones:
 			drone.set_debug(active)
+		self.labels.set_active(active)
 
 	def default_formation(self, height):
 		"""
 		Set target of drones to the default formation set in the 'formations/2D/X_default.csv' files
 		:param height: Height of drones in formation
 		"""
-		# Load the corresponding formation as a list
+		self.set_formation(self._default_positions(height))
+
+	def _default_positions(self, height):
+		"""
+		Get the positions of the default formation for the current amount of drones.
+		:param height: Height of drones in formation
+		:return: List of positions (LPoint3f), one for every drone.
+		"""
+		# Load the corresponding formation as a list, large swarms without a formation file are placed on a grid
 		formation_path = "2D/" + str(len(self.drones)) + "_default.csv"
-		formation = load_formation(formation_path)
+		if os.path.exists("formations/" + formation_path):
+			formation = load_formation(formation_path)
+		else:
+			side = math.ceil(math.sqrt(len(self.drones)))
+			formation = [((i % side - (side - 1) / 2) * self.GRID_SPACING, (i // side - (side - 1) / 2) * self.GRID_SPACING)
+				for i in range(len(self.drones))]
 
-		# Update positions of drones
-		for i in range(len(self.drones)):
-			position_in_formation = LPoint3f(formation[i][0], formation[i][1], height)
-			self.drones[i].set_target(position_in_formation)
+		return [LPoint3f(formation[i][0], formation[i][1], height) for i in range(len(self.drones))]
 
 	def takeoff(self):
 		"""
 		Let the drones takeoff to one meter above their current position.
 		"""
+		self.landing.clear()
 		for drone in self.drones:
 			drone.in_flight = True
 			pos = drone.get_pos()
@@ -174,25 +503,62 @@ class DroneManager(DirectObject.DirectObject):
 		"""
 		Set the drones down where they are in X and Y right now.
 		"""
-		# Stop rotations, if there are any
+		# Stop rotations and planned transitions, if there are any
 		self.stop_rotation()
+		self.cancel_plan()
+		self.stop_mission()
 
 		for drone in self.drones:
 			pos = drone.get_pos()
 			drone.set_target(LPoint3f(pos[0], pos[1], 0.1))
 
-		def set_flight_false(task):
-			for drone in self.drones:
-				drone.in_flight = False
-			return task.done
+		# Every drone stops flying as soon as it arrived on the ground, see _drone_arrived
+		self.landing = set(range(len(self.drones)))
+		self.convergence.reset()
 
-		self.base.taskMgr.doMethodLater(3, set_flight_false, "StopFlight")
+	def _drone_arrived(self, number):
+		"""
+		Event handling function for a drone that arrived at its target.
+		:param number: Number of the drone.
+		"""
+		if number in self.landing:
+			self.landing.discard(number)
+			self.drones[number].in_flight = False
+
+	def get_convergence(self):
+		"""
+		Get which drones arrived at their targets, e.g. to wait for a formation through the API.
+		:return: Dictionary with a flag for every drone ("arrived") and if all drones arrived ("formation_reached").
+		"""
+		return {"arrived": self.convergence.arrived.tolist(), "formation_reached": self.convergence.formation_reached}
+
+	def get_metrics(self):
+		"""
+		Get the quality of the flight of the swarm over the last updates, see swarm_metrics.py.
+		:return: Dictionary with mean, min, max and last value of every metric.
+		"""
+		return self.metrics.summary()
+
+	def record_metrics(self, path):
+		"""
+		Write the metrics of every following update to a file, see swarm_metrics.py.
+		:param path: Path of the file.
+		"""
+		self.metrics.start_recording(path)
+
+	def stop_recording_metrics(self):
+		"""
+		Stop writing the metrics to a file.
+		"""
+		self.metrics.stop_recording()
 
 	def stop_movement(self):
 		"""
 		To stop all current movement just set the current position to the target position.
 		"""
 		self.stop_rotation()
+		self.cancel_plan()
+		self.stop_mission()
 		for drone in self.drones:
 			pos = drone.get_pos()
 			drone.set_target(LPoint3f(pos[0], pos[1], pos[2]))
@@ -200,15 +566,29 @@ class DroneManager(DirectObject.DirectObject):
 	def random_formation(self):
 		"""
 		Set targets of all drones to a random position within safe corridor of room.
+		Raises a ValueError if there is hardly any free space left, the targets stay as they are then.
 		"""
-		# Only use part of the room as possible coordinates
-		safe_coordinates = self.ROOM_SIZE - LVector3f(1.0, 1.0, 0.5)
-
-		for drone in self.drones:
-			x = random.uniform(-safe_coordinates.x / 2, safe_coordinates.x / 2)
-			y = random.uniform(-safe_coordinates.y / 2, safe_coordinates.y / 2)
-			z = random.uniform(0.3, safe_coordinates.z)
-			drone.set_target(LPoint3f(x, y, z))
+		lower, upper = self.room_sdf.lower, self.room_sdf.upper
+
+		# Draw positions within the room until none is within the safety margin of a wall or an obstacle, all drones
+		# drawing again at once
+		positions = np.zeros((len(self.drones), 3))
+		missing = np.arange(len(self.drones))
+		for _ in range(self.PLACEMENT_ROUNDS):
+			if len(missing) == 0:
+				break
+			for i in missing:
+				positions[i] = (random.uniform(lower[0], upper[0]), random.uniform(lower[1], upper[1]),
+					random.uniform(0.3, upper[2]))
+			valid = self.room_sdf.distance(positions[missing]) > self.room_sdf.WALL_SAFETY_MARGIN
+			if self.obstacles is not None:
+				valid &= self.obstacles.nearest(positions[missing], Obstacles.SAFETY_MARGIN)[0] >= Obstacles.SAFETY_MARGIN
+			missing = missing[~valid]
+
+		if len(missing) > 0:
+			raise ValueError("Could not find free random targets for {} of {} drones in {} rounds".format(
+				len(missing), len(self.drones), self.PLACEMENT_ROUNDS))
+		self.set_formation([LPoint3f(*position) for position in positions])
 
 	def spiral_formation(self):
 		"""
@@ -219,62 +599,186 @@ class DroneManager(DirectObject.DirectObject):
 		formation = load_formation(formation_path)
 
 		# Update positions of drones
-		for i in range(len(self.drones)):
-			position_in_formation = LPoint3f(formation[i][0], formation[i][1], formation[i][2])
-			self.drones[i].set_target(position_in_formation)
+		positions = [LPoint3f(formation[i][0], formation[i][1], formation[i][2]) for i in range(len(self.drones))]
+		self.set_formation(positions)
 
-	def set_rotation(self, drones, origin, speed, clockwise):
+	def set_formation(self, positions):
 		"""
-		Add a rotation task as wanted. See task for param doc.
+		Let the drones move into a new formation.
+		If drones are in flight, the transition is planned first, else the targets are set right away.
+		:param positions: Position in the formation for every drone, as LPoint3f or sequences of 3 numbers (e.g. from
+		the API).
 		"""
-		self.base.taskMgr.doMethodLater(0.1, self._set_rotation_task, "RotationTask", extraArgs=[drones, origin, speed, clockwise], appendTask=True)
+		positions = [LPoint3f(*position) for position in positions]
+		if len(positions) != len(self.drones):
+			raise ValueError("Formation has {} positions for {} drones".format(len(positions), len(self.drones)))
 
-	def set_movement(self, drones, x, y, z):
+		self.stop_mission()
+
+		if self.PLAN_FORMATIONS and any(drone.in_flight for drone in self.drones):
+			self.plan_formation(positions)
+		else:
+			for drone, position in zip(self.drones, positions):
+				drone.set_target(position)
+
+	def plan_formation(self, positions):
 		"""
-		Set a new target for multiple drones.
-		:param drones: Drones to move.
-		:param x: Relative X movement
-		:param y: Relative Y movement
-		:param z: Relative Z movement
+		Start planning collision-free trajectories into a new formation in the background.
+		The drones hold their current targets until the planner is done.
+		:param positions: Position in the formation for every drone.
+		"""
+		# Rotations would immediately override the planned trajectories
+		self.stop_rotation()
+
+		if self.planner_executor is None:
+			# Spawn a fresh process, forking a running Panda3D application is not safe
+			self.planner_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+		# Hold the current targets, this also stops drones following a former trajectory
+		for drone in self.drones:
+			drone.set_target(drone.get_target())
+
+		starts = self.get_positions()
+		goals = np.array([[position.x, position.y, position.z] for position in positions])
+		self.plan_future = self.planner_executor.submit(self.planner.plan, starts, goals)
+		self.convergence.reset()
+		self.plan_goals = list(positions)
+		self.plan_submitted = time.perf_counter()
+
+	def cancel_plan(self):
 		"""
-		for i in drones:
-			# Get current target
-			current_target = self.drones[i].get_target()
+		Discard the result of the currently running planning request, if any.
+		"""
+		self.plan_future = None
 
-			# Add relative movement
-			current_target.x += x
-			current_target.y += y
-			current_target.z += z
+	def _apply_plan(self):
+		"""
+		Let every drone follow its planned trajectory and store the metrics of the planning request.
+		"""
+		future, self.plan_future = self.plan_future, None
+
+		# Amount of drones changed while planning, the plan is useless now
+		if len(self.plan_goals) != len(self.drones):
+			return
+
+		try:
+			result = future.result()
+		except Exception as error:
+			# Without trajectories the drones fly straight to the formation, the avoidance forces are still active
+			print("Planning failed ({!r}), setting the targets directly".format(error))
+			for drone, position in zip(self.drones, self.plan_goals):
+				drone.set_target(position)
+			return
+
+		for drone, trajectory in zip(self.drones, result.trajectories):
+			drone.follow_trajectory(trajectory)
+
+		latency = time.perf_counter() - self.plan_submitted
+		self.planning_metrics.append((len(self.drones), result.planning_time, latency))
+		print("Planned trajectories for {} drones in {:.3f} s ({:.3f} s until applied, {} fallbacks)".format(
+			len(self.drones), result.planning_time, latency, result.fallbacks))
+
+	def play_mission(self, path, stream=False):
+		"""
+		Load a mission file, compile it and start playing it back.
+		The mission starts at the current targets of the drones.
+		:param path: Path of the mission file, see mission.py for its structure.
+		:param stream: If the setpoints of the mission should be sent straight to the real drones instead of the
+		positions of the simulated drones.
+		"""
+		self.stop_rotation()
+		self.cancel_plan()
 
-			# Set new target
-			self.drones[i].set_target(current_target)
+		start_positions = [[target.x, target.y, target.z] for target in (drone.get_target() for drone in self.drones)]
+		self.mission = Mission.from_file(path).compile(start_positions, load_formation)
+		self.mission_start = self.base.clock.time
+		self.mission_stream = stream
+
+	def stop_mission(self):
+		"""
+		Stop the currently played mission, the drones keep their current targets.
+		"""
+		self.mission = None
+		for drone in self.drones:
+			drone.direct_setpoint = None
 
-	def _set_rotation_task(self, drones, origin, speed, clockwise, task):
+	def _update_mission(self):
 		"""
-		Add a task add a constant rotation to certain drones.
-		:param drones: Which drones should join the rotation.
-		:param origin: Origin for rotation.
-		:param speed: XXX
+		Set the targets of all drones to their setpoints of the current tick of the mission.
+		"""
+		elapsed = self.base.clock.time - self.mission_start
+		setpoints = self.mission.setpoints[self.mission.tick(elapsed)]
+
+		for drone, setpoint in zip(self.drones, setpoints):
+			drone.set_target(LPoint3f(*setpoint))
+			if self.mission_stream:
+				drone.direct_setpoint = setpoint
+
+		if elapsed >= self.mission.duration:
+			self.stop_mission()
+
+	def set_rotation(self, drones, origin, speed, clockwise, axis=(0, 0, 1)):
+		"""
+		Add a constant rotation to certain drones.
+		:param drones: Which drones should join the rotation, anything SelectionManager.resolve takes.
+		:param origin: Origin for rotation, either (x, y) or (x, y, z).
+		:param speed: Angular speed in degrees per second.
 		:param clockwise: If rotation should go clockwise.
+		:param axis: Axis to rotate around, Z by default.
+		:return: ID of the rotation, needed to stop only this rotation.
 		"""
 		# Invert speed if clockwise is wanted (default is mathematically positive)
 		if clockwise:
 			speed = -speed
 
-		for i in drones:
-			# Get current target
-			current_target = self.drones[i].get_target()
+		return self.rotations.add(self.selection.resolve(drones).indices, origin, speed, axis)
+
+	def set_movement(self, drones, x, y, z):
+		"""
+		Set a new target for multiple drones.
+		:param drones: Drones to move, anything SelectionManager.resolve takes.
+		:param x: Relative X movement
+		:param y: Relative Y movement
+		:param z: Relative Z movement
+		"""
+		self.cancel_plan()
+		self.stop_mission()
+
+		movement = LVector3f(x, y, z)
+		selected = self.selection.resolve(drones).indices
 
-			# Calculate new target
-			new_target = rotate_z(origin, current_target, speed)
+		# Drones whose new target is too close to an obstacle or whose way there runs through one stay where they are
+		if self.obstacles is not None and len(selected) > 0:
+			targets = self.get_targets()[selected]
+			blocked = self.obstacles.blocked(targets, targets + (x, y, z))
+			if blocked.any():
+				print("{} drones not moved, an obstacle is in their way".format(int(blocked.sum())))
+			selected = selected[~blocked]
+
+		for i in selected:
+			# Add relative movement to the current target
+			self.drones[i].set_target(self.drones[i].get_target() + movement)
+
+	def _update_rotations(self, dt):
+		"""
+		Rotate the targets of all drones in rotation groups by one time step.
+		:param dt: Time since the last update.
+		"""
+		# Only the targets of drones in rotations are needed
+		members = self.rotations.members()
+		members = members[members < len(self.drones)]
+		targets = np.zeros((len(self.drones), 3))
+		for i in members:
+			targets[i] = self.drones[i].get_target()
 
-			# Set new target
-			self.drones[i].set_target(new_target)
+		self.rotations.step(targets, dt)
 
-		return task.again
+		for i in members:
+			self.drones[i].set_target(LPoint3f(*targets[i]))
 
-	def stop_rotation(self):
+	def stop_rotation(self, rotation=None):
 		"""
-		Stop all rotations
+		Stop rotations.
+		:param rotation: ID of the rotation to stop, as returned by set_rotation. None stops all rotations.
 		"""
-		self.base.taskMgr.remove("RotationTask")
+		self.rotations.remove(rotation)
@@ -0,0 +1,154 @@
+# Import needed modules
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from cflib.crtp.crtpdriver import CRTPDriver
+from cflib.crtp.crtpstack import CRTPPacket
+from cflib.crtp.crtpstack import CRTPPort
+from cflib.crtp.exceptions import WrongUriType
+
+
+class FakeLink(CRTPDriver):
+	"""
+	Link driver for drones that only exist in memory, to try connecting, TOC caching and reconnecting without any radio.
+
+	URIs have the form fake://<name>, or fake://<name>/<firmware> to give drones different firmware and with it a
+	different TOC. The fake firmware answers just enough of the connection sequence for cflib (protocol version, log and
+	parameter TOC, memories and parameter values) and swallows everything else, e.g. setpoints. Every answer is delayed
+	by the latency of a radio round trip, so downloading a TOC takes as long as it does with a real radio.
+	"""
+
+	SCHEME = "fake://"  # URIs handled by this driver
+	LATENCY = .004  # Seconds until an answer arrives, roughly a round trip of the Crazyradio
+	PROTOCOL_VERSION = 6  # Protocol version reported to cflib, 4 or newer uses the TOC format with 16 bit indices
+	LOG_VARIABLES = 300  # Size of the log TOC, similar to the one of the real firmware
+	PARAMETERS = 400  # Size of the parameter TOC, similar to the one of the real firmware
+
+	links = {}  # Open fake links by their URI, to drop them from outside
+	unreachable = set()  # URIs of fake drones that do not answer
+
+	def __init__(self):
+		super().__init__()
+		self.needs_resending = False  # Nothing gets lost in memory
+		self.uri = None
+		self.answers = queue.Queue()  # Tuples of the time an answer arrives and the answer
+		self.link_error_callback = None
+		self.tocs = None
+
+	def connect(self, uri, radio_link_statistics_callback, link_error_callback):
+		"""
+		Open the link to a fake drone.
+		"""
+		if not uri.startswith(self.SCHEME):
+			raise WrongUriType("Not a fake URI")
+		if uri in self.unreachable:
+			raise Exception("Fake drone {} does not answer".format(uri))
+
+		self.uri = uri
+		self.link_error_callback = link_error_callback
+		firmware = uri[len(self.SCHEME):].partition("/")[2] or "default"
+		self.tocs = {
+			CRTPPort.LOGGING: _make_toc(firmware, "log", self.LOG_VARIABLES, 0x07),
+			CRTPPort.PARAM: _make_toc(firmware, "param", self.PARAMETERS, 0x06)}
+		FakeLink.links[uri] = self
+
+	@classmethod
+	def drop(cls, uri):
+		"""
+		Break the link to a fake drone as if it flew out of range, cflib reports this as a lost connection.
+		:param uri: URI of the fake drone.
+		"""
+		link = cls.links.pop(uri, None)
+		if link is not None:
+			threading.Thread(target=link.link_error_callback, args=("Fake link dropped",), daemon=True).start()
+
+	def send_packet(self, pk):
+		"""
+		Let the fake firmware answer a packet.
+		"""
+		for port, channel, data in self._answer(pk.port, pk.channel, bytes(pk.data)):
+			answer = CRTPPacket()
+			answer.set_header(port, channel)
+			answer.data = data
+			self.answers.put((time.perf_counter() + self.LATENCY, answer))
+
+	def receive_packet(self, wait=0):
+		"""
+		Receive the next answer once it arrived.
+		:param wait: Seconds to wait for an answer, -1 waits forever.
+		"""
+		try:
+			arrival, answer = self.answers.get(block=wait != 0, timeout=None if wait < 0 else wait)
+		except queue.Empty:
+			return None
+		time.sleep(max(arrival - time.perf_counter(), 0))
+		return answer
+
+	def _answer(self, port, channel, data):
+		"""
+		The fake firmware.
+		:return: List of answers as tuples of port, channel and data.
+		"""
+		if port == CRTPPort.LINKCTRL:
+			# Echo for the link statistics, source packets identify the firmware
+			return [(port, channel, data if channel == 0 else b"Bitcraze Crazyflie")]
+		if port == CRTPPort.PLATFORM and channel == 1 and data[:1] == b"\x00":
+			return [(port, channel, bytes((0, self.PROTOCOL_VERSION)))]
+		if port == CRTPPort.MEM and channel == 0 and data[:1] == b"\x01":
+			return [(port, channel, b"\x01\x00")]  # No memories
+		if port == CRTPPort.LOGGING and channel == 1 and data[:1] == b"\x05":
+			return [(port, channel, b"\x05\x00\x00")]  # Logging reset
+		if port in self.tocs and channel == 0:
+			toc, crc = self.tocs[port]
+			if data[:1] == b"\x03":
+				return [(port, channel, b"\x03" + struct.pack("<HI", len(toc), crc))]
+			if data[:1] == b"\x02":
+				index = struct.unpack("<H", data[1:3])[0]
+				return [(port, channel, b"\x02" + struct.pack("<H", index) + toc[index])]
+		if port == CRTPPort.PARAM and channel == 1:
+			return [(port, channel, data[:2] + b"\x00" + struct.pack("<f", 0))]  # Every parameter is 0
+		return []
+
+	def get_status(self):
+		return "Fake link"
+
+	def get_name(self):
+		return "fake"
+
+	def scan_interface(self, address=None):
+		return []
+
+	def enum(self):
+		return []
+
+	def get_help(self):
+		return "fake://<name>[/<firmware>]"
+
+	def close(self):
+		if FakeLink.links.get(self.uri) is self:
+			del FakeLink.links[self.uri]
+
+
+def _make_toc(firmware, group, size, type_id):
+	"""
+	Create the TOC of a fake firmware.
+	:param firmware: Name of the firmware, changes the names and so the CRC.
+	:param group: Group of all variables.
+	:param size: Amount of variables.
+	:param type_id: Type of all variables.
+	:return: Tuple of the encoded elements and the CRC.
+	"""
+	toc = [bytes((type_id,)) + "{}\0{}{}\0".format(group, firmware, i).encode() for i in range(size)]
+	return toc, zlib.crc32(b"".join(toc))
+
+
+def register():
+	"""
+	Add the fake link to the drivers of cflib, its drivers have to be loaded already (see reality_manager.load_cflib).
+	"""
+	import cflib.crtp
+	if FakeLink not in cflib.crtp.CLASSES:
+		cflib.crtp.CLASSES.append(FakeLink)
@@ -0,0 +1,198 @@
+# Load  Panda3D modules
+from panda3d.core import FrameBufferProperties
+from panda3d.core import GraphicsOutput
+from panda3d.core import GraphicsPipe
+from panda3d.core import Texture
+from panda3d.core import WindowProperties
+
+# Import needed modules
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+
+class FrameCapture:
+	"""
+	Captures frames of the simulation with an offscreen buffer and writes them into a video or single image files.
+
+	Frames are taken at a fixed interval of simulation time, no matter how fast the simulation actually runs. The buffer
+	only renders if a frame is due and the sim loop only copies the rendered frame, converting and encoding is done by
+	a background thread. If the encoder can not keep up, new frames are dropped instead of stalling the simulation.
+	Frames that were due but not rendered or dropped are filled with the last frame, so the video keeps the pace of the
+	simulation.
+	"""
+
+	WIDTH = 1280  # Width of the captured frames
+	HEIGHT = 720  # Height of the captured frames
+	FPS = 30  # Frames captured per second of simulation time
+	QUEUE_SIZE = 60  # Frames waiting for the encoder before further frames are dropped
+	VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".webm")  # Paths with these endings are encoded by ffmpeg
+
+	def __init__(self, base, path, fps=FPS, width=WIDTH, height=HEIGHT):
+		"""
+		:param base: The simulation.
+		:param path: Video file to write, or a directory to write every frame as .ppm image into.
+		:param fps: Frames captured per second of simulation time, also the frame rate of the video.
+		:param width: Width of the captured frames.
+		:param height: Height of the captured frames.
+		"""
+		self.base = base
+		self.path = path
+		self.fps = fps
+		self.width = width
+		self.height = height
+		self.frames = queue.Queue(self.QUEUE_SIZE)
+		self.written = 0
+		self.dropped = 0
+		self.repeated = 0  # Frames written again for frames that were due but missed
+		self.next_capture = None  # Simulation time the next frame is due
+		self.slots = 0  # Frames of the video the requested frame is due for, all but one of them are overdue
+		self.missed = 0  # Frames of the video missed by dropped frames since the last frame handed to the encoder
+		self.pending = False  # If a frame was requested and is not read back yet
+		self.last_modified = None  # Modification counter of the texture when the last frame was requested
+		self.encoder = None
+		self.thread = None
+
+		# Make sure a pipe exists even if the simulation has no window at all
+		if base.pipe is None:
+			base.makeDefaultPipe()
+
+		# The buffer only renders if a frame is due (the first frame opens it), the image is copied to the texture RAM
+		properties = FrameBufferProperties()
+		properties.setRgbColor(True)
+		properties.setDepthBits(1)
+		host = base.win
+		self.buffer = base.graphicsEngine.makeOutput(base.pipe, "frameCapture", -2, properties,
+			WindowProperties.size(width, height), GraphicsPipe.BFRefuseWindow,
+			host.getGsg() if host is not None else None, host)
+		if self.buffer is None:
+			raise RuntimeError("Could not create an offscreen buffer to capture frames")
+		self.buffer.setClearColor(base.getBackgroundColor())
+		self.buffer.setOneShot(True)
+		self.texture = Texture()
+		self.buffer.addRenderTexture(self.texture, GraphicsOutput.RTMCopyRam)
+
+		# Camera at the very same place as the camera of the simulation, its lens is copied on every capture
+		self.camera = base.makeCamera(self.buffer)
+
+	def start(self):
+		"""
+		Start the encoder and capturing frames.
+		"""
+		if os.path.splitext(self.path)[1].lower() in self.VIDEO_EXTENSIONS:
+			if shutil.which("ffmpeg") is None:
+				raise RuntimeError("ffmpeg is needed to write videos, capture into a directory instead")
+			self.encoder = subprocess.Popen([
+				"ffmpeg", "-loglevel", "error", "-y",
+				"-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(self.width, self.height),
+				"-r", str(self.fps), "-i", "-",
+				"-pix_fmt", "yuv420p", self.path], stdin=subprocess.PIPE)
+		else:
+			os.makedirs(self.path, exist_ok=True)
+
+		self.thread = threading.Thread(target=self._encode, daemon=True)
+		self.thread.start()
+
+		# The first frame is due right away, if it can only be rendered later the frames until then repeat it
+		self.next_capture = self.base.clock.time
+
+		# Run before the frame is rendered, so a requested frame is rendered in the same iteration
+		self.base.taskMgr.add(self._capture_task, "FrameCaptureTask", sort=45)
+
+	def stop(self):
+		"""
+		Stop capturing, wait for the encoder to write all remaining frames and remove the buffer.
+		"""
+		self.base.taskMgr.remove("FrameCaptureTask")
+
+		if self.thread is not None:
+			self.frames.put(None)
+			self.thread.join()
+			self.thread = None
+		if self.encoder is not None:
+			self.encoder.stdin.close()
+			self.encoder.wait()
+			self.encoder = None
+
+		self.base.graphicsEngine.removeWindow(self.buffer)
+		print("Captured {} frames to {} ({} repeated for missed frames, {} dropped)".format(self.written, self.path,
+			self.repeated, self.dropped))
+
+	def _capture_task(self, task):
+		"""
+		Read back the frame requested before and request the next one once it is due.
+		"""
+		# The texture is modified as soon as the requested frame was rendered
+		modified = self.texture.getImageModified()
+		if self.pending and modified != self.last_modified and self.texture.hasRamImage():
+			self.pending = False
+			frame = (self.texture.getRamImage().getData(), self.texture.getXSize(), self.texture.getYSize(),
+				self.texture.getNumComponents(), self.missed + self.slots - 1)
+			try:
+				self.frames.put_nowait(frame)
+				self.missed = 0
+			except queue.Full:
+				self.dropped += 1
+				self.missed += self.slots
+
+		now = self.base.clock.time
+		if now >= self.next_capture and not self.pending:
+			# Follow changes of the lens, e.g. the orthographic lens of the top-down camera
+			lens = self.base.cam.node().getLens().makeCopy()
+			lens.setAspectRatio(self.width / self.height)
+			self.camera.node().setLens(lens)
+
+			self.buffer.setOneShot(True)
+			self.pending = True
+			self.last_modified = modified
+			render_governor = getattr(self.base, "render_governor", None)
+			if render_governor is not None:
+				render_governor.request_frame()
+
+			# Frames that are overdue are filled with the last frame by the encoder
+			self.slots = 0
+			while self.next_capture <= now:
+				self.next_capture += 1 / self.fps
+				self.slots += 1
+
+		return task.cont
+
+	def _encode(self):
+		"""
+		Main function of the encoder thread: converts the frames to RGB and writes them until None is received.
+		"""
+		last_image = None
+		while True:
+			frame = self.frames.get()
+			if frame is None:
+				break
+			data, x_size, y_size, components, missed = frame
+
+			# Textures store BGR(A) rows from bottom to top and may be larger than the buffer
+			image = np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(y_size, x_size, components)
+				[:self.height, :self.width][::-1, :, 2::-1]).tobytes()
+
+			# Frames missed before this one show the last frame, or this one if there was none yet
+			for _ in range(missed):
+				self._write(last_image if last_image is not None else image)
+				self.repeated += 1
+			self._write(image)
+			last_image = image
+
+	def _write(self, image):
+		"""
+		Write a converted frame into the video or as the next image file.
+		:param image: RGB bytes of the frame, rows from top to bottom.
+		"""
+		if self.encoder is not None:
+			self.encoder.stdin.write(image)
+		else:
+			file_name = os.path.join(self.path, "frame_{:06d}.ppm".format(self.written))
+			with open(file_name, "wb") as file:
+				file.write("P6\n{} {}\n255\n".format(self.width, self.height).encode())
+				file.write(image)
+		self.written += 1
@@ -8,6 +8,7 @@ from gi.repository import Gdk
 
 # Load other files
 import reality_manager
+from selection import Selection
 
 
 class Handler(Gtk.Builder):
@@ -25,6 +26,9 @@ class Handler(Gtk.Builder):
 	# Stored to later control the drones through GUI interaction
 	drone_manager = []
 
+	# Stored to later pause, step and speed up the simulation
+	sim_clock = []
+
 	def __init__(self, builder):
 		# Get GUI objects to manipulate
 		self.mode_switch = builder.get_object("modeSwitch")
@@ -42,18 +46,13 @@ class Handler(Gtk.Builder):
 		self.disconnect_button = builder.get_object("disconnectButton")
 		self.connected_label = builder.get_object("connectedLabel")
 
-		# CheckButtons to choose drones
+		# CheckButtons to choose drones, as many as the layout contains
 		self.drone_choosers = []
-		self.drone_choosers.append(builder.get_object("droneChooser0"))
-		self.drone_choosers.append(builder.get_object("droneChooser1"))
-		self.drone_choosers.append(builder.get_object("droneChooser2"))
-		self.drone_choosers.append(builder.get_object("droneChooser3"))
-		self.drone_choosers.append(builder.get_object("droneChooser4"))
-		self.drone_choosers.append(builder.get_object("droneChooser5"))
-		self.drone_choosers.append(builder.get_object("droneChooser6"))
-		self.drone_choosers.append(builder.get_object("droneChooser7"))
-		self.drone_choosers.append(builder.get_object("droneChooser8"))
-		self.drone_choosers.append(builder.get_object("droneChooser9"))
+		while builder.get_object("droneChooser" + str(len(self.drone_choosers))) is not None:
+			self.drone_choosers.append(builder.get_object("droneChooser" + str(len(self.drone_choosers))))
+
+		# Drones currently chosen, updated whenever a CheckButton is toggled
+		self.selected_drones = Selection()
 
 		# GUI objects of rotation menu
 		self.rotation_add_x = builder.get_object("rotationAddX")
@@ -69,6 +68,9 @@ class Handler(Gtk.Builder):
 		self.movement_add_z = builder.get_object("movementAddZ")
 		self.move_button = builder.get_object("moveButton")
 
+		# GUI objects of the clock of the simulation
+		self.step_button = builder.get_object("stepButton")
+
 		# Store different states of GUI objects
 		self.mode_state = self.mode_switch.get_active()  # True == on
 		self.takeoff_toggle_state = self.takeoff_toggle.get_active()  # True == pressed
@@ -211,6 +213,21 @@ class Handler(Gtk.Builder):
 	def onRandomPress(self, button):
 		Handler.drone_manager.random_formation()
 
+	def onPauseToggle(self, button):
+		if button.get_active():
+			Handler.sim_clock.pause()
+			self.step_button.set_sensitive(True)
+		else:
+			Handler.sim_clock.resume()
+			self.step_button.set_sensitive(False)
+
+	def onStepPress(self, button):
+		Handler.sim_clock.step()
+
+	def onSpeedChanged(self, combo):
+		speed = combo.get_active_id()
+		Handler.sim_clock.set_speed(Handler.sim_clock.FASTEST if speed == "max" else float(speed))
+
 	def onScanPress(self, button):
 		# Clear storage
 		self.scanned_drones_store.clear()
@@ -246,36 +263,38 @@ class Handler(Gtk.Builder):
 		self.takeoff_toggle.set_sensitive(False)
 		self.connected_label.set_text("Currently, there are 0 drones connected.")
 
+	def onDroneChooserToggle(self, button):
+		"""
+		Add or remove the drone of a CheckButton from the chosen drones.
+		"""
+		drone = Selection([self.drone_choosers.index(button)])
+		if button.get_active():
+			self.selected_drones = self.selected_drones | drone
+		else:
+			self.selected_drones = self.selected_drones - drone
+
 	def onAddRotationPress(self, button):
 		"""
 		Add a constant rotation to the chosen drones.
 		"""
 		# Load values from GUI
-		drones = []
-		for num, checkbutton in enumerate(self.drone_choosers):
-			if checkbutton.get_active():
-				drones.append(num)
 		origin = float(self.rotation_add_x.get_text()), float(self.rotation_add_y.get_text())
 		cw = self.rotation_add_cw.get_active()
-		speed = float(self.rotation_add_speed.get_text()) / 10  # Input is per second, task runs at .1 seconds
+		speed = float(self.rotation_add_speed.get_text())  # Degrees per second
 
 		# Call rotation into action
-		Handler.drone_manager.set_rotation(drones, origin, speed, cw)
+		Handler.drone_manager.set_rotation(self.selected_drones, origin, speed, cw)
 
 		# Set button to stop it to sensitive
 		self.stop_rotations.set_sensitive(True)
 
 	def onMovePress(self, button):
 		# Load values from GUI
-		drones = []
-		for num, checkbutton in enumerate(self.drone_choosers):
-			if checkbutton.get_active():
-				drones.append(num)
 		x = float(self.movement_add_x.get_text())
 		y = float(self.movement_add_y.get_text())
 		z = float(self.movement_add_z.get_text())
 
-		Handler.drone_manager.set_movement(drones, x, y, z)
+		Handler.drone_manager.set_movement(self.selected_drones, x, y, z)
 
 	def onKeyPress(self, area, event):
 		"""
@@ -311,6 +330,12 @@ class Handler(Gtk.Builder):
 			else:
 				Handler.bullet_debug_node.hide()
 				Handler.drone_manager.set_debug(False)
+		if keyname == 'F2':
+			Handler.cam_control.follow_next_drone()
+		if keyname == 'F3':
+			Handler.cam_control.set_mode(Handler.cam_control.FIT)
+		if keyname == 'F4':
+			Handler.cam_control.set_mode(Handler.cam_control.TOP_DOWN)
 
 	def onKeyRelease(self, area, event):
 		"""
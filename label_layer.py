@@ -0,0 +1,156 @@
+# Load  Panda3D modules
+from panda3d.core import TextNode
+from panda3d.core import NodePath
+
+# Import needed modules
+import numpy as np
+
+
+class LabelLayer:
+	"""
+	Shows the number and address of the drones above their models in debug mode.
+	Labels are only created for the drones closest to the camera that are within its view. They are parented to the
+	drones so they follow them, always face the camera and share a single font (and so its texture atlas). The text of a
+	label is generated again once it changes, e.g. when its drone connects to a real drone.
+	"""
+
+	MAX_DISTANCE = 6  # Drones further away from the camera get no label, unless the lens is orthographic
+	FRUSTUM_MARGIN = 1.1  # Labels reach a bit beyond the drones, so the frustum is widened by this factor
+	MAX_LABELS = 50  # Maximum amount of labels shown at once, the closest drones win
+	UPDATE_INTERVAL = .2  # Seconds between two updates of which drones get a label
+	LABEL_HEIGHT = .3  # Height of the label above the drone
+	LABEL_SCALE = .1  # Scale of the text
+
+	def __init__(self, base, drone_manager):
+		"""
+		:param base: The simulation, to get the camera from.
+		:param drone_manager: The drone manager whose drones are labeled.
+		"""
+		self.base = base
+		self.drone_manager = drone_manager
+		self.active = False
+		self.labels = {}  # Label of every drone that currently has one
+		self.texts = {}  # Text every label was generated with
+		self.pool = []  # Labels that are currently not used, to be reused
+
+		# A single text generator (and so a single font) for all labels
+		self.text_generator = TextNode("droneInfo")
+		self.text_generator.setAlign(TextNode.ACenter)
+
+	def set_active(self, active):
+		"""
+		De-/activate the labels, while deactivated no work is done at all.
+		:param active: If labels should be shown.
+		"""
+		self.active = active
+
+		if active:
+			self.base.taskMgr.doMethodLater(0, self._update_task, "LabelLayerTask")
+		else:
+			self.base.taskMgr.remove("LabelLayerTask")
+			for drone in list(self.labels):
+				self._release(drone)
+
+	def _update_task(self, task):
+		"""
+		Update which drones get a label.
+		"""
+		self.update()
+		task.delayTime = self.UPDATE_INTERVAL
+		return task.again
+
+	def update(self):
+		"""
+		Materialise labels for the visible drones closest to the camera and release all others.
+		"""
+		drones = self.drone_manager.drones
+
+		# Drop labels of drones that were removed from the simulation
+		for drone in list(self.labels):
+			if drone not in drones:
+				self._release(drone)
+
+		wanted = set(drones[i] for i in self._visible(self.drone_manager.get_positions()))
+
+		for drone in list(self.labels):
+			if drone not in wanted:
+				self._release(drone)
+		for drone in wanted:
+			if drone not in self.labels:
+				self._attach(drone)
+			elif self.texts[drone] != self._text(drone):
+				self._generate(drone)
+
+	def _visible(self, positions):
+		"""
+		Cull the drones by distance and view frustum of the camera.
+		:param positions: Positions of all drones, shape (N, 3).
+		:return: Indices of the closest visible drones, at most MAX_LABELS.
+		"""
+		if len(positions) == 0:
+			return []
+
+		# Transform positions into the coordinate system of the camera (Panda3D uses row vectors)
+		camera_matrix = self.base.cam.getMat(self.base.render)
+		camera_matrix.invertInPlace()
+		matrix = np.array([[camera_matrix.getCell(row, column) for column in range(4)] for row in range(4)])
+		local = np.hstack((positions, np.ones((len(positions), 1)))) @ matrix
+		distances = np.linalg.norm(local[:, :3], axis=1)
+
+		# Project them with the lens currently in use, perspective or orthographic (top-down mode), into clip space,
+		# the frustum is where all coordinates are within -w and w
+		lens = self.base.cam.node().getLens()
+		projection = lens.getProjectionMat()
+		clip = local @ np.array([[projection.getCell(row, column) for column in range(4)] for row in range(4)])
+		w = clip[:, 3]
+		visible = (w > 0) & (np.abs(clip[:, 2]) <= w)
+		visible &= (np.abs(clip[:, 0]) <= w * self.FRUSTUM_MARGIN) & (np.abs(clip[:, 1]) <= w * self.FRUSTUM_MARGIN)
+
+		# Drones look the same size at any distance through an orthographic lens
+		if lens.isPerspective():
+			visible &= distances <= self.MAX_DISTANCE
+
+		candidates = np.flatnonzero(visible)
+		return candidates[np.argsort(distances[candidates], kind="stable")[:self.MAX_LABELS]]
+
+	@staticmethod
+	def _text(drone):
+		"""
+		Get the text a drone's label should show, its number and the address of the real drone it is linked to.
+		"""
+		address = 'Not connected'
+		if drone.crazyflie is not None:
+			address = drone.crazyflie.cf.link_uri
+		return str(drone.number) + '\n' + address
+
+	def _attach(self, drone):
+		"""
+		Give a drone a label, reusing a released one if possible.
+		"""
+		label = self.pool.pop() if self.pool else NodePath("droneLabel")
+		label.reparentTo(drone.drone_node_panda)
+		label.setPos(0, 0, self.LABEL_HEIGHT)
+		label.setScale(self.LABEL_SCALE)
+		label.setBillboardPointEye()
+		self.labels[drone] = label
+		self._generate(drone)
+
+	def _generate(self, drone):
+		"""
+		Generate the text of a drone's label.
+		"""
+		text = self._text(drone)
+		self.text_generator.setText(text)
+		label = self.labels[drone]
+		label.node().removeAllChildren()
+		label.attachNewNode(self.text_generator.generate())
+		self.texts[drone] = text
+
+	def _release(self, drone):
+		"""
+		Remove the label of a drone and keep it for reuse.
+		"""
+		label = self.labels.pop(drone)
+		del self.texts[drone]
+		label.detachNode()
+		self.pool.append(label)
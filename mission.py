@@ -0,0 +1,147 @@
+# Import needed modules
+import json
+import math
+
+import numpy as np
+
+
+class CompiledMission:
+	"""
+	A mission compiled into setpoints for every drone at every tick, playing it back is a single index per tick.
+	"""
+
+	def __init__(self, setpoints, rate):
+		"""
+		:param setpoints: Array of setpoints with shape (ticks, drones, 3).
+		:param rate: Ticks per second.
+		"""
+		self.setpoints = setpoints
+		self.rate = rate
+
+	@property
+	def duration(self):
+		"""
+		Length of the mission in seconds.
+		"""
+		return len(self.setpoints) / self.rate
+
+	def tick(self, elapsed):
+		"""
+		Get the tick for a time since the start of the mission, clamped to the last tick.
+		:param elapsed: Seconds since start of the mission.
+		:return: Index into the setpoints.
+		"""
+		return min(int(elapsed * self.rate), len(self.setpoints) - 1)
+
+
+class Mission:
+	"""
+	A timeline of formations, moves and rotations for groups of drones, loaded from a .json-file.
+
+	Structure of a mission file (all times in seconds, speeds in degrees per second):
+	{
+		"drones": 3,
+		"rate": 50,
+		"groups": {"outer": [1, 2]},
+		"timeline": [
+			{"time": 0, "duration": 3, "action": "formation", "formation": "2D/3_default.csv", "height": 1},
+			{"time": 3, "duration": 2, "action": "move", "group": "outer", "offset": [0, 0, .5]},
+			{"time": 5, "duration": 6, "action": "rotate", "origin": [0, 0], "speed": 30, "clockwise": false}
+		]
+	}
+	Every action changes the setpoints of its group (all drones if no group is given) gradually over its duration.
+	Formations can also be given directly as a list of "positions" (one for every drone of the group) instead of a
+	formation file. A formation file holds the positions of all drones, a group takes the positions of its drones.
+	"""
+
+	DEFAULT_RATE = 50  # Ticks per second if the file does not set a rate
+	ACTIONS = ("formation", "move", "rotate")
+
+	def __init__(self, data):
+		"""
+		:param data: The parsed content of a mission file.
+		"""
+		self.drones = int(data["drones"])
+		self.rate = data.get("rate", self.DEFAULT_RATE)
+		self.groups = {"all": list(range(self.drones))}
+		self.groups.update(data.get("groups", {}))
+		self.timeline = sorted(data["timeline"], key=lambda action: action["time"])
+
+		for action in self.timeline:
+			if action["action"] not in self.ACTIONS:
+				raise ValueError("Unknown mission action: " + str(action["action"]))
+			if action.get("group", "all") not in self.groups:
+				raise ValueError("Unknown mission group: " + str(action["group"]))
+			if "positions" in action and len(action["positions"]) != len(self.groups[action.get("group", "all")]):
+				raise ValueError("Formation at {} s needs a position for every drone of its group".format(action["time"]))
+
+	@classmethod
+	def from_file(cls, path):
+		"""
+		Load a mission from its .json-file.
+		:param path: Path of the mission file.
+		"""
+		with open(path) as mission_file:
+			return cls(json.load(mission_file))
+
+	@property
+	def duration(self):
+		"""
+		End of the last action in seconds.
+		"""
+		return max([action["time"] + action.get("duration", 0) for action in self.timeline], default=0)
+
+	def compile(self, start_positions, load_formation):
+		"""
+		Compile the timeline into setpoints for every drone at every tick.
+		Actions are stacked as offsets to the setpoints, so actions of different groups can overlap freely.
+		:param start_positions: Setpoints of the drones at the start of the mission, shape (drones, 3).
+		:param load_formation: Function to load a formation file as a list of positions.
+		:return: The compiled mission.
+		"""
+		if len(start_positions) != self.drones:
+			raise ValueError("Mission is made for {} drones, not {}".format(self.drones, len(start_positions)))
+
+		ticks = int(math.ceil(self.duration * self.rate)) + 1
+		setpoints = np.repeat(np.asarray(start_positions, dtype=float)[np.newaxis], ticks, axis=0)
+
+		for action in self.timeline:
+			members = np.array(self.groups[action.get("group", "all")], dtype=np.intp)
+			start = int(round(action["time"] * self.rate))
+			end = max(int(round((action["time"] + action.get("duration", 0)) * self.rate)), start + 1)
+
+			# Setpoints of the group when the action starts, every change is relative to them
+			base = setpoints[start, members]
+			fraction = ((np.arange(start, end) - start + 1) / (end - start))[:, np.newaxis, np.newaxis]
+
+			if action["action"] == "formation":
+				if "positions" in action:
+					goal = np.asarray(action["positions"], dtype=float)
+				else:
+					# Formation files hold a position for every drone, the members take their own ones
+					formation = np.asarray(load_formation(action["formation"]), dtype=float).reshape(-1, 3)
+					if len(formation) <= members.max(initial=-1):
+						raise ValueError("Formation {} has {} positions, drone {} has none".format(
+							action["formation"], len(formation), members.max()))
+					goal = formation[members]
+				if "height" in action:
+					goal[:, 2] = action["height"]
+				delta = (goal - base)[np.newaxis] * fraction
+
+			elif action["action"] == "move":
+				delta = np.asarray(action["offset"], dtype=float)[np.newaxis, np.newaxis] * fraction
+
+			else:
+				speed = -action["speed"] if action.get("clockwise", False) else action["speed"]
+				angles = np.radians(speed * (np.arange(start, end) - start + 1) / self.rate)[:, np.newaxis]
+				ox, oy = action.get("origin", (0, 0))
+				px, py = base[:, 0] - ox, base[:, 1] - oy
+				delta = np.zeros((end - start, len(members), 3))
+				delta[..., 0] = ox + np.cos(angles) * px - np.sin(angles) * py - base[:, 0]
+				delta[..., 1] = oy + np.sin(angles) * px + np.cos(angles) * py - base[:, 1]
+
+			# Apply the change during the action and keep its final state afterwards
+			setpoints[start:end, members] += delta[:min(end, ticks) - start]
+			setpoints[end:, members] += delta[-1]
+
+		return CompiledMission(setpoints, self.rate)
@@ -0,0 +1,54 @@
+# Import needed modules
+import hashlib
+import os
+
+
+class ModelCache:
+	"""
+	Loads models from binary .bam files instead of parsing their .egg files, which is a lot faster.
+	The .bam files are stored in cache/models and named by the hash of the content of their .egg file, so a changed
+	model is converted again automatically. Every model is only read from disk once per run, Panda3D keeps it in memory
+	and every further load returns a copy.
+	"""
+
+	CACHE_PATH = "./cache/models"  # Directory of the converted models
+
+	def __init__(self, loader, cache_path=CACHE_PATH):
+		"""
+		:param loader: The loader of the simulation.
+		:param cache_path: Directory to store the converted models in.
+		"""
+		self.loader = loader
+		self.cache_path = cache_path
+		self.bam_paths = {}  # Path of the .bam file of every model loaded so far, by path of its .egg file
+
+	def load(self, path):
+		"""
+		Load a model, converting it to a .bam file first if that was not done before.
+		:param path: Path of the .egg file.
+		:return: The model as NodePath.
+		"""
+		if path not in self.bam_paths:
+			self.bam_paths[path] = self._convert(path)
+		return self.loader.loadModel(self.bam_paths[path])
+
+	def _convert(self, path):
+		"""
+		Get the .bam file of a model, converting it if there is none for its current content.
+		:param path: Path of the .egg file.
+		:return: Path of the .bam file.
+		"""
+		with open(path, "rb") as model_file:
+			digest = hashlib.sha1(model_file.read()).hexdigest()
+		name = os.path.splitext(os.path.basename(path))[0]
+		bam_path = os.path.join(self.cache_path, "{}_{}.bam".format(name, digest))
+
+		if not os.path.exists(bam_path):
+			os.makedirs(self.cache_path, exist_ok=True)
+			model = self.loader.loadModel(path, noCache=True)
+			# Write under a temporary name first, so parallel processes never load a half written file
+			temporary_path = "{}.{}.tmp".format(bam_path, os.getpid())
+			model.writeBamFile(temporary_path)
+			os.replace(temporary_path, bam_path)
+
+		return bam_path
@@ -0,0 +1,558 @@
+# Load  Panda3D modules
+from panda3d.bullet import BulletBoxShape
+from panda3d.bullet import BulletCylinderShape
+from panda3d.bullet import BulletRigidBodyNode
+from panda3d.bullet import BulletTriangleMesh
+from panda3d.bullet import BulletTriangleMeshShape
+from panda3d.bullet import ZUp
+from panda3d.core import Filename
+from panda3d.core import Geom
+from panda3d.core import GeomNode
+from panda3d.core import GeomTriangles
+from panda3d.core import GeomVertexData
+from panda3d.core import GeomVertexFormat
+from panda3d.core import GeomVertexReader
+from panda3d.core import Loader
+from panda3d.core import LPoint3f
+from panda3d.core import LVector3f
+from panda3d.core import NodePath
+from panda3d.core import TransformState
+
+# Import needed modules
+import json
+
+import numpy as np
+
+
+class Obstacles:
+	"""
+	Static obstacles within the room: boxes, upright cylinders and triangle meshes, loaded from a .json-file.
+
+	Structure of an obstacle file (boxes and cylinders are given by their center, meshes by a model or their triangles):
+	{
+		"obstacles": [
+			{"type": "box", "center": [0, 1, .5], "size": [1, .2, 1]},
+			{"type": "cylinder", "center": [1, 0, 1], "radius": .1, "height": 2},
+			{"type": "mesh", "model": "models/obstacles/ramp.egg", "position": [0, 0, 0], "scale": 1},
+			{"type": "mesh", "vertices": [[0, 0, 0], [1, 0, 0], [0, 1, 1]], "triangles": [[0, 1, 2]]}
+		]
+	}
+	Every obstacle is added to Bullet as a static body, so Bullet drones collide with it. All boxes, cylinders and mesh
+	triangles are the primitives of a bounding volume hierarchy, which answers the nearest obstacle and the obstacles
+	hit by a segment for many drones at once: all drones walk down the tree together and skip every node further away
+	than the closest primitive found so far, so a query only looks at a few nodes per drone.
+	"""
+
+	SAFETY_MARGIN = .3  # Distance to an obstacle at which drones start to get pushed away
+	FORCE_MULTIPLIER = 10  # Allows to change influence of the force applied to stay away from obstacles
+	LEAF_SIZE = 4  # Maximum amount of primitives in a leaf of the tree
+	CYLINDER_SEGMENTS = 16  # Segments of the shape of cylinders as they are drawn
+	COLOR = (.6, .4, .2, 1)  # Color of all obstacles
+
+	# Kinds of primitives
+	BOX = 0
+	CYLINDER = 1
+	TRIANGLE = 2
+
+	def __init__(self, boxes=(), cylinders=(), triangles=()):
+		"""
+		Build the tree of all primitives.
+		:param boxes: Sequence of tuples of the center and the size of every box.
+		:param cylinders: Sequence of tuples of the center, the radius and the height of every cylinder.
+		:param triangles: Array of triangles with shape (T, 3, 3).
+		"""
+		self.box_centers = np.array([center for center, _ in boxes], dtype=float).reshape(-1, 3)
+		self.box_halves = np.array([size for _, size in boxes], dtype=float).reshape(-1, 3) / 2
+		self.cylinder_centers = np.array([center for center, _, _ in cylinders], dtype=float).reshape(-1, 3)
+		self.cylinder_radii = np.array([radius for _, radius, _ in cylinders], dtype=float)
+		self.cylinder_halves = np.array([height for _, _, height in cylinders], dtype=float) / 2
+		self.triangles = np.asarray(triangles, dtype=float).reshape(-1, 3, 3)
+
+		# All primitives are numbered: boxes first, then cylinders, then triangles
+		amounts = (len(self.box_centers), len(self.cylinder_centers), len(self.triangles))
+		self.kinds = np.repeat((self.BOX, self.CYLINDER, self.TRIANGLE), amounts)
+		self.indices = np.concatenate([np.arange(amount) for amount in amounts]).astype(np.intp)  # Within their kind
+
+		cylinder_extents = np.stack((self.cylinder_radii, self.cylinder_radii, self.cylinder_halves), axis=1)
+		self.lower = np.concatenate((self.box_centers - self.box_halves, self.cylinder_centers - cylinder_extents,
+			self.triangles.min(axis=1)))
+		self.upper = np.concatenate((self.box_centers + self.box_halves, self.cylinder_centers + cylinder_extents,
+			self.triangles.max(axis=1)))
+		self._build_tree()
+
+	@classmethod
+	def from_file(cls, path):
+		"""
+		Load the obstacles of a .json-file.
+		:param path: Path of the obstacle file.
+		"""
+		with open(path) as obstacle_file:
+			data = json.load(obstacle_file)
+
+		boxes, cylinders, triangles = [], [], [np.zeros((0, 3, 3))]
+		for obstacle in data["obstacles"]:
+			if obstacle["type"] == "box":
+				boxes.append((obstacle["center"], obstacle["size"]))
+			elif obstacle["type"] == "cylinder":
+				cylinders.append((obstacle["center"], obstacle["radius"], obstacle["height"]))
+			elif obstacle["type"] == "mesh":
+				if "model" in obstacle:
+					mesh = _load_triangles(obstacle["model"])
+				else:
+					mesh = np.asarray(obstacle["vertices"], dtype=float)[np.asarray(obstacle["triangles"])]
+				triangles.append(mesh * obstacle.get("scale", 1) + obstacle.get("position", (0, 0, 0)))
+			else:
+				raise ValueError("Unknown obstacle type: " + str(obstacle["type"]))
+
+		return cls(boxes, cylinders, np.concatenate(triangles))
+
+	def __len__(self):
+		return len(self.kinds)
+
+	def _build_tree(self):
+		"""
+		Build the bounding volume hierarchy, splitting the primitives at the median of their centers along the longest
+		axis until at most LEAF_SIZE are left. Nodes are stored in arrays, leaves refer to a range of self.order.
+		"""
+		self.order = np.arange(len(self), dtype=np.intp)  # Primitives ordered so every leaf holds a range of them
+		node_lower, node_upper, children, ranges = [], [], [], []
+		centers = (self.lower + self.upper) / 2
+
+		def build(start, end):
+			number = len(node_lower)
+			primitives = self.order[start:end]
+			node_lower.append(self.lower[primitives].min(axis=0))
+			node_upper.append(self.upper[primitives].max(axis=0))
+			children.append((-1, -1))
+			ranges.append((start, end - start))
+			if end - start <= self.LEAF_SIZE:
+				return number
+
+			axis = np.argmax(np.ptp(centers[primitives], axis=0))
+			self.order[start:end] = primitives[np.argsort(centers[primitives, axis], kind="stable")]
+			middle = (start + end) // 2
+			left = build(start, middle)
+			right = build(middle, end)
+			children[number] = (left, right)
+			ranges[number] = (start, 0)  # Only leaves hold primitives
+			return number
+
+		if len(self) > 0:
+			build(0, len(self))
+		self.node_lower = np.array(node_lower, dtype=float).reshape(-1, 3)
+		self.node_upper = np.array(node_upper, dtype=float).reshape(-1, 3)
+		self.children = np.array(children, dtype=np.intp).reshape(-1, 2)
+		self.node_starts, self.node_counts = np.array(ranges, dtype=np.intp).reshape(-1, 2).T
+
+	def _leaf_pairs(self, queries, nodes):
+		"""
+		Pair every query with all primitives of its leaf.
+		:return: Tuple of index arrays of the queries and the primitives.
+		"""
+		counts = self.node_counts[nodes]
+		total = counts.sum()
+		within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+		return np.repeat(queries, counts), self.order[np.repeat(self.node_starts[nodes], counts) + within]
+
+	def nearest(self, points, max_distance=np.inf):
+		"""
+		Find the closest obstacle of multiple points.
+		:param points: Array of points with shape (N, 3).
+		:param max_distance: Obstacles further away are not looked for, which makes the query a lot cheaper.
+		:return: Tuple of the signed distances to the closest obstacle (negative within an obstacle, max_distance if
+		there is none closer) and the directions pointing away from it (zero if there is none), shapes (N,) and (N, 3).
+		"""
+		points = np.asarray(points, dtype=float).reshape(-1, 3)
+		distances = np.full(len(points), float(max_distance))
+		closest = np.full(len(points), -1, dtype=np.intp)
+		if len(self) == 0 or len(points) == 0:
+			return distances, np.zeros((len(points), 3))
+
+		# Without a limit every query follows the closer child down to a leaf first, so the closest primitive found
+		# there bounds the search through the rest of the tree
+		if np.isinf(max_distance):
+			nodes = np.zeros(len(points), dtype=np.intp)
+			inner = np.flatnonzero(self.node_counts[nodes] == 0)
+			while len(inner) > 0:
+				left, right = self.children[nodes[inner]].T
+				to_left = _box_distances(points[inner], self.node_lower[left], self.node_upper[left]) <= \
+					_box_distances(points[inner], self.node_lower[right], self.node_upper[right])
+				nodes[inner] = np.where(to_left, left, right)
+				inner = inner[self.node_counts[nodes[inner]] == 0]
+			self._update_nearest(points, *self._leaf_pairs(np.arange(len(points)), nodes), distances, closest)
+
+		queries = np.arange(len(points))
+		nodes = np.zeros(len(points), dtype=np.intp)
+		while len(queries) > 0:
+			# Skip nodes further away than the closest primitive so far, nodes around the point may hold a primitive the
+			# point is deeper within
+			bounds = _box_distances(points[queries], self.node_lower[nodes], self.node_upper[nodes])
+			keep = (bounds < distances[queries]) | (bounds == 0)
+			queries, nodes = queries[keep], nodes[keep]
+
+			leaves = self.node_counts[nodes] > 0
+			self._update_nearest(points, *self._leaf_pairs(queries[leaves], nodes[leaves]), distances, closest)
+
+			queries = np.tile(queries[~leaves], 2)
+			nodes = self.children[nodes[~leaves]].T.ravel()
+
+		directions = np.zeros((len(points), 3))
+		found = np.flatnonzero(closest >= 0)
+		directions[found] = self._distances(points[found], closest[found])[1]
+		return distances, directions
+
+	def _update_nearest(self, points, queries, primitives, distances, closest):
+		"""
+		Keep the closest primitive of every query, in place.
+		"""
+		if len(queries) == 0:
+			return
+		candidates = self._distances(points[queries], primitives)[0]
+		order = np.lexsort((candidates, queries))
+		queries, primitives, candidates = queries[order], primitives[order], candidates[order]
+		first = np.ones(len(queries), dtype=bool)
+		first[1:] = queries[1:] != queries[:-1]
+		queries, primitives, candidates = queries[first], primitives[first], candidates[first]
+
+		closer = candidates < distances[queries]
+		distances[queries[closer]] = candidates[closer]
+		closest[queries[closer]] = primitives[closer]
+
+	def _distances(self, points, primitives):
+		"""
+		Signed distances of points to primitives and the directions pointing away from them, one point per primitive.
+		"""
+		distances = np.zeros(len(points))
+		directions = np.zeros((len(points), 3))
+		kinds = self.kinds[primitives]
+		indices = self.indices[primitives]
+
+		rows = np.flatnonzero(kinds == self.BOX)
+		if len(rows) > 0:
+			distances[rows], directions[rows] = _box_sdf(points[rows], self.box_centers[indices[rows]],
+				self.box_halves[indices[rows]])
+		rows = np.flatnonzero(kinds == self.CYLINDER)
+		if len(rows) > 0:
+			distances[rows], directions[rows] = _cylinder_sdf(points[rows], self.cylinder_centers[indices[rows]],
+				self.cylinder_radii[indices[rows]], self.cylinder_halves[indices[rows]])
+		rows = np.flatnonzero(kinds == self.TRIANGLE)
+		if len(rows) > 0:
+			distances[rows], directions[rows] = _triangle_distances(points[rows], self.triangles[indices[rows]])
+		return distances, directions
+
+	def segment_hits(self, starts, ends):
+		"""
+		Check which straight segments run through an obstacle.
+		:param starts: Array of the starts of the segments with shape (N, 3).
+		:param ends: Array of the ends of the segments with shape (N, 3).
+		:return: Boolean array with shape (N,).
+		"""
+		starts = np.asarray(starts, dtype=float).reshape(-1, 3)
+		ends = np.asarray(ends, dtype=float).reshape(-1, 3)
+		hits = np.zeros(len(starts), dtype=bool)
+		if len(self) == 0:
+			return hits
+
+		queries = np.arange(len(starts))
+		nodes = np.zeros(len(starts), dtype=np.intp)
+		while len(queries) > 0:
+			# Skip nodes the segment misses and segments already known to hit
+			keep = ~hits[queries] & _segment_box_hits(starts[queries], ends[queries], self.node_lower[nodes],
+				self.node_upper[nodes])
+			queries, nodes = queries[keep], nodes[keep]
+
+			leaves = self.node_counts[nodes] > 0
+			pairs, primitives = self._leaf_pairs(queries[leaves], nodes[leaves])
+			if len(pairs) > 0:
+				hits[pairs[self._segment_hits(starts[pairs], ends[pairs], primitives)]] = True
+
+			queries = np.tile(queries[~leaves], 2)
+			nodes = self.children[nodes[~leaves]].T.ravel()
+
+		return hits
+
+	def _segment_hits(self, starts, ends, primitives):
+		"""
+		Check if segments run through primitives, one segment per primitive.
+		"""
+		hits = np.zeros(len(starts), dtype=bool)
+		kinds = self.kinds[primitives]
+		indices = self.indices[primitives]
+
+		rows = np.flatnonzero(kinds == self.BOX)
+		if len(rows) > 0:
+			centers, halves = self.box_centers[indices[rows]], self.box_halves[indices[rows]]
+			hits[rows] = _segment_box_hits(starts[rows], ends[rows], centers - halves, centers + halves)
+		rows = np.flatnonzero(kinds == self.CYLINDER)
+		if len(rows) > 0:
+			hits[rows] = _segment_cylinder_hits(starts[rows], ends[rows], self.cylinder_centers[indices[rows]],
+				self.cylinder_radii[indices[rows]], self.cylinder_halves[indices[rows]])
+		rows = np.flatnonzero(kinds == self.TRIANGLE)
+		if len(rows) > 0:
+			hits[rows] = _segment_triangle_hits(starts[rows], ends[rows], self.triangles[indices[rows]])
+		return hits
+
+	def repulsion(self, positions):
+		"""
+		Calculate the force pushing drones away from obstacles they are too close to.
+		:param positions: Array of positions with shape (N, 3).
+		:return: Array of forces with shape (N, 3), zero for drones outside of the safety margin.
+		"""
+		distances, directions = self.nearest(positions, self.SAFETY_MARGIN)
+
+		# Force grows linearly the further a drone gets into the safety margin, as for walls
+		multiplier = np.clip(self.SAFETY_MARGIN - distances, 0, None) * self.FORCE_MULTIPLIER
+		return directions * multiplier[:, np.newaxis]
+
+	def blocked(self, starts, ends, margin=SAFETY_MARGIN):
+		"""
+		Check which moves from one target to another are not possible: the new target is too close to an obstacle or the
+		way there runs through one.
+		:param starts: Array of the current targets with shape (N, 3).
+		:param ends: Array of the new targets with shape (N, 3).
+		:param margin: Minimum distance of the new targets to every obstacle.
+		:return: Boolean array with shape (N,).
+		"""
+		return (self.nearest(ends, margin)[0] < margin) | self.segment_hits(starts, ends)
+
+	def attach(self, base):
+		"""
+		Show the obstacles in the scene and add them to the physics engine as static bodies, if it is Bullet.
+		:param base: The simulation.
+		"""
+		body = BulletRigidBodyNode("Obstacles")  # Without mass, so it never moves
+		for center, half in zip(self.box_centers, self.box_halves):
+			body.addShape(BulletBoxShape(LVector3f(*half)), TransformState.makePos(LPoint3f(*center)))
+		for center, radius, half in zip(self.cylinder_centers, self.cylinder_radii, self.cylinder_halves):
+			body.addShape(BulletCylinderShape(radius, 2 * half, ZUp), TransformState.makePos(LPoint3f(*center)))
+		if len(self.triangles) > 0:
+			mesh = BulletTriangleMesh()
+			for a, b, c in self.triangles:
+				mesh.addTriangle(LPoint3f(*a), LPoint3f(*b), LPoint3f(*c))
+			body.addShape(BulletTriangleMeshShape(mesh, dynamic=False))
+
+		node = base.render.attachNewNode(body)
+		node.attachNewNode(self._make_geom_node())
+		node.setColor(*self.COLOR)
+		if hasattr(base.world, "attachRigidBody"):
+			base.world.attachRigidBody(body)
+		return node
+
+	def _make_geom_node(self):
+		"""
+		Create the geometry of all obstacles as a single node, every obstacle drawn as triangles with flat normals.
+		"""
+		# Boxes from their eight corners, cylinders as prisms
+		corners = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=float)
+		box_faces = np.array([[0, 2, 3], [0, 3, 1], [4, 5, 7], [4, 7, 6], [0, 1, 5], [0, 5, 4], [2, 6, 7], [2, 7, 3],
+			[0, 4, 6], [0, 6, 2], [1, 3, 7], [1, 7, 5]])
+		triangles = [self.triangles] + [(center + corners * half)[box_faces] for center, half in
+			zip(self.box_centers, self.box_halves)]
+
+		angles = np.linspace(0, 2 * np.pi, self.CYLINDER_SEGMENTS, endpoint=False)
+		ring = np.stack((np.cos(angles), np.sin(angles), np.zeros_like(angles)), axis=1)
+		following = np.roll(np.arange(self.CYLINDER_SEGMENTS), -1)
+		for center, radius, half in zip(self.cylinder_centers, self.cylinder_radii, self.cylinder_halves):
+			bottom = center + ring * radius - (0, 0, half)
+			top = bottom + (0, 0, 2 * half)
+			sides = np.concatenate((np.stack((bottom, bottom[following], top[following]), axis=1),
+				np.stack((bottom, top[following], top), axis=1)))
+			caps = np.concatenate((np.stack((np.repeat([center + (0, 0, half)], len(top), axis=0), top,
+				top[following]), axis=1), np.stack((np.repeat([center - (0, 0, half)], len(bottom), axis=0),
+				bottom[following], bottom), axis=1)))
+			triangles += [sides, caps]
+		triangles = np.concatenate(triangles)
+
+		# Every corner gets the normal of its triangle, so the obstacles are shaded flat
+		normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+		normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-9)
+		rows = np.concatenate((triangles, np.repeat(normals[:, None], 3, axis=1)), axis=2).astype(np.float32)
+
+		data = GeomVertexData("obstacles", GeomVertexFormat.getV3n3(), Geom.UHStatic)
+		data.setNumRows(len(triangles) * 3)
+		view = memoryview(data.modifyArray(0)).cast("B").cast("f")
+		np.frombuffer(view, dtype=np.float32)[:] = rows.ravel()
+		primitive = GeomTriangles(Geom.UHStatic)
+		if len(triangles) > 0:
+			primitive.addConsecutiveVertices(0, len(triangles) * 3)
+		geom = Geom(data)
+		geom.addPrimitive(primitive)
+		geom_node = GeomNode("obstacles")
+		geom_node.addGeom(geom)
+		return geom_node
+
+
+def _load_triangles(model_path):
+	"""
+	Read the triangles of a model, without any ShowBase.
+	:param model_path: Path of the model file.
+	:return: Array of triangles with shape (T, 3, 3), relative to the origin of the model.
+	"""
+	model = NodePath(Loader.getGlobalPtr().loadSync(Filename.fromOsSpecific(model_path)))
+	triangles = []
+	for geom_path in model.findAllMatches("**/+GeomNode"):
+		matrix = geom_path.getMat(model)
+		for geom in geom_path.node().getGeoms():
+			reader = GeomVertexReader(geom.getVertexData(), "vertex")
+			vertices = []
+			while not reader.isAtEnd():
+				vertices.append(matrix.xformPoint(reader.getData3()))
+			vertices = np.array(vertices, dtype=float).reshape(-1, 3)
+			for primitive in geom.decompose().getPrimitives():
+				indices = np.array([primitive.getVertex(i) for i in range(primitive.getNumVertices())], dtype=np.intp)
+				triangles.append(vertices[indices.reshape(-1, 3)])
+	return np.concatenate(triangles) if triangles else np.zeros((0, 3, 3))
+
+
+def _dot(a, b):
+	return np.einsum("ij,ij->i", a, b)
+
+
+def _box_distances(points, lower, upper):
+	"""
+	Distances of points to axis aligned boxes, zero within a box.
+	"""
+	return np.linalg.norm(np.maximum(np.maximum(lower - points, points - upper), 0), axis=1)
+
+
+def _box_sdf(points, centers, halves):
+	"""
+	Signed distances of points to boxes and the directions pointing away from them.
+	"""
+	offsets = points - centers
+	signs = np.where(offsets < 0, -1., 1.)
+	excess = np.abs(offsets) - halves
+	outside = np.maximum(excess, 0)
+	lengths = np.linalg.norm(outside, axis=1)
+	inner = excess.max(axis=1)
+
+	# Outside the direction points from the closest point on the box, inside out through the closest face
+	face = np.zeros_like(offsets)
+	face[np.arange(len(points)), excess.argmax(axis=1)] = 1
+	directions = np.where((lengths > 0)[:, None], outside / np.maximum(lengths, 1e-9)[:, None], face) * signs
+	return lengths + np.minimum(inner, 0), directions
+
+
+def _cylinder_sdf(points, centers, radii, halves):
+	"""
+	Signed distances of points to upright cylinders and the directions pointing away from them.
+	"""
+	offsets = points - centers
+	radial = np.linalg.norm(offsets[:, :2], axis=1)
+	outward = np.zeros_like(offsets)
+	outward[:, 0] = 1  # Any direction will do on the axis
+	on_axis = radial > 1e-9
+	outward[on_axis, :2] = offsets[on_axis, :2] / radial[on_axis, None]
+	upward = np.zeros_like(offsets)
+	upward[:, 2] = np.where(offsets[:, 2] < 0, -1, 1)
+
+	excess = np.stack((radial - radii, np.abs(offsets[:, 2]) - halves), axis=1)
+	outside = np.maximum(excess, 0)
+	lengths = np.linalg.norm(outside, axis=1)
+	directions = outward * outside[:, :1] + upward * outside[:, 1:]
+	directions = np.where((lengths > 0)[:, None], directions / np.maximum(lengths, 1e-9)[:, None],
+		np.where((excess[:, 0] > excess[:, 1])[:, None], outward, upward))
+	return lengths + np.minimum(excess.max(axis=1), 0), directions
+
+
+def _triangle_distances(points, triangles):
+	"""
+	Distances of points to triangles and the directions pointing away from them, following the closest point on a
+	triangle by its Voronoi regions.
+	"""
+	a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+	ab, ac = b - a, c - a
+	d1, d2 = _dot(ab, points - a), _dot(ac, points - a)
+	d3, d4 = _dot(ab, points - b), _dot(ac, points - b)
+	d5, d6 = _dot(ab, points - c), _dot(ac, points - c)
+	va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+	def ratio(numerator, denominator):
+		return (numerator / np.where(np.abs(denominator) > 1e-12, denominator, 1))[:, None]
+
+	# Regions from the least to the most important one, later regions overwrite earlier ones
+	total = va + vb + vc
+	closest = a + ab * ratio(vb, total) + ac * ratio(vc, total)
+	region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+	closest = np.where(region[:, None], b + (c - b) * ratio(d4 - d3, (d4 - d3) + (d5 - d6)), closest)
+	region = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+	closest = np.where(region[:, None], a + ac * ratio(d2, d2 - d6), closest)
+	closest = np.where(((d6 >= 0) & (d5 <= d6))[:, None], c, closest)
+	region = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+	closest = np.where(region[:, None], a + ab * ratio(d1, d1 - d3), closest)
+	closest = np.where(((d3 >= 0) & (d4 <= d3))[:, None], b, closest)
+	closest = np.where(((d1 <= 0) & (d2 <= 0))[:, None], a, closest)
+
+	offsets = points - closest
+	distances = np.linalg.norm(offsets, axis=1)
+	normals = np.cross(ab, ac)
+	normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-9)
+	directions = np.where((distances > 1e-9)[:, None], offsets / np.maximum(distances, 1e-9)[:, None], normals)
+	return distances, directions
+
+
+def _segment_box_hits(starts, ends, lower, upper):
+	"""
+	Check if segments run through axis aligned boxes, with the slab method.
+	"""
+	steps = ends - starts
+	with np.errstate(divide="ignore", invalid="ignore"):
+		first = (lower - starts) / steps
+		second = (upper - starts) / steps
+	parallel = steps == 0
+	within = (starts >= lower) & (starts <= upper)
+	entries = np.where(parallel, np.where(within, -np.inf, np.inf), np.minimum(first, second)).max(axis=1)
+	exits = np.where(parallel, np.where(within, np.inf, -np.inf), np.maximum(first, second)).min(axis=1)
+	return (entries <= exits) & (exits >= 0) & (entries <= 1)
+
+
+def _segment_cylinder_hits(starts, ends, centers, radii, halves):
+	"""
+	Check if segments run through upright cylinders: the part of the segment within the radius has to overlap the part
+	within the height.
+	"""
+	steps = ends - starts
+	offsets = starts - centers
+
+	# Part within the radius, from the quadratic equation of the distance to the axis
+	a = (steps[:, :2] ** 2).sum(axis=1)
+	b = 2 * (steps[:, :2] * offsets[:, :2]).sum(axis=1)
+	c = (offsets[:, :2] ** 2).sum(axis=1) - radii ** 2
+	root = np.sqrt(np.maximum(b ** 2 - 4 * a * c, 0))
+	vertical = a < 1e-12
+	safe_a = np.where(vertical, 1, 2 * a)
+	radial_in = np.where(vertical, np.where(c <= 0, -np.inf, np.inf), (-b - root) / safe_a)
+	radial_out = np.where(vertical, np.where(c <= 0, np.inf, -np.inf), (-b + root) / safe_a)
+	radial_out = np.where(~vertical & (b ** 2 - 4 * a * c < 0), -np.inf, radial_out)
+
+	# Part within the height
+	flat = np.abs(steps[:, 2]) < 1e-12
+	safe_step = np.where(flat, 1, steps[:, 2])
+	first, second = (-halves - offsets[:, 2]) / safe_step, (halves - offsets[:, 2]) / safe_step
+	level = np.abs(offsets[:, 2]) <= halves
+	height_in = np.where(flat, np.where(level, -np.inf, np.inf), np.minimum(first, second))
+	height_out = np.where(flat, np.where(level, np.inf, -np.inf), np.maximum(first, second))
+
+	entries = np.maximum(np.maximum(radial_in, height_in), 0)
+	exits = np.minimum(np.minimum(radial_out, height_out), 1)
+	return entries <= exits
+
+
+def _segment_triangle_hits(starts, ends, triangles):
+	"""
+	Check if segments run through triangles, with the Möller-Trumbore intersection.
+	"""
+	steps = ends - starts
+	edge1 = triangles[:, 1] - triangles[:, 0]
+	edge2 = triangles[:, 2] - triangles[:, 0]
+	h = np.cross(steps, edge2)
+	determinants = _dot(edge1, h)
+	valid = np.abs(determinants) > 1e-12
+	inverse = 1 / np.where(valid, determinants, 1)
+
+	offsets = starts - triangles[:, 0]
+	u = _dot(offsets, h) * inverse
+	q = np.cross(offsets, edge1)
+	v = _dot(steps, q) * inverse
+	t = _dot(edge2, q) * inverse
+	return valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
@@ -0,0 +1,219 @@
+# Load classes from other files
+from controller import SwarmState
+from point_mass import PointMassWorld
+from point_mass import integrate
+from point_mass import resolve_contacts
+from spatial_index import neighbour_pairs
+
+# Import needed modules
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Arrays in the shared memory besides the storage of the world, the inputs of the controller and the results of a step
+_SHARED_ARRAYS = dict(PointMassWorld.ARRAYS, targets=(3,), avoidance_vectors=(3,), wall_forces=(3,),
+	next_positions=(3,), next_velocities=(3,), applied_forces=(3,))
+
+
+def _shared_views(buffer, capacity, workers):
+	"""
+	Create the numpy views of all shared arrays on the shared memory.
+	:return: Dictionary of the views by name, with the boundaries of the regions and the axis they are split along.
+	"""
+	views = {}
+	offset = 0
+	for name, shape in _SHARED_ARRAYS.items():
+		views[name] = np.ndarray((capacity,) + shape, dtype=np.float64, buffer=buffer, offset=offset)
+		offset += views[name].nbytes
+	views["boundaries"] = np.ndarray(workers - 1, dtype=np.float64, buffer=buffer, offset=offset)
+	views["axis"] = np.ndarray(1, dtype=np.int64, buffer=buffer, offset=offset + 8 * (workers - 1))
+	return views
+
+
+def _shared_size(capacity, workers):
+	"""
+	Size of the shared memory in bytes.
+	"""
+	return sum(capacity * int(np.prod(shape)) * 8 for shape in _SHARED_ARRAYS.values()) + 8 * workers
+
+
+def _run_worker(number, controller, memory_name, capacity, workers, neighbour_radius, connection):
+	"""
+	Main function of a worker process: steps the drones of its region whenever the amount of drones, the time step, the
+	gravity and the width of the halo are received.
+	"""
+	memory = shared_memory.SharedMemory(name=memory_name)
+	views = _shared_views(memory.buf, capacity, workers)
+	gravity = np.zeros(3)
+	connection.send(True)  # Ready
+
+	while True:
+		message = connection.recv()
+		if message is None:
+			break
+		amount, dt, gravity[:], halo = message
+
+		# Drones owned by this region first, then the halo of the neighbouring regions around it
+		coordinates = views["positions"][:amount, views["axis"][0]]
+		lower = views["boundaries"][number - 1] if number > 0 else -np.inf
+		upper = views["boundaries"][number] if number < workers - 1 else np.inf
+		owned = np.flatnonzero((coordinates >= lower) & (coordinates < upper))
+		near = np.flatnonzero(((coordinates >= lower - halo) & (coordinates < lower)) |
+			((coordinates >= upper) & (coordinates < upper + halo)))
+		rows = np.concatenate((owned, near))
+
+		# The same step as the PointMassWorld with a controller, for the rows of this region only
+		positions = views["positions"][rows]
+		velocities = views["velocities"][rows]
+		state = SwarmState(positions, velocities, views["targets"][rows], views["avoidance_vectors"][rows],
+			views["wall_forces"][rows], neighbour_radius)
+		forces = controller.compute(state) + views["forces"][rows]
+		views["applied_forces"][owned] = forces[:len(owned)]  # Integrating clears the forces
+		inverse_masses, radii = views["inverse_masses"][rows], views["radii"][rows]
+		integrate(positions, velocities, forces, inverse_masses, views["damping"][rows], gravity, dt)
+		if len(rows) > 0:
+			i, j = neighbour_pairs(positions, 2 * radii.max())
+			resolve_contacts(positions, velocities, inverse_masses, radii, i, j)
+
+		# Only the owned drones are written back, the halo drones belong to the neighbours
+		views["next_positions"][owned] = positions[:len(owned)]
+		views["next_velocities"][owned] = velocities[:len(owned)]
+		connection.send(len(owned))
+
+	views = None
+	memory.close()
+
+
+class PartitionedWorld(PointMassWorld):
+	"""
+	A PointMassWorld split into regions along the longest extent of the swarm, every region is stepped by its own worker
+	process, so large swarms are simulated on all cores.
+
+	The whole state lives in shared memory. Every step the boundaries of the regions are moved so every region holds
+	the same amount of drones, then every worker computes the forces of the drones in its region with the controller
+	and integrates them. Drones within a halo around the region are read from the neighbouring regions and stepped
+	along, so forces and contacts at the boundaries are the same as without regions, but only the drones of the region
+	itself are written back. The process of the simulation stays the coordinator: it hands the targets to the workers
+	and renders and sends the merged state of all regions.
+	"""
+
+	CAPACITY = 16384  # Maximum amount of drones
+	HALO_MARGIN = .1  # Additional width of the halo, for drones moving towards the region within a step
+
+	def __init__(self, controller, neighbour_radius, workers=None, capacity=CAPACITY, gravity=(0, 0, 0)):
+		"""
+		Start the worker processes.
+		:param controller: Controller computing the forces of the drones, has to be picklable.
+		:param neighbour_radius: Radius to find the neighbours of a drone within, as in SwarmState.
+		:param workers: Amount of worker processes, one per core by default.
+		:param capacity: Maximum amount of drones.
+		:param gravity: Acceleration acting on all bodies.
+		"""
+		self.capacity = capacity
+		self.workers = workers or os.cpu_count() or 1
+		self.memory = shared_memory.SharedMemory(create=True, size=_shared_size(capacity, self.workers))
+		self.views = _shared_views(self.memory.buf, capacity, self.workers)
+		super().__init__(gravity)
+
+		self.neighbour_radius = neighbour_radius
+
+		context = multiprocessing.get_context("spawn")
+		self.connections = []
+		self.processes = []
+		for number in range(self.workers):
+			connection, child_connection = context.Pipe()
+			process = context.Process(target=_run_worker, daemon=True, args=(number, controller, self.memory.name,
+				capacity, self.workers, neighbour_radius, child_connection))
+			process.start()
+			self.connections.append(connection)
+			self.processes.append(process)
+
+		# Workers import their modules first, so the first step would take long otherwise
+		for connection in self.connections:
+			connection.recv()
+
+	def _resize(self, capacity):
+		"""
+		Use the shared memory as storage, it can not grow.
+		"""
+		if self.storage:
+			raise ValueError("Partitioned world only holds {} drones".format(self.capacity))
+		self.storage = {name: self.views[name] for name in self.ARRAYS}
+		self._update_views()
+
+	def attach(self, node, mass, radius, damping):
+		"""
+		Add a body at the position of its node, it stays there until the first inputs are set.
+		"""
+		body = super().attach(node, mass, radius, damping)
+		self.views["targets"][body.index] = self.positions[body.index]
+		self.views["avoidance_vectors"][body.index] = 0
+		self.views["wall_forces"][body.index] = 0
+		return body
+
+	def set_inputs(self, targets, avoidance_vectors, wall_forces):
+		"""
+		Hand the inputs of the controller to the workers, once every update before the step.
+		:param targets: Targets of all drones, shape (N, 3).
+		:param avoidance_vectors: Avoidance vectors of all drones, shape (N, 3).
+		:param wall_forces: Forces to stay away from walls of all drones, shape (N, 3).
+		"""
+		self.views["targets"][:self.amount] = targets
+		self.views["avoidance_vectors"][:self.amount] = avoidance_vectors
+		self.views["wall_forces"][:self.amount] = wall_forces
+
+	@property
+	def applied_forces(self):
+		"""
+		Forces the workers applied to all drones in the last step, including those of the controller.
+		"""
+		return self.views["applied_forces"][:self.amount].copy()
+
+	def doPhysics(self, dt):
+		"""
+		Let all workers advance their regions by a time step and merge the results.
+		:param dt: Length of the time step.
+		"""
+		if self.amount == 0 or dt <= 0:
+			return
+
+		self._balance()
+
+		# A halo wide enough that every drone within a contact of an owned drone has all of its neighbours
+		halo = self.neighbour_radius + 2 * self.radii.max() + self.HALO_MARGIN
+		for connection in self.connections:
+			connection.send((self.amount, dt, self.gravity, halo))
+		owned = sum(connection.recv() for connection in self.connections)
+		if owned != self.amount:
+			raise RuntimeError("Regions stepped {} of {} drones".format(owned, self.amount))
+
+		self.positions[:] = self.views["next_positions"][:self.amount]
+		self.velocities[:] = self.views["next_velocities"][:self.amount]
+		self.forces[:] = 0
+
+	def _balance(self):
+		"""
+		Split the swarm along its longest extent, with the same amount of drones in every region.
+		"""
+		axis = int(np.argmax(np.ptp(self.positions, axis=0)))
+		self.views["axis"][0] = axis
+		if self.workers > 1:
+			shares = np.arange(1, self.workers) / self.workers
+			self.views["boundaries"][:] = np.quantile(self.positions[:, axis], shares)
+
+	def close(self):
+		"""
+		Stop the worker processes and release the shared memory.
+		"""
+		for connection, process in zip(self.connections, self.processes):
+			if process.is_alive():
+				connection.send(None)
+				process.join(1)
+		self.positions = self.velocities = self.forces = self.inverse_masses = self.radii = self.damping = None
+		self.storage = {}
+		self.views = None
+		self.memory.close()
+		self.memory.unlink()
@@ -0,0 +1,297 @@
+# Load  Panda3D modules
+from panda3d.bullet import BulletPlaneShape
+from panda3d.bullet import BulletRigidBodyNode
+from panda3d.bullet import BulletSphereShape
+from panda3d.bullet import BulletWorld
+from panda3d.core import LPoint3f
+from panda3d.core import LVector3f
+from panda3d.core import NodePath
+
+# Load classes from other files
+from controller import DefaultController
+from controller import SwarmState
+from spatial_index import neighbour_pairs
+
+# Import needed modules
+import numpy as np
+
+
+class PointMassBody:
+	"""
+	A single body of a PointMassWorld, a row of its arrays.
+	Its methods are named as those of BulletRigidBodyNode, so the drones use either kind of body the same way.
+	"""
+
+	def __init__(self, world, index, node):
+		"""
+		:param world: The world the body belongs to.
+		:param index: Row of the body in the arrays of the world.
+		:param node: Node moved along with the body once the world syncs its nodes.
+		"""
+		self.world = world
+		self.index = index
+		self.node = node
+
+	def getPos(self):
+		return LPoint3f(*self.world.positions[self.index])
+
+	def setPos(self, position):
+		self.world.positions[self.index] = (position[0], position[1], position[2])
+		self.node.setPos(position)
+
+	def getLinearVelocity(self):
+		return LVector3f(*self.world.velocities[self.index])
+
+	def setLinearVelocity(self, velocity):
+		self.world.velocities[self.index] = (velocity[0], velocity[1], velocity[2])
+
+	def getAngularVelocity(self):
+		return LVector3f(0, 0, 0)  # Point masses do not rotate
+
+	def setAngularVelocity(self, velocity):
+		pass
+
+	def applyCentralForce(self, force):
+		self.world.forces[self.index] += (force[0], force[1], force[2])
+
+	def getTotalForce(self):
+		return LVector3f(*self.world.forces[self.index])
+
+	def clearForces(self):
+		self.world.forces[self.index] = 0
+
+
+class PointMassWorld:
+	"""
+	Dynamics of damped spheres without rotation, integrated for all bodies at once, as a faster alternative to Bullet.
+
+	The integration follows Bullet: semi-implicit Euler with the same damping, so the drones fly the same way with
+	either world. Contacts are simple: overlapping spheres are pushed apart and lose the velocity towards each other,
+	bodies below the ground are put back onto it. Positions live in the arrays of the world, the nodes of the bodies are
+	only moved by sync_nodes, e.g. right before a frame is rendered.
+	"""
+
+	INITIAL_CAPACITY = 64  # Rows of the arrays before they have to grow
+	ARRAYS = {"positions": (3,), "velocities": (3,), "forces": (3,), "inverse_masses": (), "radii": (), "damping": ()}
+
+	def __init__(self, gravity=(0, 0, 0)):
+		"""
+		:param gravity: Acceleration acting on all bodies.
+		"""
+		self.gravity = np.asarray(gravity, dtype=float)
+		self.amount = 0
+		self.bodies = []
+		self.storage = {}  # Arrays of all rows, the arrays of the bodies in use (e.g. positions) are views on them
+		self._resize(self.INITIAL_CAPACITY)
+
+	def _resize(self, capacity):
+		"""
+		Grow the arrays to a new capacity.
+		"""
+		for name, shape in self.ARRAYS.items():
+			grown = np.zeros((capacity,) + shape)
+			if name in self.storage:
+				grown[:self.amount] = self.storage[name][:self.amount]
+			self.storage[name] = grown
+		self._update_views()
+
+	def _update_views(self):
+		"""
+		Let the public arrays show the rows of the bodies in use only.
+		"""
+		for name, array in self.storage.items():
+			setattr(self, name, array[:self.amount])
+
+	def attach(self, node, mass, radius, damping):
+		"""
+		Add a body at the position of its node.
+		:param node: Node moved along with the body.
+		:param mass: Mass of the body.
+		:param radius: Radius of the sphere of the body.
+		:param damping: Linear damping as in Bullet, the fraction of the velocity lost per second.
+		:return: The new PointMassBody.
+		"""
+		if self.amount == len(self.storage["positions"]):
+			self._resize(2 * self.amount)
+
+		index = self.amount
+		self.amount += 1
+		self._update_views()
+		position = node.getPos()
+		self.positions[index] = (position.x, position.y, position.z)
+		self.velocities[index] = 0
+		self.forces[index] = 0
+		self.inverse_masses[index] = 1 / mass
+		self.radii[index] = radius
+		self.damping[index] = damping
+
+		body = PointMassBody(self, index, node)
+		self.bodies.append(body)
+		return body
+
+	def remove(self, body):
+		"""
+		Remove a body, the last body takes its row.
+		"""
+		last = self.amount - 1
+		if body.index != last:
+			moved = self.bodies[last]
+			for array in self.storage.values():
+				array[body.index] = array[last]
+			moved.index = body.index
+			self.bodies[body.index] = moved
+		self.bodies.pop()
+		self.amount -= 1
+		self._update_views()
+
+	def doPhysics(self, dt):
+		"""
+		Advance all bodies by a time step and clear the forces afterwards, as Bullet does.
+		:param dt: Length of the time step.
+		"""
+		if self.amount == 0 or dt <= 0:
+			return
+
+		integrate(self.positions, self.velocities, self.forces, self.inverse_masses, self.damping, self.gravity, dt)
+		i, j = neighbour_pairs(self.positions, 2 * self.radii.max())
+		resolve_contacts(self.positions, self.velocities, self.inverse_masses, self.radii, i, j)
+
+	def sync_nodes(self):
+		"""
+		Move the nodes of all bodies to the positions of the bodies.
+		"""
+		for body, position in zip(self.bodies, self.positions.tolist()):
+			body.node.setPos(*position)
+
+
+def integrate(positions, velocities, forces, inverse_masses, damping, gravity, dt):
+	"""
+	Advance bodies by a time step in place and clear their forces afterwards, as Bullet does.
+	Works on any leading shape of the arrays, e.g. (N, 3) or (K, N, 3) with (N,) or (K, N) for the per body values.
+	:param dt: Length of the time step.
+	"""
+	# Semi-implicit Euler as in Bullet: damp the velocities, add the forces, then move with the new velocities
+	velocities *= ((1 - damping) ** dt)[..., None]
+	velocities += (forces * inverse_masses[..., None] + gravity) * dt
+	positions += velocities * dt
+	forces[:] = 0
+
+
+def resolve_contacts(positions, velocities, inverse_masses, radii, i, j):
+	"""
+	Separate overlapping spheres and keep all bodies above the ground, in place.
+	:param positions: Array of positions with shape (N, 3).
+	:param velocities: Array of velocities with shape (N, 3).
+	:param inverse_masses: Array of inverse masses with shape (N,).
+	:param radii: Array of radii with shape (N,).
+	:param i: First indices of the pairs of bodies that may touch, e.g. from spatial_index.neighbour_pairs.
+	:param j: Second indices of the pairs of bodies that may touch.
+	"""
+	unique = i < j
+	i, j = i[unique], j[unique]
+	if len(i) > 0:
+		offsets = positions[j] - positions[i]
+		distances = np.linalg.norm(offsets, axis=1)
+		overlaps = radii[i] + radii[j] - distances
+		touching = overlaps > 0
+		i, j, offsets, distances, overlaps = i[touching], j[touching], offsets[touching], distances[touching], \
+			overlaps[touching]
+
+		normals = offsets / np.maximum(distances, 1e-9)[:, None]
+		inverse_i, inverse_j = inverse_masses[i][:, None], inverse_masses[j][:, None]
+		shares = 1 / np.maximum(inverse_i + inverse_j, 1e-9)
+
+		# Push apart, the lighter body more
+		corrections = normals * (overlaps[:, None] * shares)
+		np.add.at(positions, i, -corrections * inverse_i)
+		np.add.at(positions, j, corrections * inverse_j)
+
+		# Remove the velocity towards each other, without bouncing
+		approach = np.einsum("ij,ij->i", velocities[j] - velocities[i], normals)[:, None]
+		impulses = normals * (np.minimum(approach, 0) * shares)
+		np.add.at(velocities, i, impulses * inverse_i)
+		np.add.at(velocities, j, -impulses * inverse_j)
+
+	below = positions[:, 2] < radii
+	positions[below, 2] = radii[below]
+	velocities[below, 2] = np.maximum(velocities[below, 2], 0)
+
+
+def validate(amount=50, seconds=10, dt=1 / 60, seed=0):
+	"""
+	Fly the same swarm with Bullet and with a PointMassWorld and compare the positions.
+	The swarm flies from random positions to random targets with the default control law, as the drones do.
+	:param amount: Amount of drones.
+	:param seconds: Simulated time.
+	:param dt: Time step of both worlds, a fixed step of Bullet.
+	:param seed: Seed of the random positions and targets.
+	:return: Tuple of the largest distance between the positions of a drone in both worlds and the mean distance of the
+	drones to their targets at the end, with Bullet and with point masses. Once drones touch, small differences of
+	the contacts grow, so then only the distances to the targets should be alike.
+	"""
+	# Constants of the drones, not imported to keep the model loading of the drone class out of here
+	mass, radius, damping = .5, .1, .95
+	controller = DefaultController(1, .5, 10, .6)
+
+	random = np.random.default_rng(seed)
+	starts = random.uniform((-2, -2, radius), (2, 2, 2), (amount, 3))
+	targets = random.uniform((-2, -2, .5), (2, 2, 2), (amount, 3))
+	avoidance_vectors = random.normal(size=(amount, 3))
+	avoidance_vectors /= np.linalg.norm(avoidance_vectors, axis=1, keepdims=True)
+
+	bullet_world = BulletWorld()
+	ground = BulletRigidBodyNode("Ground")
+	ground.addShape(BulletPlaneShape(LVector3f(0, 0, 1), 0))
+	bullet_world.attachRigidBody(ground)
+	root = NodePath("validation")
+	bullet_nodes = []
+	for start in starts:
+		body = BulletRigidBodyNode("RigidSphere")
+		body.addShape(BulletSphereShape(radius))
+		body.setMass(mass)
+		body.setLinearSleepThreshold(0)
+		body.setFriction(0)
+		body.setLinearDamping(damping)
+		node = root.attachNewNode(body)
+		node.setPos(*start)
+		bullet_world.attachRigidBody(body)
+		bullet_nodes.append(node)
+
+	point_world = PointMassWorld()
+	for start in starts:
+		node = root.attachNewNode("PointMass")
+		node.setPos(*start)
+		point_world.attach(node, mass, radius, damping)
+
+	# Bullet moves the nodes to the positions one step before (it interpolates its motion states with a latency of a
+	# step), so the drones see these positions in the Bullet world and the point masses are given the same delay here
+	deviation = 0
+	point_positions = starts.copy()
+	no_walls = np.zeros((amount, 3))
+	for _ in range(int(seconds / dt)):
+		bullet_positions = np.array([node.getPos() for node in bullet_nodes])
+		bullet_velocities = np.array([node.node().getLinearVelocity() for node in bullet_nodes])
+		deviation = max(deviation, np.linalg.norm(bullet_positions - point_positions, axis=1).max())
+
+		# Both worlds get the forces of their own state
+		state = SwarmState(bullet_positions, bullet_velocities, targets, avoidance_vectors, no_walls, .6)
+		for node, force in zip(bullet_nodes, controller.compute(state)):
+			node.node().applyCentralForce(LVector3f(*force))
+		state = SwarmState(point_positions, point_world.velocities.copy(), targets, avoidance_vectors, no_walls, .6)
+		point_world.forces += controller.compute(state)
+
+		point_positions = point_world.positions.copy()
+		bullet_world.doPhysics(dt, 1, dt)
+		point_world.doPhysics(dt)
+
+	bullet_positions = np.array([node.getPos() for node in bullet_nodes])
+	return deviation, np.linalg.norm(bullet_positions - targets, axis=1).mean(), \
+		np.linalg.norm(point_positions - targets, axis=1).mean()
+
+
+if __name__ == "__main__":
+	# Check the point masses against Bullet, without and with crowded drones that touch each other
+	for amount in (10, 50, 200):
+		deviation, bullet_error, point_error = validate(amount)
+		print("{} drones: largest deviation from Bullet {:.6f}, distance to targets {:.4f} (Bullet {:.4f})".format(
+			amount, deviation, point_error, bullet_error))
@@ -1,5 +1,19 @@
-# Import needed modules
-import cflib.crtp
+# The Crazyflie library takes a while to import, so it is only imported once it is needed
+_cflib_loaded = False
+
+
+def load_cflib():
+	"""
+	Import the Crazyflie library and load the drivers for the radio, if not done before.
+	The fake link (see fake_link.py) is loaded as well, to connect to drones with fake:// URIs without a radio.
+	"""
+	global _cflib_loaded
+	if not _cflib_loaded:
+		import cflib.crtp
+		cflib.crtp.init_drivers(enable_debug_driver=False)
+		import fake_link
+		fake_link.register()
+		_cflib_loaded = True
 
 
 def scan_for_drones(gui):
@@ -8,6 +22,9 @@ def scan_for_drones(gui):
 	All channels from 0 to 125 will be scanned for addresses ranging from 0xE7E7E7E7E0 to 0xE7E7E7E7EF.
 	:param gui: GUI instance to update progress bar and store found drones.
 	"""
+	load_cflib()
+	import cflib.crtp
+
 	# Create list of addresses to scan for
 	address_list = []
 	for i in range(0x0, 0x10):
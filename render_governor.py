@@ -0,0 +1,190 @@
+# Load  Panda3D modules
+from direct.showbase.ShowBaseGlobal import globalClock
+from panda3d.core import ClockObject
+from panda3d.core import Geom
+from panda3d.core import GeomNode
+from panda3d.core import GeomPoints
+from panda3d.core import GeomVertexData
+from panda3d.core import GeomVertexFormat
+from panda3d.direct import throw_new_frame
+
+# Import needed modules
+import time
+
+import numpy as np
+
+
+class RenderGovernor:
+	"""
+	Renders the scene at its own, lower rate than the physics and radio updates run at.
+
+	If rendering takes longer than its budget, the level of detail is lowered: first drones far away from the camera,
+	then all drones are drawn as points instead of models (all points are a single draw call). While neither the
+	camera nor any drone moves, frames are not drawn at all, apart from a redraw every now and then. Frames that are
+	not drawn still handle the events of the window.
+	"""
+
+	PHYSICS_RATE = 100  # Updates per second of all tasks (physics, drones, radio)
+	RENDER_RATE = 30  # Maximum frames rendered per second
+	RENDER_BUDGET = .5 / RENDER_RATE  # Time rendering a frame may take before the level of detail is lowered
+	RECOVER_FRAMES = 30  # Frames well within the budget needed to raise the level of detail again
+	IDLE_REDRAW_INTERVAL = .5  # Seconds between two renders while nothing moves
+	IDLE_EPSILON = 1e-4  # Movements below this do not count as movement
+	FAR_DISTANCE = 4  # Drones further away from the camera are drawn as points first
+	POINT_SIZE = 6  # Size of the points in pixels
+
+	# Levels of detail
+	FULL = 0  # All drones as models
+	FAR_POINTS = 1  # Drones far away as points
+	ALL_POINTS = 2  # All drones as points
+
+	def __init__(self, base, drone_manager):
+		"""
+		:param base: The simulation.
+		:param drone_manager: The drone manager whose drones are drawn.
+		"""
+		self.base = base
+		self.drone_manager = drone_manager
+		self.level = self.FULL
+		self.render_time = 0  # Moving average of the time needed to render a frame
+		self.frames_within_budget = 0
+		self.last_render = 0
+		self.last_camera = None  # Camera matrix of the last rendered frame
+		self.last_positions = np.zeros((0, 3))  # Positions of the drones in the last rendered frame
+		self.frame_requested = False  # If the next frame has to be rendered in any case
+
+		# All drones drawn as points share a single point cloud
+		self.point_data = GeomVertexData("dronePoints", GeomVertexFormat.getV3(), Geom.UHDynamic)
+		self.point_primitive = GeomPoints(Geom.UHDynamic)
+		geom = Geom(self.point_data)
+		geom.addPrimitive(self.point_primitive)
+		point_node = GeomNode("dronePoints")
+		point_node.addGeom(geom)
+		self.point_cloud = base.render.attachNewNode(point_node)
+		self.point_cloud.setRenderModeThickness(self.POINT_SIZE)
+		self.point_cloud.setColor(.9, .9, .9, 1)
+		self.point_cloud.setLightOff()
+
+	def start(self):
+		"""
+		Limit all tasks to the physics rate and replace the render task of Panda3D.
+		"""
+		globalClock.setMode(ClockObject.MLimited)
+		globalClock.setFrameRate(self.PHYSICS_RATE)
+
+		self.base.taskMgr.remove("igLoop")
+		self.base.taskMgr.add(self._render_task, "igLoop", sort=50)
+
+	def _render_task(self, task):
+		"""
+		Render a frame if it is due and anything moved, otherwise only handle the events of the window.
+		"""
+		now = globalClock.getRealTime()
+		if now - self.last_render < 1 / self.RENDER_RATE and not self.frame_requested:
+			self._skip_frame()
+			return task.cont
+
+		positions = self.drone_manager.get_positions()
+		camera = self.base.camera.getMat(self.base.render)
+		idle = self._is_idle(positions, camera) and now - self.last_render < self.IDLE_REDRAW_INTERVAL
+		if idle and not self.frame_requested:
+			self._skip_frame()
+			return task.cont
+
+		self._update_points(positions)
+
+		# Point masses only move their nodes if the frame is actually drawn, headless runs without recording never do
+		if self.drone_manager.point_masses and (self.base.win.isActive() or self.frame_requested):
+			self.base.world.sync_nodes()
+
+		start = time.perf_counter()
+		self.base.graphicsEngine.renderFrame()
+		throw_new_frame()
+		self._update_level(time.perf_counter() - start)
+
+		self.last_render = now
+		self.frame_requested = False
+		self.last_camera = camera
+		self.last_positions = positions
+		return task.cont
+
+	def _skip_frame(self):
+		"""
+		Let the graphics engine handle the events of the window and tick the clock without drawing anything.
+		The engine only draws into active windows, but handles the events of all of them.
+		"""
+		window = self.base.win
+		active = window is not None and window.isActive()
+		if active:
+			window.setActive(False)
+		self.base.graphicsEngine.renderFrame()
+		if active:
+			window.setActive(True)
+
+	def request_frame(self):
+		"""
+		Render the next frame in any case, e.g. because it is captured (see frame_capture.py).
+		"""
+		self.frame_requested = True
+
+	def _is_idle(self, positions, camera):
+		"""
+		Check if neither the camera nor any drone moved since the last rendered frame.
+		"""
+		if self.last_camera is None or not camera.almostEqual(self.last_camera, self.IDLE_EPSILON):
+			return False
+		if positions.shape != self.last_positions.shape:
+			return False
+		return len(positions) == 0 or np.abs(positions - self.last_positions).max() < self.IDLE_EPSILON
+
+	def _update_level(self, render_time):
+		"""
+		Lower the level of detail if rendering is too slow, raise it again once rendering is fast for a while.
+		:param render_time: Time the last frame needed to render.
+		"""
+		self.render_time = .9 * self.render_time + .1 * render_time
+
+		if self.render_time > self.RENDER_BUDGET:
+			self.frames_within_budget = 0
+			if self.level < self.ALL_POINTS:
+				self.level += 1
+				self.render_time = 0
+		elif self.render_time < self.RENDER_BUDGET / 2:
+			self.frames_within_budget += 1
+			if self.frames_within_budget >= self.RECOVER_FRAMES and self.level > self.FULL:
+				self.level -= 1
+				self.frames_within_budget = 0
+
+	def _update_points(self, positions):
+		"""
+		Switch drones between model and point according to the level of detail and update the point cloud.
+		:param positions: Positions of all drones, shape (N, 3).
+		"""
+		drones = self.drone_manager.drones
+
+		if self.level == self.FULL:
+			as_point = np.zeros(len(drones), dtype=bool)
+		elif self.level == self.FAR_POINTS:
+			camera = self.base.camera.getPos(self.base.render)
+			as_point = np.linalg.norm(positions - (camera.x, camera.y, camera.z), axis=1) > self.FAR_DISTANCE
+		else:
+			as_point = np.ones(len(drones), dtype=bool)
+
+		# Only touch the models of drones that changed their representation
+		for i, drone in enumerate(drones):
+			if as_point[i] != drone.drone_model.isHidden():
+				if as_point[i]:
+					drone.drone_model.hide()
+				else:
+					drone.drone_model.show()
+
+		# Write the positions of all point drones into the point cloud
+		points = positions[as_point].astype(np.float32)
+		if self.point_data.getNumRows() != len(points):
+			self.point_data.setNumRows(len(points))
+			self.point_primitive.clearVertices()
+			if len(points) > 0:
+				self.point_primitive.addConsecutiveVertices(0, len(points))
+		if len(points) > 0:
+			view = memoryview(self.point_data.modifyArray(0)).cast("B").cast("f")
+			np.frombuffer(view, dtype=np.float32)[:] = points.ravel()
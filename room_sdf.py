@@ -0,0 +1,57 @@
+# Import needed modules
+import numpy as np
+
+
+class RoomSDF:
+	"""
+	Signed distance field of the room, as the box spanned by the bounds of the room model.
+	The room model only consists of the floor, the edges of the room and the lamp, so its bounds are all there is to
+	the walls. The distance to the closest wall is computed in closed form for all drones at once (positive distances
+	are inside the room, negative ones outside of it).
+	"""
+
+	WALL_SAFETY_MARGIN = .5  # Distance to a wall at which drones start to get pushed away
+	WALL_FORCE_MULTIPLIER = 10  # Allows to change influence of the force applied to stay away from walls
+
+	# Directions pointing away from the walls: the lower x and y walls, the upper x and y walls and the ceiling
+	# The floor is left out on purpose, it is already a bullet plane and drones have to be able to land on it
+	WALL_NORMALS = np.array([[1, 0, 0], [0, 1, 0], [-1, 0, 0], [0, -1, 0], [0, 0, -1]], dtype=float)
+
+	def __init__(self, model):
+		"""
+		:param model: The loaded room model (NodePath), used to get the bounds of the room.
+		"""
+		lower, upper = model.getTightBounds()
+		self.lower = np.array([lower.x, lower.y, lower.z], dtype=np.float32)
+		self.upper = np.array([upper.x, upper.y, upper.z], dtype=np.float32)
+
+	def _walls(self, positions):
+		"""
+		Find the closest wall of multiple positions.
+		:param positions: Array of positions with shape (N, 3).
+		:return: Tuple of the distances to the closest walls with shape (N,) and their numbers in WALL_NORMALS.
+		"""
+		positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+		to_walls = np.concatenate((positions[:, :2] - self.lower[:2], self.upper - positions), axis=1)
+		walls = to_walls.argmin(axis=1)
+		return to_walls[np.arange(len(positions)), walls], walls
+
+	def distance(self, positions):
+		"""
+		Calculate the distance to the closest wall for multiple positions.
+		:param positions: Array of positions with shape (N, 3).
+		:return: Array of distances with shape (N,).
+		"""
+		return self._walls(positions)[0]
+
+	def repulsion(self, positions):
+		"""
+		Calculate the force pushing drones away from walls they are too close to.
+		:param positions: Array of positions with shape (N, 3).
+		:return: Array of forces with shape (N, 3), zero for drones outside of the safety margin.
+		"""
+		distances, walls = self._walls(positions)
+
+		# Force grows linearly the further a drone gets into the safety margin
+		multiplier = np.clip(self.WALL_SAFETY_MARGIN - distances, 0, None) * self.WALL_FORCE_MULTIPLIER
+		return self.WALL_NORMALS[walls] * multiplier[:, np.newaxis]
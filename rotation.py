@@ -0,0 +1,88 @@
+# Import needed modules
+import numpy as np
+
+
+class RotationGroup:
+	"""
+	A constant rotation of some drones around an axis through an origin.
+	"""
+
+	def __init__(self, members, origin, speed, axis):
+		"""
+		:param members: Indices of the drones in this group.
+		:param origin: Point on the rotation axis, either (x, y) for a rotation around Z or (x, y, z).
+		:param speed: Angular speed in degrees per second, mathematically positive around the axis.
+		:param axis: Direction of the rotation axis.
+		"""
+		self.members = np.asarray(members, dtype=np.intp)
+		self.origin = np.zeros(3)
+		self.origin[:len(origin)] = origin
+		self.speed = np.radians(speed)
+		self.axis = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+
+		# Precompute everything for Rodrigues' rotation formula, each tick then only needs one sin and cos per group
+		axis = self.axis
+		self.cross = np.array([
+			[0, -axis[2], axis[1]],
+			[axis[2], 0, -axis[0]],
+			[-axis[1], axis[0], 0]])
+		self.cross_squared = self.cross @ self.cross
+
+	def matrix(self, dt):
+		"""
+		Rotation matrix for a time step.
+		:param dt: Time step in seconds.
+		:return: Rotation matrix with shape (3, 3).
+		"""
+		angle = self.speed * dt
+		return np.eye(3) + np.sin(angle) * self.cross + (1 - np.cos(angle)) * self.cross_squared
+
+
+class RotationEngine:
+	"""
+	Keeps any number of active rotation groups and applies all of them to the targets of the drones at once.
+	"""
+
+	def __init__(self):
+		self.groups = {}  # Active groups by their ID
+		self.next_id = 0  # ID of the next group added
+
+	def add(self, members, origin, speed, axis=(0, 0, 1)):
+		"""
+		Add a new rotation group, see RotationGroup for the parameters.
+		:return: ID of the new group, needed to stop it again.
+		"""
+		group_id = self.next_id
+		self.next_id += 1
+		self.groups[group_id] = RotationGroup(members, origin, speed, axis)
+		return group_id
+
+	def remove(self, group_id=None):
+		"""
+		Stop a single rotation group.
+		:param group_id: ID of the group to stop, None stops all groups.
+		"""
+		if group_id is None:
+			self.groups.clear()
+		else:
+			self.groups.pop(group_id, None)
+
+	def members(self):
+		"""
+		Get the indices of all drones taking part in any rotation.
+		:return: Sorted array of unique indices.
+		"""
+		if not self.groups:
+			return np.zeros(0, dtype=np.intp)
+		return np.unique(np.concatenate([group.members for group in self.groups.values()]))
+
+	def step(self, targets, dt):
+		"""
+		Rotate the targets of all group members by one time step.
+		Drones in multiple groups are rotated by each group one after another.
+		:param targets: Array of targets of all drones with shape (N, 3), changed in place.
+		:param dt: Time step in seconds.
+		"""
+		for group in self.groups.values():
+			members = group.members[group.members < len(targets)]
+			targets[members] = (targets[members] - group.origin) @ group.matrix(dt).T + group.origin
@@ -0,0 +1,168 @@
+# Import needed modules
+import time
+
+import numpy as np
+
+from spatial_index import neighbour_pairs
+
+
+class SafetyMonitor:
+	"""
+	Checks the setpoints of all drones at once before they are sent to the real drones.
+
+	Setpoints are clamped into the room and to a maximum speed. Then the setpoints of all pairs of neighbours are
+	extrapolated over a short horizon with their commanded velocities. If two drones would come closer than the
+	minimum separation while approaching each other, both hold their last setpoint instead, if they are already
+	critically close their rotors have to be stopped.
+
+	The pairs of neighbours are searched within the distance the fastest drone can close within the horizon, so hovering
+	drones only look at their close neighbours. The radius has some extra distance, the pairs are reused until the drones
+	moved or sped up by that much, so the search only runs every few ticks. The pairs are checked in chunks within a
+	time budget per tick, drones whose pairs could not be checked in time hold their setpoints as well, but are counted
+	apart from the drones held for a predicted conflict.
+	"""
+
+	MIN_SEPARATION = .3  # Drones predicted to come closer than this hold their setpoints
+	CRITICAL_SEPARATION = .15  # Drones closer than this get their rotors stopped
+	HORIZON = .5  # Seconds to predict the movement of the drones
+	MAX_SPEED = 1.5  # Maximum speed of the setpoints in units per second
+	WALL_MARGIN = .2  # Minimum distance of the setpoints to the walls and the ceiling
+	SKIN = .3  # Extra distance to search neighbours within, so the neighbours can be reused for a while
+	TIME_BUDGET = .005  # Seconds the whole check may take per tick
+	CHUNK_SIZE = 4096  # Pairs checked at once between two looks at the clock
+
+	def __init__(self, lower, upper):
+		"""
+		:param lower: Lower corner of the room.
+		:param upper: Upper corner of the room.
+		"""
+		self.lower = np.asarray(lower, dtype=float) + self.WALL_MARGIN
+		self.lower[2] = lower[2]  # Drones have to be able to land
+		self.upper = np.asarray(upper, dtype=float) - self.WALL_MARGIN
+		self.last_setpoints = None  # Setpoints that passed the last check
+		self.pairs = None  # Pairs of neighbours (i, j) with i < j, reused while the drones did not move too far
+		self.pair_setpoints = None  # Setpoints the pairs were searched for
+		self.pair_speed = 0  # Speed of the fastest drone when the pairs were searched
+		self.held = np.zeros(0, dtype=bool)  # Drones holding their setpoint for a predicted conflict after the last check
+		self.unchecked = np.zeros(0, dtype=bool)  # Drones holding their setpoint as they were not checked in time
+		self.velocities = np.zeros((0, 3))  # Velocities commanded by the setpoints of the last check
+		self.overruns = 0  # Amount of ticks the time budget was not enough to check all pairs
+
+	@classmethod
+	def from_room(cls, room_sdf):
+		"""
+		Create a monitor keeping the drones within a room.
+		:param room_sdf: The distance field of the room, see room_sdf.py.
+		"""
+		return cls(room_sdf.lower, room_sdf.upper)
+
+	def reset(self):
+		"""
+		Forget the former setpoints, e.g. after the drones landed or the amount of drones changed.
+		"""
+		self.last_setpoints = None
+		self.pairs = None
+
+	def check(self, setpoints, dt):
+		"""
+		Check the setpoints of a tick.
+		:param setpoints: Array of wanted setpoints with shape (N, 3).
+		:param dt: Time since the last check.
+		:return: Tuple of the safe setpoints with shape (N, 3) and the indices of the drones to stop.
+		"""
+		start = time.perf_counter()
+		amount = len(setpoints)
+
+		# Keep the setpoints within the room
+		safe = np.clip(setpoints, self.lower, self.upper)
+		if self.last_setpoints is None or len(self.last_setpoints) != amount:
+			self.last_setpoints = safe.copy()
+
+		# Limit the speed of the setpoints
+		steps = safe - self.last_setpoints
+		lengths = np.linalg.norm(steps, axis=1, keepdims=True)
+		max_step = self.MAX_SPEED * dt
+		steps = np.where(lengths > max_step, steps / np.maximum(lengths, 1e-9) * max_step, steps)
+		safe = self.last_setpoints + steps
+		velocities = steps / max(dt, 1e-6)
+
+		i, j = self._neighbours(safe, np.linalg.norm(velocities, axis=1).max(initial=0))
+
+		held = np.zeros(amount, dtype=bool)
+		unchecked = np.zeros(amount, dtype=bool)
+		stop = np.zeros(amount, dtype=bool)
+		for chunk in range(0, len(i), self.CHUNK_SIZE):
+			first, second = i[chunk:chunk + self.CHUNK_SIZE], j[chunk:chunk + self.CHUNK_SIZE]
+			if chunk > 0 and time.perf_counter() - start > self.TIME_BUDGET:
+				# Out of time, drones not checked are not allowed to move
+				unchecked[i[chunk:]] = True
+				unchecked[j[chunk:]] = True
+				self.overruns += 1
+				break
+
+			# Closest approach of every pair within the horizon, moving with constant velocity
+			offsets = safe[second] - safe[first]
+			relative = velocities[second] - velocities[first]
+			closing = -np.einsum("ij,ij->i", offsets, relative)
+			closest_time = np.clip(closing / np.maximum(np.einsum("ij,ij->i", relative, relative), 1e-9), 0, self.HORIZON)
+			closest = np.linalg.norm(offsets + relative * closest_time[:, None], axis=1)
+
+			# Pairs already moving apart are left alone, holding would keep close drones together forever
+			unsafe = (closing > 0) & (closest < self.MIN_SEPARATION)
+			held[first[unsafe]] = True
+			held[second[unsafe]] = True
+
+			critical = np.linalg.norm(offsets, axis=1) < self.CRITICAL_SEPARATION
+			stop[first[critical]] = True
+			stop[second[critical]] = True
+
+		holding = held | unchecked
+		safe[holding] = self.last_setpoints[holding]
+		velocities[holding] = 0
+		self.last_setpoints = safe
+		self.held = held
+		self.unchecked = unchecked & ~held
+		self.velocities = velocities
+		return safe, np.flatnonzero(stop)
+
+	def _neighbours(self, setpoints, speed):
+		"""
+		Get all pairs of drones that might come closer than the minimum separation within the horizon.
+		:param setpoints: Setpoints of this tick.
+		:param speed: Speed of the fastest drone this tick.
+		:return: Tuple of index arrays (i, j) with i < j.
+		"""
+		# Both drones of a pair moving towards each other use up the extra distance twice, as does a faster speed over the
+		# horizon
+		if self.pairs is not None and len(self.pair_setpoints) == len(setpoints):
+			moved = np.linalg.norm(setpoints - self.pair_setpoints, axis=1).max(initial=0)
+			if moved + max(speed - self.pair_speed, 0) * self.HORIZON < self.SKIN / 2:
+				return self.pairs
+
+		# Only drones closer than this can come closer than the minimum separation within the horizon
+		radius = self.MIN_SEPARATION + 2 * speed * self.HORIZON + self.SKIN
+		i, j = neighbour_pairs(setpoints, radius)
+		unique = i < j
+		self.pairs = i[unique], j[unique]
+		self.pair_setpoints = setpoints.copy()
+		self.pair_speed = speed
+		return self.pairs
+
+
+if __name__ == "__main__":
+	# Two drones closer than the minimum separation have to be able to fly apart, but not towards each other
+	for label, direction in (("separating", 1), ("approaching", -1)):
+		monitor = SafetyMonitor((-5, -5, 0), (5, 5, 3))
+		monitor.check(np.array([[0, 0, 1], [.25, 0, 1]]), .01)
+		monitor.check(np.array([[-.01 * direction, 0, 1], [.25 + .01 * direction, 0, 1]]), .01)
+		print("{} drones 0.25 apart held: {}".format(label, monitor.held.tolist()))
+		assert monitor.held.all() == (direction < 0)
+
+	# A large hovering swarm only has to check its close neighbours and gets through within the time budget
+	grid = np.stack(np.meshgrid(np.arange(10), np.arange(10), np.arange(4), indexing="ij"), axis=-1).reshape(-1, 3) * .7
+	monitor = SafetyMonitor(grid.min(axis=0) - 1, grid.max(axis=0) + 1)
+	for tick in range(10):
+		monitor.check(grid + np.random.default_rng(tick).normal(0, .001, grid.shape), .01)
+	print("{} hovering drones: {} pairs checked, {} held, {} not checked in time".format(
+		len(grid), len(monitor.pairs[0]), monitor.held.sum(), monitor.unchecked.sum()))
+	assert not monitor.held.any()
@@ -0,0 +1,158 @@
+# Import needed modules
+import numpy as np
+
+
+class Selection:
+	"""
+	A set of drones, stored as a sorted array of their indices.
+	Commands of the drone manager take a selection, so commands to a group only cost as much as the group is large.
+	"""
+
+	def __init__(self, indices=()):
+		"""
+		:param indices: Indices of the selected drones, in any order and possibly with duplicates.
+		"""
+		self.indices = np.unique(np.asarray(indices, dtype=np.intp))
+
+	@classmethod
+	def from_mask(cls, mask):
+		"""
+		Create a selection from a boolean mask over all drones.
+		:param mask: Boolean array, True for every selected drone.
+		"""
+		return cls(np.flatnonzero(mask))
+
+	def mask(self, amount):
+		"""
+		Get the selection as a boolean mask.
+		:param amount: Amount of drones the mask should cover, selected drones beyond are left out.
+		:return: Boolean array with shape (amount,).
+		"""
+		mask = np.zeros(amount, dtype=bool)
+		mask[self.indices[self.indices < amount]] = True
+		return mask
+
+	def bitmask(self):
+		"""
+		Get the selection as a compact bitmask, bit i is set if drone i is selected.
+		:return: Bitmask as an integer.
+		"""
+		return sum(1 << int(i) for i in self.indices)
+
+	@classmethod
+	def from_bitmask(cls, bitmask):
+		"""
+		Create a selection from a bitmask, see bitmask().
+		:param bitmask: Bitmask as an integer.
+		"""
+		return cls([i for i in range(bitmask.bit_length()) if bitmask >> i & 1])
+
+	def __len__(self):
+		return len(self.indices)
+
+	def __iter__(self):
+		return iter(self.indices.tolist())
+
+	def __contains__(self, index):
+		position = np.searchsorted(self.indices, index)
+		return position < len(self.indices) and self.indices[position] == index
+
+	def __or__(self, other):
+		return Selection(np.union1d(self.indices, other.indices))
+
+	def __and__(self, other):
+		return Selection(np.intersect1d(self.indices, other.indices, assume_unique=True))
+
+	def __sub__(self, other):
+		return Selection(np.setdiff1d(self.indices, other.indices, assume_unique=True))
+
+	def __repr__(self):
+		return "Selection(" + str(self.indices.tolist()) + ")"
+
+
+class SelectionManager:
+	"""
+	Stores named groups of drones and creates selections by region or predicate.
+	"""
+
+	def __init__(self, drone_manager):
+		"""
+		:param drone_manager: The drone manager whose drones are selected.
+		"""
+		self.drone_manager = drone_manager
+		self.groups = {}  # Named groups of drones as selections
+
+	def resolve(self, drones):
+		"""
+		Convert anything describing a set of drones into a selection.
+		Indices of drones that do not exist raise a ValueError, only groups may contain drones removed since they were
+		defined.
+		:param drones: A selection, the name of a group, a boolean mask or any iterable of indices.
+		:return: The selection, limited to drones that currently exist.
+		"""
+		amount = len(self.drone_manager.drones)
+
+		if isinstance(drones, str):
+			if drones not in self.groups:
+				raise ValueError("Unknown group " + repr(drones))
+			selection = self.groups[drones]
+			return Selection(selection.indices[selection.indices < amount])
+
+		if isinstance(drones, Selection):
+			selection = drones
+		else:
+			drones = np.asarray(drones)
+			selection = Selection.from_mask(drones) if drones.dtype == bool else Selection(drones)
+
+		# Negative indices would silently count from the end, like any index beyond the last drone they are a mistake
+		invalid = selection.indices[(selection.indices < 0) | (selection.indices >= amount)]
+		if len(invalid) > 0:
+			raise ValueError("Drone {} does not exist, there are {} drones".format(invalid[0], amount))
+		return selection
+
+	def all(self):
+		"""
+		Select all drones.
+		"""
+		return Selection(np.arange(len(self.drone_manager.drones)))
+
+	def define_group(self, name, drones):
+		"""
+		Store a selection under a name, so commands can refer to it by that name.
+		:param name: Name of the group, replaces a former group of the same name.
+		:param drones: Anything resolve() takes.
+		"""
+		self.groups[name] = self.resolve(drones)
+
+	def remove_group(self, name):
+		"""
+		Remove a named group.
+		:param name: Name of the group.
+		"""
+		self.groups.pop(name, None)
+
+	def in_region(self, lower, upper):
+		"""
+		Select all drones currently within an axis aligned box.
+		:param lower: Lower corner of the box (x, y, z).
+		:param upper: Upper corner of the box (x, y, z).
+		"""
+		positions = self.drone_manager.get_positions()
+		return Selection.from_mask(np.all((positions >= lower) & (positions <= upper), axis=1))
+
+	def in_sphere(self, centre, radius):
+		"""
+		Select all drones currently within a sphere.
+		:param centre: Centre of the sphere (x, y, z).
+		:param radius: Radius of the sphere.
+		"""
+		positions = self.drone_manager.get_positions()
+		return Selection.from_mask(np.linalg.norm(positions - centre, axis=1) <= radius)
+
+	def where(self, predicate):
+		"""
+		Select all drones a vectorised predicate holds for.
+		:param predicate: Function taking the positions (N, 3) and the targets (N, 3) of all drones and returning a
+		boolean mask with shape (N,).
+		"""
+		return Selection.from_mask(predicate(self.drone_manager.get_positions(), self.drone_manager.get_targets()))
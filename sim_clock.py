@@ -0,0 +1,109 @@
+# Load  Panda3D modules
+from direct.showbase.ShowBaseGlobal import globalClock
+from panda3d.core import ClockObject
+
+
+class SimClock:
+	"""
+	Time of the simulation, owned by the simulator and read by every task that advances the simulation.
+
+	At real time (speed 1) the simulation advances by the time that actually passed, as the drones connected by radio do,
+	but never by more than MAX_FRAME_TIME per frame, so stalls do not make physics jump. The first frame does not advance
+	it at all, the real time before it was spent starting up.
+	At any other speed every frame advances it by a fixed step and the speed only sets how many frames run per second,
+	up to as many as possible, so runs at any speed other than 1 are deterministic (planned formation transitions are
+	waited for instead of applied once ready). While paused the simulation does not advance at all, apart from single
+	steps. Rendering, the camera and the GUI keep their real time in any case.
+
+	Every change of the speed or pause is sent as CHANGED_EVENT, e.g. to stop sending setpoints to the real drones
+	whenever the clock is not at real time.
+	"""
+
+	REAL_TIME = 1  # Speed of real time
+	FASTEST = float("inf")  # Speed to run as many frames as possible
+	CHANGED_EVENT = "simClockChanged"  # Sent whenever the speed or pause changes
+	MAX_FRAME_TIME = .1  # Longest time a single frame advances the simulation at real time
+
+	def __init__(self, messenger, rate):
+		"""
+		:param messenger: Messenger of the simulation, to send the events.
+		:param rate: Frames per second at real time, also the inverse of the fixed step.
+		"""
+		self.messenger = messenger
+		self.rate = rate
+		self.time = 0  # Simulated seconds since the start
+		self.dt = 0  # Simulated seconds of the current frame, 0 while paused
+		self.speed = self.REAL_TIME
+		self.paused = False
+		self.pending_steps = 0  # Single steps still to do while paused
+		self.started = False  # If a frame was ticked already
+
+	@property
+	def real_time(self):
+		"""
+		If the simulation currently runs in real time.
+		"""
+		return self.speed == self.REAL_TIME and not self.paused
+
+	def tick(self, real_dt):
+		"""
+		Advance the clock by a frame, once every frame before any task reads it.
+		:param real_dt: Real seconds since the last frame, clamped to MAX_FRAME_TIME and ignored on the first frame.
+		"""
+		if self.paused:
+			self.dt = 0
+			if self.pending_steps > 0:
+				self.pending_steps -= 1
+				self.dt = 1 / self.rate
+		elif self.speed == self.REAL_TIME:
+			self.dt = min(real_dt, self.MAX_FRAME_TIME) if self.started else 0
+		else:
+			self.dt = 1 / self.rate
+		self.time += self.dt
+		self.started = True
+
+	def pause(self):
+		"""
+		Stop advancing the simulation.
+		"""
+		self.paused = True
+		self._changed()
+
+	def resume(self):
+		"""
+		Advance the simulation again at the current speed.
+		"""
+		self.paused = False
+		self.pending_steps = 0
+		self._changed()
+
+	def step(self, steps=1):
+		"""
+		Pause and advance the simulation by single fixed steps, one per frame.
+		:param steps: Amount of steps.
+		"""
+		self.pending_steps += steps
+		if not self.paused:
+			self.pause()
+
+	def set_speed(self, speed):
+		"""
+		Run the simulation at a multiple of real time.
+		:param speed: Factor of real time, FASTEST for as fast as possible.
+		"""
+		if speed <= 0:
+			raise ValueError("Speed has to be positive, pause the clock instead")
+		self.speed = speed
+		self._changed()
+
+	def _changed(self):
+		"""
+		Limit the frames per second to the speed and tell everyone about the change.
+		While paused, frames run at the rate of real time, so waiting does not take a whole core.
+		"""
+		if self.speed == self.FASTEST and not self.paused:
+			globalClock.setMode(ClockObject.MNormal)
+		else:
+			globalClock.setMode(ClockObject.MLimited)
+			globalClock.setFrameRate(self.rate * (1 if self.paused else self.speed))
+		self.messenger.send(self.CHANGED_EVENT)
@@ -1,5 +1,9 @@
 # This simulation is influenced by the original sim of Florian Swienty.
 
+# Measure the startup from the very beginning
+from startup_timer import StartupTimer
+startup_timer = StartupTimer()
+
 # Load  Panda3D modules
 from direct.showbase.ShowBase import ShowBase
 from direct.showbase.ShowBaseGlobal import globalClock
@@ -8,20 +12,30 @@ from panda3d.core import LVector3f
 from panda3d.core import AntialiasAttrib
 from panda3d.core import DirectionalLight
 from panda3d.core import NativeWindowHandle
+from panda3d.core import loadPrcFileData
 from panda3d.bullet import BulletWorld, BulletPlaneShape, BulletRigidBodyNode, BulletDebugNode
 
-# Load classes from other files
-from handler import Handler
-from camera_control import CameraControl
+# Load classes from other files (GUI classes are only loaded with GUI, see below)
 from drone_manager import DroneManager
+from api_server import ApiServer
+from state_export import StateExporter
+from render_governor import RenderGovernor
+from frame_capture import FrameCapture
+from model_cache import ModelCache
+from convergence import ConvergenceTracker
+from point_mass import PointMassWorld
+from sim_clock import SimClock
+from partitioned_world import PartitionedWorld
+from controller import DefaultController
+from drone import Drone
 
 # Import needed modules
 import sys
-import gi
-import cflib.crtp
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
-from gi.repository import Gdk
+import argparse
+
+import numpy as np
+
+startup_timer.phase("imports")
 
 
 class Simulator(ShowBase):
@@ -31,41 +45,65 @@ class Simulator(ShowBase):
 
 	PANDA_WINDOW_WIDTH = 800  # Width of panda window in GTK
 	PANDA_WINDOW_HEIGHT = 600  # Height of panda window in GTK
+	ROOM_MODEL_PATH = "models/rooms/room_neu.egg"  # Model of the room, its bounds are the walls
+
+	# Engines moving the drones
+	BULLET = "bullet"  # Every drone is a rigid body of Bullet
+	POINT_MASS = "point_mass"  # All drones are point masses integrated at once, see point_mass.py
+	PARTITIONED = "partitioned"  # Point masses split into regions stepped by worker processes, see partitioned_world.py
 
-	def __init__(self):
+	def __init__(self, headless=False, record=None, dynamics=BULLET, workers=None, api_socket=ApiServer.SOCKET_PATH,
+			state_name=StateExporter.NAME):
 		"""
 		Creates the window, loads the scene and models and sets everything up.
+		:param headless: Run without GUI and window, rendering offscreen in software only if frames are recorded.
+		:param record: Video file or directory to record frames into, see frame_capture.py.
+		:param dynamics: Engine moving the drones, BULLET, POINT_MASS or PARTITIONED.
+		:param workers: Amount of worker processes with PARTITIONED dynamics, one per core by default.
+		:param api_socket: Path of the Unix socket of the API, every running simulation needs its own.
+		:param state_name: Name of the shared memory the state is published to, every running simulation needs its own.
 		"""
+		# The simulation has no sound, so do not spend time on opening an audio device
+		loadPrcFileData("", "audio-library-name null")
+
+		if headless:
+			# Software rendering into offscreen buffers, so neither a display nor a graphics card is needed
+			loadPrcFileData("", "window-type offscreen\nload-display p3tinydisplay\ntextures-power-2 none")
+
 		# Initialise panda window
 		ShowBase.__init__(self)
 		self.setBackgroundColor(.1, .1, .1)
 
-		# Setup window
-		wp = WindowProperties()
-		wp.setOrigin(0, 0)
-		wp.setSize(self.PANDA_WINDOW_WIDTH, self.PANDA_WINDOW_HEIGHT)
-
-		# Get drawing area and set its size
-		panda_drawing_area = builder.get_object("pandaDrawingArea")
-		panda_drawing_area.set_size_request(self.PANDA_WINDOW_WIDTH, self.PANDA_WINDOW_HEIGHT)
-
-		# Panda should not open own top level window but use the window of the drawing area in GTK
-		handle = NativeWindowHandle.makeInt(panda_drawing_area.get_property('window').get_xid())
-		wp.setParentWindow(handle)
-
-		# Open panda window
-		self.openDefaultWindow(props=wp)
-
-		def gtk_iteration(task):
-			"""
-			Handles the gtk events and lets as many GUI iterations run as needed.
-			"""
-			while Gtk.events_pending():
-				Gtk.main_iteration_do(False)
-			return task.cont
-
-		# Create task to update GUI
-		self.taskMgr.add(gtk_iteration, "gtk")
+		if headless:
+			# Nothing is shown, the default buffer is not rendered at all
+			self.win.setActive(False)
+		else:
+			# Setup window
+			wp = WindowProperties()
+			wp.setOrigin(0, 0)
+			wp.setSize(self.PANDA_WINDOW_WIDTH, self.PANDA_WINDOW_HEIGHT)
+
+			# Get drawing area and set its size
+			panda_drawing_area = builder.get_object("pandaDrawingArea")
+			panda_drawing_area.set_size_request(self.PANDA_WINDOW_WIDTH, self.PANDA_WINDOW_HEIGHT)
+
+			# Panda should not open own top level window but use the window of the drawing area in GTK
+			handle = NativeWindowHandle.makeInt(panda_drawing_area.get_property('window').get_xid())
+			wp.setParentWindow(handle)
+
+			# Open panda window
+			self.openDefaultWindow(props=wp)
+
+			def gtk_iteration(task):
+				"""
+				Handles the gtk events and lets as many GUI iterations run as needed.
+				"""
+				while Gtk.events_pending():
+					Gtk.main_iteration_do(False)
+				return task.cont
+
+			# Create task to update GUI
+			self.taskMgr.add(gtk_iteration, "gtk")
 
 		# Activate antialiasing (MAuto for automatic selection of AA form)
 		self.render.setAntialias(AntialiasAttrib.MAuto)
@@ -73,18 +111,24 @@ class Simulator(ShowBase):
 		# Deactivate default mouse control of the camera as they are not very helpful
 		self.disableMouse()
 
+		startup_timer.phase("window")
+
 		# Set camera to default position and orientation
 		self.camera.setPos(0, -4, 2)
 		self.camera.lookAt(0, 0, 1)
 		self.camLens.setFov(90)
 
-		# Load the camera control events to control camera by keyboard
-		self.cam_control = CameraControl(self, handler)
-		# Store it as a class variable of the Handler so the controller can be called by it
-		Handler.cam_control = self.cam_control
+		if not headless:
+			# Load the camera control events to control camera by keyboard
+			self.cam_control = CameraControl(self, handler)
+			# Store it as a class variable of the Handler so the controller can be called by it
+			Handler.cam_control = self.cam_control
+
+		# Models are loaded from converted .bam files, which is a lot faster than parsing the .egg files
+		self.model_cache = ModelCache(self.loader)
 
 		# Load scene
-		self.scene = self.loader.loadModel("models/rooms/room_neu.egg")
+		self.scene = self.model_cache.load(self.ROOM_MODEL_PATH)
 		self.scene.reparentTo(self.render)  # Panda3D makes use of a scene graph, where "render" is the parent of the
 		# tree containing all objects to be rendered
 
@@ -96,31 +140,57 @@ class Simulator(ShowBase):
 			dlnp.setHpr((120 * i) + 1, -30, 0)
 			self.render.setLight(dlnp)
 
-		# Create a bullet world (physics engine)
-		self.world = BulletWorld()
-		# self.world.setGravity(LVector3f(0, 0, -9.81))
-		self.world.setGravity(LVector3f(0, 0, 0))  # No gravity for now (makes forces easier to calculate)
+		startup_timer.phase("scene")
+
+		if dynamics == self.POINT_MASS:
+			# Point masses with the same dynamics as the Bullet bodies, for large swarms
+			self.world = PointMassWorld()
+		elif dynamics == self.PARTITIONED:
+			# Point masses stepped on all cores, the workers compute the forces with the control law of the drones
+			self.world = PartitionedWorld(DefaultController.from_drone(Drone), Drone.AVOIDANCE_PROXIMITY_RADIUS, workers)
+		else:
+			# Create a bullet world (physics engine)
+			self.world = BulletWorld()
+			# self.world.setGravity(LVector3f(0, 0, -9.81))
+			self.world.setGravity(LVector3f(0, 0, 0))  # No gravity for now (makes forces easier to calculate)
+
+		# Clock of the simulation, every task advancing the simulation reads its time instead of the real time
+		self.clock = SimClock(self.messenger, RenderGovernor.PHYSICS_RATE)
+
+		def update_clock(task):
+			"""
+			Advances the clock of the simulation before any other task runs.
+			"""
+			self.clock.tick(globalClock.getDt())
+			return task.cont
+
+		self.taskMgr.add(update_clock, "SimClockTask", sort=-50)
+		if not headless:
+			# Store it as a class variable of the Handler so the clock can be controlled by it
+			Handler.sim_clock = self.clock
 
 		def update_bullet(task):
 			"""
 			Invokes the physics engine to update and simulate the next step.
 			"""
-			dt = globalClock.getDt()  # get elapsed time
-			self.world.doPhysics(dt)  # actually update
+			dt = self.clock.dt  # get simulated time of this frame
+			if dt > 0:
+				self.world.doPhysics(dt)  # actually update
 			return task.cont
 
 		# Create task to update physics
 		self.taskMgr.add(update_bullet, 'update_bullet')
 
-		# Set up the ground for the physics engine
-		ground_shape = BulletPlaneShape(LVector3f(0, 0, 1), 0)  # create a collision shape
-		ground_node_bullet = BulletRigidBodyNode('Ground')  # create rigid body
-		ground_node_bullet.addShape(ground_shape)  # add shape to it
+		if dynamics == self.BULLET:
+			# Set up the ground for the physics engine
+			ground_shape = BulletPlaneShape(LVector3f(0, 0, 1), 0)  # create a collision shape
+			ground_node_bullet = BulletRigidBodyNode('Ground')  # create rigid body
+			ground_node_bullet.addShape(ground_shape)  # add shape to it
 
-		ground_node_panda = self.render.attachNewNode(ground_node_bullet)  # attach to panda scene graph
-		ground_node_panda.setPos(0, 0, 0)  # set position
+			ground_node_panda = self.render.attachNewNode(ground_node_bullet)  # attach to panda scene graph
+			ground_node_panda.setPos(0, 0, 0)  # set position
 
-		self.world.attachRigidBody(ground_node_bullet)  # attach to physics world
+			self.world.attachRigidBody(ground_node_bullet)  # attach to physics world
 
 		# Create and activate a debug node for bullet and attach it to the panda scene graph
 		debug_node_bullet = BulletDebugNode('Debug')
@@ -130,52 +200,175 @@ class Simulator(ShowBase):
 		debug_node_bullet.showNormals(True)
 		debug_node_panda = self.render.attachNewNode(debug_node_bullet)
 		# debug_node_panda.show()
-		self.world.setDebugNode(debug_node_panda.node())
-		# Store it as a class variable of the Handler so the debug mode can be switched by it
-		Handler.bullet_debug_node = debug_node_panda
+		if dynamics == self.BULLET:
+			self.world.setDebugNode(debug_node_panda.node())
+		if not headless:
+			# Store it as a class variable of the Handler so the debug mode can be switched by it
+			Handler.bullet_debug_node = debug_node_panda
+
+		startup_timer.phase("physics")
 
 		# Load the class to manage the drones
 		self.drone_manager = DroneManager(self)
-		# Store it as a class variable of the Handler changes can be invoked
-		Handler.drone_manager = self.drone_manager
+		if not headless:
+			# Store it as a class variable of the Handler changes can be invoked
+			Handler.drone_manager = self.drone_manager
 
+		startup_timer.phase("drones")
 
-if __name__ == "__main__":
-	# Load the GTK builder for the GUI
-	builder = Gtk.Builder()
+		# Serve the local API so the simulation can be scripted from other processes
+		self.api_server = ApiServer(self, self.drone_manager, api_socket)
+		self.api_server.start()
+
+		# Publish the state of the swarm to shared memory for other processes, see state_export.py
+		self.drone_manager.state_exporter = StateExporter(state_name)
 
-	# Load GTK GUI
-	builder.add_from_file("layout.glade")
+		# Render at a lower rate than physics and radio, with less detail if rendering gets too slow
+		self.render_governor = RenderGovernor(self, self.drone_manager)
+		self.render_governor.start()
 
-	# Load some custom CSS
-	css_provider = Gtk.CssProvider()
-	css_provider.load_from_path("gui.css")
-	Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+		# Record frames offscreen, e.g. for videos of headless runs
+		self.frame_capture = None
+		if record is not None:
+			self.frame_capture = FrameCapture(self, record)
+			self.frame_capture.start()
 
-	# Connect GUI to program
-	handler = Handler(builder)
-	builder.connect_signals(handler)
+		startup_timer.phase("services")
+
+		def report_startup(task):
+			"""
+			Report the startup times once the first frame is rendered.
+			"""
+			startup_timer.phase("first frame")
+			startup_timer.report()
+			return task.done
+
+		# Runs after the render task of the first frame
+		self.taskMgr.add(report_startup, "ReportStartup", sort=60)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Simulation of a Crazyflie swarm.")
+	parser.add_argument("--headless", action="store_true", help="run without GUI, script it through the API")
+	parser.add_argument("--record", help="video file or directory to record frames into")
+	parser.add_argument("--duration", type=float, help="simulated seconds to run before quitting")
+	parser.add_argument("--speed", type=lambda value: SimClock.FASTEST if value == "max" else float(value),
+		help="multiple of real time to run at, max for as fast as possible, disables the radio if not 1")
+	parser.add_argument("--api-socket", default=ApiServer.SOCKET_PATH,
+		help="path of the socket of the API, every running simulation needs its own")
+	parser.add_argument("--state-name", default=StateExporter.NAME,
+		help="name of the shared memory the state is published to, every running simulation needs its own")
+	parser.add_argument("--checkpoint", help="checkpoint file to start from, see checkpoint.py")
+	parser.add_argument("--dynamics", choices=(Simulator.BULLET, Simulator.POINT_MASS, Simulator.PARTITIONED),
+		default=Simulator.BULLET, help="engine moving the drones, point masses are a lot faster for large swarms and "
+		"partitioned point masses use all cores")
+	parser.add_argument("--workers", type=int, help="worker processes of partitioned dynamics, one per core by default")
+	parser.add_argument("--obstacles", help="obstacle file to load into the room, see obstacles.py")
+	parser.add_argument("--metrics", help="file to record the metrics of the swarm into, see swarm_metrics.py")
+	parser.add_argument("--until-converged", action="store_true", help="quit once all drones reached new targets (or their targets, if started away from them)")
+	arguments = parser.parse_args()
 
 	# Function to call when program is supposed to quit
 	def close_app(*args, **kw):
 		# Gtk.main_quit()  # actually not needed as no main loop is running (gtk_main_iteration_do is used)
 
 		# Stop and disconnect all drones immediately
-		handler.onStopRotorsPress(None)
-		handler.onDisconnectPress(None)
+		if not arguments.headless:
+			handler.onStopRotorsPress(None)
+			handler.onDisconnectPress(None)
+
+		# Write the remaining frames of a recording
+		if app.frame_capture is not None:
+			app.frame_capture.stop()
+
+		# Remove the socket of the API and the shared memory
+		app.api_server.stop()
+		app.drone_manager.state_exporter.close()
+
+		# Write the remaining metrics
+		app.drone_manager.stop_recording_metrics()
+
+		# Stop the workers of partitioned dynamics
+		if isinstance(app.world, PartitionedWorld):
+			app.world.close()
 
 		# Exit
 		sys.exit(0)
 
-	# Main GUI code
-	window = builder.get_object("main")
-	window.connect("destroy", close_app)
-	window.show_all()
+	if not arguments.headless:
+		# GTK and the GUI classes are only needed with GUI
+		import gi
+		gi.require_version('Gtk', '3.0')
+		from gi.repository import Gtk
+		from gi.repository import Gdk
+		from handler import Handler
+		from camera_control import CameraControl
+
+		# Load the GTK builder for the GUI
+		builder = Gtk.Builder()
+
+		# Load GTK GUI
+		builder.add_from_file("layout.glade")
 
-	# Load the drivers for the radio
-	cflib.crtp.init_drivers(enable_debug_driver=False)
+		# Load some custom CSS
+		css_provider = Gtk.CssProvider()
+		css_provider.load_from_path("gui.css")
+		Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+
+		# Connect GUI to program
+		handler = Handler(builder)
+		builder.connect_signals(handler)
+
+		# Main GUI code
+		window = builder.get_object("main")
+		window.connect("destroy", close_app)
+		window.show_all()
+
+		startup_timer.phase("GUI")
+
+	# The radio drivers are only loaded once real drones are used, see reality_manager.py
 
 	# Start the simulation
-	app = Simulator()
-	app.run()
+	app = Simulator(arguments.headless, arguments.record, arguments.dynamics, arguments.workers, arguments.api_socket,
+		arguments.state_name)
+	if arguments.obstacles is not None:
+		app.drone_manager.load_obstacles(arguments.obstacles)
+	if arguments.checkpoint is not None:
+		app.drone_manager.load_checkpoint(arguments.checkpoint)
+	if arguments.metrics is not None:
+		app.drone_manager.record_metrics(arguments.metrics)
+	if arguments.speed is not None:
+		app.clock.set_speed(arguments.speed)
+	if arguments.duration is not None:
+		def check_duration(task):
+			"""
+			Quits once the simulation ran for the duration, in simulated seconds.
+			"""
+			if app.clock.time >= arguments.duration:
+				close_app()
+			return task.cont
+
+		app.taskMgr.add(check_duration, "CloseTask", sort=-40)
+	if arguments.until_converged:
+		# The drones start at their targets, so only wait for them once there is anything to converge to
+		start_targets = app.drone_manager.get_targets()
+
+		def arm_until_converged(task):
+			"""
+			Quits once all drones reached their targets, waiting for that only after the targets changed or if the
+			drones are away from their targets.
+			"""
+			targets = app.drone_manager.get_targets()
+			away = np.linalg.norm(app.drone_manager.get_positions() - targets, axis=1) >= \
+				ConvergenceTracker.POSITION_TOLERANCE
+			if targets.shape != start_targets.shape or not np.array_equal(targets, start_targets) or away.any():
+				app.accept(ConvergenceTracker.FORMATION_EVENT, close_app)
+				return task.done
+			return task.cont
+
+		app.taskMgr.add(arm_until_converged, "ArmUntilConvergedTask", sort=-40)
+	try:
+		app.run()
+	except KeyboardInterrupt:
+		close_app()
 
@@ -0,0 +1,56 @@
+# Import needed modules
+import itertools
+
+import numpy as np
+
+
+# All 27 offsets to a cell and its neighbouring cells
+_OFFSETS = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+
+def neighbour_pairs(positions, radius):
+	"""
+	Find all pairs of positions closer to each other than a radius, using a uniform grid with the radius as cell size.
+	The cost grows with the amount of positions times the average amount of neighbours, not with the square of it.
+	:param positions: Array of positions with shape (N, 3).
+	:param radius: Maximum distance of two neighbours.
+	:return: Tuple of index arrays (i, j), one entry for every ordered pair of neighbours (both (i, j) and (j, i)).
+	"""
+	amount = len(positions)
+	if amount < 2:
+		return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+	# Cell of every position, shifted so neighbouring cells of all positions are non-negative
+	cells = np.floor(positions / radius).astype(np.int64)
+	cells -= cells.min(axis=0) - 1
+	dims = cells.max(axis=0) + 2
+
+	def keys(cell):
+		return (cell[..., 0] * dims[1] + cell[..., 1]) * dims[2] + cell[..., 2]
+
+	order = np.argsort(keys(cells), kind="stable")
+	sorted_keys = keys(cells)[order]
+
+	first, second = [], []
+	for offset_key in keys(_OFFSETS):
+		# Range of positions in the neighbouring cell for every position, keys are linear so the offset is just added
+		# and the keys searched for stay sorted, which keeps the search cache friendly
+		neighbour_keys = sorted_keys + offset_key
+		start = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+		counts = np.searchsorted(sorted_keys, neighbour_keys, side="right") - start
+
+		total = counts.sum()
+		if total == 0:
+			continue
+		i = np.repeat(order, counts)
+		j = order[np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)]
+		first.append(i)
+		second.append(j)
+
+	i = np.concatenate(first)
+	j = np.concatenate(second)
+
+	# Only keep real neighbours and not the position itself
+	distances = np.linalg.norm(positions[j] - positions[i], axis=1)
+	close = (i != j) & (distances < radius)
+	return i[close], j[close]
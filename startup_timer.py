@@ -0,0 +1,31 @@
+# Import needed modules
+import time
+
+
+class StartupTimer:
+	"""
+	Measures how long the phases of the startup take, to find out what makes the start of the simulation slow.
+	Every phase lasts from the end of the former phase (or the creation of the timer) until it is ended.
+	"""
+
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.last = self.start  # End of the last phase
+		self.phases = []  # (Name, seconds) of every ended phase
+
+	def phase(self, name):
+		"""
+		End the current phase.
+		:param name: Name of the phase.
+		"""
+		now = time.perf_counter()
+		self.phases.append((name, now - self.last))
+		self.last = now
+
+	def report(self):
+		"""
+		Print how long every phase and the whole startup took.
+		"""
+		print("Startup took {:.3f} s".format(self.last - self.start))
+		for name, seconds in self.phases:
+			print("  {:<16} {:7.3f} s".format(name, seconds))
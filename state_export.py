@@ -0,0 +1,236 @@
+# Import needed modules
+import os
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Header of the shared memory: magic number, capacity in drones, amount of slots, process id of the exporter, frames
+# written so far
+HEADER_DTYPE = np.dtype([("magic", "<u4"), ("capacity", "<u4"), ("slots", "<u4"), ("pid", "<u4"), ("written", "<u8")])
+MAGIC = 0x53574152  # "SWAR"
+
+# Flags of a drone
+IN_FLIGHT = 1
+CONNECTED = 2
+
+
+def frame_dtype(capacity):
+	"""
+	Layout of a single frame of the ring buffer.
+	The sequence number is odd while the frame is written, readers have to retry if it is odd or changed while reading.
+	:param capacity: Maximum amount of drones in a frame.
+	"""
+	return np.dtype([
+		("sequence", "<u8"),
+		("frame_time", "<f8"),
+		("amount", "<u4"),
+		("pad", "<u4"),
+		("positions", "<f4", (capacity, 3)),
+		("targets", "<f4", (capacity, 3)),
+		("velocities", "<f4", (capacity, 3)),
+		("flags", "u1", (capacity,))])
+
+
+class StateExporter:
+	"""
+	Publishes the state of the swarm every tick into a ring buffer in shared memory.
+	Other processes can attach to it with a StateReader and read the newest state without any serialisation.
+
+	Once the swarm outgrows the capacity, the memory is replaced by one twice as large under the same name. The old
+	memory is marked as retired first, so readers attach to the new one on their own.
+	"""
+
+	NAME = "swarmulator_state"  # Default name of the shared memory
+	CAPACITY = 1024  # Amount of drones the memory is created for, it grows with the swarm
+	SLOTS = 8  # Amount of frames in the ring buffer
+
+	def __init__(self, name=NAME, capacity=CAPACITY, slots=SLOTS):
+		"""
+		Create the shared memory. A leftover one of the same name is replaced, unless its exporter is still running.
+		"""
+		self.name = name
+		self.slots = slots
+		self._create(capacity)
+
+	def _create(self, capacity):
+		"""
+		Create the shared memory for a capacity.
+		"""
+		size = HEADER_DTYPE.itemsize + self.slots * frame_dtype(capacity).itemsize
+		try:
+			self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+		except FileExistsError:
+			leftover = shared_memory.SharedMemory(name=self.name)
+			pid = int(np.frombuffer(leftover.buf, dtype=HEADER_DTYPE, count=1)["pid"][0])
+			leftover.close()
+			if _is_running(pid):
+				# Attaching registered the memory to be removed once this process exits, it belongs to the other one
+				resource_tracker.unregister(leftover._name, "shared_memory")
+				raise FileExistsError("Shared memory {} is used by the running process {}, choose another name".format(
+					self.name, pid))
+			leftover.unlink()
+			self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+
+		self.header, self.frames = _views(self.memory.buf, capacity, self.slots)
+		self.header["magic"] = MAGIC
+		self.header["capacity"] = capacity
+		self.header["slots"] = self.slots
+		self.header["pid"] = os.getpid()
+		self.header["written"] = 0
+		self.capacity = capacity
+
+	def publish(self, frame_time, positions, targets, velocities, flags):
+		"""
+		Write the state of the swarm into the next slot of the ring buffer.
+		:param frame_time: Time of the frame.
+		:param positions: Array of positions with shape (N, 3).
+		:param targets: Array of targets with shape (N, 3).
+		:param velocities: Array of velocities with shape (N, 3).
+		:param flags: Array of flags with shape (N,), see IN_FLIGHT and CONNECTED.
+		"""
+		amount = len(positions)
+		if amount > self.capacity:
+			self._grow(amount)
+
+		written = int(self.header["written"][0])
+		frame = self.frames[written % self.slots]
+
+		# Mark frame as being written, then write the data and mark it as done
+		sequence = int(frame["sequence"])
+		frame["sequence"] = sequence + 1
+		frame["frame_time"] = frame_time
+		frame["amount"] = amount
+		frame["positions"][:amount] = positions[:amount]
+		frame["targets"][:amount] = targets[:amount]
+		frame["velocities"][:amount] = velocities[:amount]
+		frame["flags"][:amount] = flags[:amount]
+		frame["sequence"] = sequence + 2
+
+		self.header["written"] = written + 1
+
+	def _grow(self, amount):
+		"""
+		Replace the memory by one large enough for an amount of drones, readers attach to the new one once they see
+		that the old one is retired.
+		"""
+		written = int(self.header["written"][0])
+		self.header["magic"] = 0  # Retired
+		self.close()
+		self._create(max(2 * self.capacity, amount))
+		self.header["written"] = written
+
+	def close(self):
+		"""
+		Release and remove the shared memory.
+		"""
+		self.header = self.frames = None
+		self.memory.close()
+		self.memory.unlink()
+
+
+class StateReader:
+	"""
+	Reads the state of the swarm published by a StateExporter in another process.
+	"""
+
+	def __init__(self, name=StateExporter.NAME):
+		"""
+		Attach to the shared memory of an exporter.
+		"""
+		self.name = name
+		self._attach()
+
+	def _attach(self):
+		"""
+		Attach to the current shared memory of the name.
+		"""
+		self.memory = shared_memory.SharedMemory(name=self.name)
+		# Readers must not remove the memory of the exporter when they exit
+		resource_tracker.unregister(self.memory._name, "shared_memory")
+
+		header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=self.memory.buf)
+		if header["magic"][0] != MAGIC:
+			self.memory.close()
+			raise ValueError("Shared memory " + self.name + " does not contain a swarm state")
+		self.capacity = int(header["capacity"][0])
+		self.slots = int(header["slots"][0])
+		self.header, self.frames = _views(self.memory.buf, self.capacity, self.slots)
+
+	@property
+	def written(self):
+		"""
+		Amount of frames published so far, can be used to check for new frames.
+		"""
+		return int(self.header["written"][0])
+
+	def latest(self, retries=100):
+		"""
+		Get a consistent copy of the newest frame.
+		:param retries: How often to retry if the frame is overwritten while reading.
+		:return: Dictionary with frame_time, positions, targets, velocities and flags (arrays of the current amount of
+		drones), or None if nothing was published yet or no consistent frame could be read.
+		"""
+		for _ in range(retries):
+			# The exporter moved to a larger memory, follow it as soon as it exists
+			if self.header["magic"][0] != MAGIC:
+				try:
+					self.close()
+					self._attach()
+				except (FileNotFoundError, ValueError):
+					self.header = np.zeros(1, dtype=HEADER_DTYPE)
+					continue
+
+			written = self.written
+			if written == 0:
+				return None
+
+			frame = self.frames[(written - 1) % self.slots]
+			sequence = int(frame["sequence"])
+			if sequence % 2:
+				continue
+
+			amount = int(frame["amount"])
+			state = {
+				"frame_time": float(frame["frame_time"]),
+				"positions": frame["positions"][:amount].copy(),
+				"targets": frame["targets"][:amount].copy(),
+				"velocities": frame["velocities"][:amount].copy(),
+				"flags": frame["flags"][:amount].copy()}
+
+			if int(frame["sequence"]) == sequence:
+				return state
+
+		return None
+
+	def close(self):
+		"""
+		Detach from the shared memory, the exporter keeps it alive.
+		"""
+		self.header = self.frames = None
+		self.memory.close()
+
+
+def _is_running(pid):
+	"""
+	Check if a process is running, e.g. the exporter of a leftover memory.
+	"""
+	if pid <= 0 or pid == os.getpid():
+		return False
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		return True
+	return True
+
+
+def _views(buffer, capacity, slots):
+	"""
+	Create the numpy views of header and frames on a shared memory buffer.
+	"""
+	header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=buffer)
+	frames = np.ndarray((slots,), dtype=frame_dtype(capacity), buffer=buffer, offset=HEADER_DTYPE.itemsize)
+	return header, frames
@@ -0,0 +1,215 @@
+# Import needed modules
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from cflib.crazyflie import Crazyflie
+from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
+from cflib.crazyflie.toccache import TocCache
+
+
+class SharedTocCache(TocCache):
+	"""
+	TOC cache shared by all drones of the swarm, kept in memory and backed by a directory of cflib cache files.
+
+	A TOC is identified by the CRC the firmware reports for it, so drones with the same firmware share the same entry.
+	All files are read and validated once when the cache is warmed, files that can not be read or do not hold a complete
+	TOC are removed, so the drone downloads its TOC again instead of failing on it. Afterwards every lookup is answered
+	from memory, without touching the disk.
+	"""
+
+	FILE_PATTERN = re.compile(r"^([0-9A-F]{8})\.json$")  # Names of the cache files written by cflib
+
+	def __init__(self, path):
+		"""
+		:param path: Directory of the cache files.
+		"""
+		super().__init__(rw_cache=path)
+		self.path = path
+		self.tocs = {}  # TOCs by their CRC
+		self.lock = threading.Lock()  # The drones fetch and insert from their own threads
+		self.hits = 0
+		self.misses = 0
+
+	def warm(self):
+		"""
+		Read all cache files into memory.
+		:return: Amount of TOCs in the cache.
+		"""
+		for file_name in glob.glob(os.path.join(self.path, "*.json")):
+			match = self.FILE_PATTERN.match(os.path.basename(file_name))
+			try:
+				with open(file_name) as file:
+					toc = json.load(file, object_hook=self._decoder)
+				if match is None or not self._is_complete(toc):
+					raise ValueError("Not a complete TOC")
+			except (OSError, ValueError, KeyError, NameError) as error:
+				print("Removing invalid TOC cache file {}: {}".format(file_name, error))
+				os.remove(file_name)
+				continue
+			with self.lock:
+				self.tocs[int(match.group(1), 16)] = toc
+
+		return len(self.tocs)
+
+	def fetch(self, crc):
+		"""
+		Get the TOC with the given CRC, or None if it is not cached yet.
+		"""
+		with self.lock:
+			toc = self.tocs.get(crc)
+			if toc is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+
+		# Every drone gets its own groups, the elements themselves are never changed
+		return {group: dict(elements) for group, elements in toc.items()}
+
+	def insert(self, crc, toc):
+		"""
+		Add a downloaded TOC to the cache.
+		"""
+		with self.lock:
+			if crc in self.tocs:
+				return
+			self.tocs[crc] = {group: dict(elements) for group, elements in toc.items()}
+
+		# Write to a temporary file first, so other processes never read half a file
+		file_name = os.path.join(self.path, "%08X.json" % crc)
+		temp_name = "{}.{}.tmp".format(file_name, threading.get_ident())
+		with open(temp_name, "w") as file:
+			json.dump(toc, file, indent=2, default=self._encoder)
+		os.replace(temp_name, file_name)
+
+	@staticmethod
+	def _is_complete(toc):
+		"""
+		Check if a TOC holds every element from 0 to the highest index exactly once, as the firmware numbers them.
+		"""
+		idents = sorted(element.ident for elements in toc.values() for element in elements.values())
+		return idents == list(range(len(idents)))
+
+
+class SwarmLink:
+	"""
+	Connects the real drones, sharing a single TOC cache among them and reconnecting drones that lose their link.
+
+	The first drone is connected on its own, so its TOC is in the cache before the other drones connect in parallel and
+	only have to ask for the CRC of their TOC. If a drone loses its link in flight, it is reconnected in the background
+	with the same Crazyflie object and the warm cache, so only the radio link and a few packets are needed. While the
+	link is down, the drone is not sent any setpoints and its firmware stops it on its own.
+	"""
+
+	CACHE_PATH = "./cache"  # Directory of the TOC cache files, the same cflib used before
+	MAX_PARALLEL = 8  # Drones connected at the same time
+	RECONNECT_ATTEMPTS = 5  # Attempts to reconnect a lost drone before giving up
+	RECONNECT_DELAY = .2  # Seconds to wait before every attempt
+
+	def __init__(self, cache_path=CACHE_PATH):
+		"""
+		:param cache_path: Directory of the TOC cache files.
+		"""
+		self.toc_cache = SharedTocCache(cache_path)
+		self.toc_cache.warm()
+		self.links = {}  # Drones by their URI
+		self.closing = False  # Links lost while disconnecting on purpose are not reconnected
+		self.connect_times = {}  # Seconds every drone needed to connect, by URI
+
+	def connect(self, drones, uris):
+		"""
+		Connect the given drones to the real drones.
+		:param drones: The simulated drones, one for every URI.
+		:param uris: URIs of the real drones.
+		"""
+		self.closing = False
+		start = time.perf_counter()
+		pairs = list(zip(drones, uris))
+		if not pairs:
+			return
+
+		self._connect(*pairs[0])
+		with concurrent.futures.ThreadPoolExecutor(self.MAX_PARALLEL) as executor:
+			# Raise the first error, if any
+			for future in [executor.submit(self._connect, drone, uri) for drone, uri in pairs[1:]]:
+				future.result()
+
+		print("Connected {} drones in {:.2f}s (slowest {:.2f}s, TOC cache: {} hits, {} misses)".format(len(pairs),
+			time.perf_counter() - start, max(self.connect_times.values()), self.toc_cache.hits, self.toc_cache.misses))
+
+	def disconnect(self):
+		"""
+		Stop the rotors of all connected drones and close their links.
+		"""
+		self.closing = True
+		for drone in self.links.values():
+			if drone.crazyflie is not None:
+				drone.crazyflie.cf.commander.send_stop_setpoint()
+		time.sleep(.1)  # Wait until the command is sent as the queue is not flushed before closing the link
+
+		for drone in self.links.values():
+			if drone.crazyflie is not None:
+				drone.crazyflie.close_link()
+				drone.crazyflie = None
+		self.links = {}
+
+	def _connect(self, drone, uri):
+		"""
+		Open the link to a single drone and store it within the drone once it is ready.
+		"""
+		start = time.perf_counter()
+		crazyflie = Crazyflie()
+		crazyflie._toc_cache = self.toc_cache  # cflib has no way to pass a cache object
+		crazyflie.connection_lost.add_callback(self._connection_lost)
+		link = SyncCrazyflie(uri, cf=crazyflie)
+		link.open_link()
+		self.connect_times[uri] = time.perf_counter() - start
+		self.links[uri] = drone
+		drone.crazyflie = link
+
+	def _connection_lost(self, uri, message):
+		"""
+		Callback of cflib if a link is lost without closing it, starts reconnecting it.
+		"""
+		drone = self.links.get(uri)
+		if self.closing or drone is None or drone.crazyflie is None:
+			return
+
+		print("Lost connection to {}: {}".format(uri, message))
+		link = drone.crazyflie
+		drone.crazyflie = None  # No setpoints while the link is down
+		threading.Thread(target=self._reconnect, args=(drone, link, uri), daemon=True).start()
+
+	def _reconnect(self, drone, link, uri):
+		"""
+		Main function of the thread reconnecting a lost drone.
+		"""
+		start = time.perf_counter()
+
+		# Without a link the thread receiving packets only looks for a new link every second, closing replaces it
+		link.cf.close_link()
+
+		for attempt in range(self.RECONNECT_ATTEMPTS):
+			time.sleep(self.RECONNECT_DELAY)
+			if self.closing or self.links.get(uri) is not drone:
+				return
+			try:
+				link.open_link()
+			except Exception as error:
+				print("Reconnecting to {} failed ({}/{}): {}".format(uri, attempt + 1, self.RECONNECT_ATTEMPTS,
+					str(error).splitlines()[0]))
+				continue
+
+			# Disconnected while the link was opened
+			if self.closing or self.links.get(uri) is not drone:
+				link.close_link()
+				return
+			drone.crazyflie = link
+			print("Reconnected to {} in {:.2f}s".format(uri, time.perf_counter() - start))
+			return
+
+		print("Giving up on {}".format(uri))
@@ -0,0 +1,206 @@
+# Load classes from other files
+from spatial_index import neighbour_pairs
+
+# Import needed modules
+import numpy as np
+
+
+class SwarmMetrics:
+	"""
+	Measures the quality of the flight of the whole swarm, for all drones at once every update:
+	- min_separation: smallest distance between any two drones
+	- crowded: amount of drones with another drone within the avoidance radius
+	- mean_error and max_error: mean and largest distance of the drones to their targets
+	- path_efficiency: straight distance divided by the distance actually flown, over all legs so far, a leg being the
+	way of a drone from leaving its target until it arrived at the next one (see convergence.py)
+	- energy: sum of the magnitudes of the forces applied to the drones in this update
+
+	Only running sums are kept, the rows of the last updates are held in a rolling window for quick summaries and can be
+	written to a compact binary file (records of DTYPE, read with SwarmMetrics.read), so evaluating a run does not need
+	the trajectories of the drones.
+	"""
+
+	WINDOW = 500  # Updates kept in the rolling window, 5 seconds at the physics rate
+	FLUSH_ROWS = 100  # Rows buffered before they are written to the file
+	MIN_PATH = 1e-3  # Flown distance below which the path efficiency is undefined
+
+	# Record of a single update, also the format of the file
+	DTYPE = np.dtype([
+		("time", "<f8"),
+		("min_separation", "<f4"),
+		("crowded", "<u4"),
+		("mean_error", "<f4"),
+		("max_error", "<f4"),
+		("path_efficiency", "<f4"),
+		("energy", "<f4"),
+	])
+
+	def __init__(self, radius):
+		"""
+		:param radius: Avoidance radius of the drones, drones closer to each other than this count as crowded.
+		"""
+		self.radius = radius
+		self.window = np.zeros(self.WINDOW, dtype=self.DTYPE)
+		self.rows = 0  # Rows ever added to the window
+		self.total_energy = 0  # Sum of the magnitudes of all forces over time since the start
+
+		# Legs of the drones for the path efficiency
+		self.last_positions = None  # Positions of the last update
+		self.travelling = np.zeros(0, dtype=bool)  # If a drone is on its way to its target
+		self.leg_starts = np.zeros((0, 3))  # Position every drone started its current leg at
+		self.leg_lengths = np.zeros(0)  # Distance every drone flew on its current leg
+		self.finished_straight = 0  # Straight distance of all finished legs
+		self.finished_length = 0  # Distance flown on all finished legs
+
+		# File the rows are written to, if recording
+		self.file = None
+		self.pending = []
+
+	def update(self, time, positions, targets, forces, arrived, dt):
+		"""
+		Measure the swarm of this update.
+		:param time: Simulated time of the update.
+		:param positions: Positions of all drones, shape (N, 3).
+		:param targets: Targets of all drones, shape (N, 3).
+		:param forces: Forces applied to all drones, shape (N, 3).
+		:param arrived: If every drone arrived at its target, shape (N,), see ConvergenceTracker.
+		:param dt: Time since the last update.
+		"""
+		row = np.zeros((), dtype=self.DTYPE)
+		row["time"] = time
+		row["min_separation"], row["crowded"] = self._separation(positions)
+
+		errors = np.linalg.norm(positions - targets, axis=1)
+		row["mean_error"] = errors.mean() if len(errors) > 0 else 0
+		row["max_error"] = errors.max() if len(errors) > 0 else 0
+
+		row["path_efficiency"] = self._update_legs(positions, arrived)
+
+		row["energy"] = np.linalg.norm(forces, axis=1).sum()
+		self.total_energy += float(row["energy"]) * dt
+
+		self.window[self.rows % self.WINDOW] = row
+		self.rows += 1
+
+		if self.file is not None:
+			self.pending.append(row)
+			if len(self.pending) >= self.FLUSH_ROWS:
+				self._flush()
+
+	def _separation(self, positions):
+		"""
+		Find the smallest distance between two drones and the drones having neighbours within the avoidance radius.
+		If no drones are that close, the radius is doubled until the closest pair is found.
+		:return: Tuple of the smallest distance (infinite for less than two drones) and the amount of crowded drones.
+		"""
+		if len(positions) < 2:
+			return np.inf, 0
+
+		i, j = neighbour_pairs(positions, self.radius)
+		crowded = len(np.unique(i))
+
+		radius = self.radius
+		extent = np.linalg.norm(np.ptp(positions, axis=0))
+		while len(i) == 0 and radius <= extent:
+			radius *= 2
+			i, j = neighbour_pairs(positions, radius)
+
+		return np.linalg.norm(positions[i] - positions[j], axis=1).min(), crowded
+
+	def _update_legs(self, positions, arrived):
+		"""
+		Add the movements of this update to the legs of the drones, start and finish legs on leaving and reaching the
+		targets.
+		:return: Path efficiency over all legs so far, including those not finished yet.
+		"""
+		travelling = ~arrived
+		if self.last_positions is None or len(self.last_positions) != len(positions):
+			# The first update or a changed amount of drones starts all legs over
+			self.travelling = travelling
+			self.leg_starts = positions.copy()
+			self.leg_lengths = np.zeros(len(positions))
+		else:
+			started = travelling & ~self.travelling
+			self.leg_starts[started] = self.last_positions[started]
+			self.leg_lengths[started] = 0
+
+			steps = np.linalg.norm(positions - self.last_positions, axis=1)
+			self.leg_lengths += np.where(travelling | self.travelling, steps, 0)
+
+			finished = self.travelling & ~travelling
+			straight = np.linalg.norm(positions - self.leg_starts, axis=1)
+			self.finished_straight += straight[finished].sum()
+			self.finished_length += self.leg_lengths[finished].sum()
+			self.travelling = travelling
+
+		self.last_positions = positions.copy()
+
+		straight = np.linalg.norm(positions[travelling] - self.leg_starts[travelling], axis=1).sum()
+		length = self.finished_length + self.leg_lengths[travelling].sum()
+		if length < self.MIN_PATH:
+			return np.nan
+		return (self.finished_straight + straight) / length
+
+	def recent(self):
+		"""
+		Get the rows of the rolling window, oldest first.
+		:return: Array of DTYPE records.
+		"""
+		if self.rows <= self.WINDOW:
+			return self.window[:self.rows].copy()
+		return np.roll(self.window, -(self.rows % self.WINDOW))
+
+	def summary(self):
+		"""
+		Summarise the rolling window.
+		:return: Dictionary with mean, min and max of every metric over the window and the last value, as well as the
+		energy since the start.
+		"""
+		rows = self.recent()
+		summary = {"updates": len(rows), "total_energy": self.total_energy}
+		for name in self.DTYPE.names[1:]:
+			values = rows[name].astype(float)
+			values = values[np.isfinite(values)]
+			if len(values) == 0:
+				summary[name] = None
+				continue
+			summary[name] = {"last": float(rows[name][-1]), "mean": float(values.mean()), "min": float(values.min()),
+				"max": float(values.max())}
+		return summary
+
+	def start_recording(self, path):
+		"""
+		Write every following row to a file.
+		:param path: Path of the file, an existing file is replaced.
+		"""
+		self.stop_recording()
+		self.file = open(path, "wb")
+
+	def stop_recording(self):
+		"""
+		Write the remaining rows and close the file, if recording.
+		"""
+		if self.file is None:
+			return
+		self._flush()
+		self.file.close()
+		self.file = None
+
+	def _flush(self):
+		"""
+		Write the buffered rows to the file.
+		"""
+		if self.pending:
+			self.file.write(np.array(self.pending, dtype=self.DTYPE).tobytes())
+			self.file.flush()
+			self.pending = []
+
+	@classmethod
+	def read(cls, path):
+		"""
+		Read a file written while recording, a row cut off at the end (e.g. by a crash) is dropped.
+		:param path: Path of the file.
+		:return: Array of DTYPE records, one for every update.
+		"""
+		data = np.fromfile(path, dtype=np.uint8)
+		return data[:len(data) - len(data) % cls.DTYPE.itemsize].view(cls.DTYPE)
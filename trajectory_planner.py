@@ -0,0 +1,310 @@
+# Import needed modules
+import heapq
+import itertools
+import random
+import time
+
+import numpy as np
+
+# Load classes from other files
+from spatial_index import neighbour_pairs
+
+
+def closest_approach(trajectories, radius=1, sample_time=.02):
+	"""
+	Fly all trajectories at the same time and find how close every drone gets to any other one, sampled in time.
+	:param trajectories: Trajectories starting at the same time.
+	:param radius: Distances beyond this are not looked at.
+	:param sample_time: Time between two samples.
+	:return: Array with the smallest distance of every drone to any other drone, inf if none came closer than the radius.
+	"""
+	closest = np.full(len(trajectories), np.inf)
+	if not trajectories:
+		return closest
+
+	times = np.arange(0, max(trajectory.duration for trajectory in trajectories) + sample_time, sample_time)
+	for t in times:
+		positions = np.array([trajectory.sample(t) for trajectory in trajectories])
+		i, j = neighbour_pairs(positions, radius)
+		np.minimum.at(closest, i, np.linalg.norm(positions[i] - positions[j], axis=1))
+	return closest
+
+
+class Trajectory:
+	"""
+	Time-parameterised path of a single drone, linearly interpolated between its waypoints.
+	"""
+
+	def __init__(self, times, positions):
+		"""
+		:param times: Array of strictly increasing times (in seconds from the start) of the waypoints, shape (K,).
+		:param positions: Array of the waypoints, shape (K, 3).
+		"""
+		self.times = times
+		self.positions = positions
+
+	@property
+	def duration(self):
+		"""
+		Time needed to fly the whole trajectory.
+		"""
+		return self.times[-1]
+
+	def sample(self, t):
+		"""
+		Get the position on the trajectory at a given time, times beyond the end return the last waypoint.
+		:param t: Time since start of the trajectory.
+		:return: Position as an array of shape (3,).
+		"""
+		# Look up the waypoints around the time once for all axes
+		i = np.searchsorted(self.times, t, side="right")
+		if i == 0:
+			return self.positions[0].copy()
+		if i == len(self.times):
+			return self.positions[-1].copy()
+		weight = (t - self.times[i - 1]) / (self.times[i] - self.times[i - 1])
+		return self.positions[i - 1] + (self.positions[i] - self.positions[i - 1]) * weight
+
+
+class PlanResult:
+	"""
+	Trajectories of all drones of a single planning run, together with some metrics about the run.
+	"""
+
+	def __init__(self, trajectories, planning_time, straight, expanded):
+		self.trajectories = trajectories  # One trajectory for every drone, same order as the starts
+		self.planning_time = planning_time  # Seconds needed to plan all trajectories
+		self.straight = straight  # Indices of the drones no collision free path was found for, they fly straight
+		self.fallbacks = len(straight)  # Amount of drones no collision free path was found for
+		self.expanded = expanded  # Amount of space-time nodes expanded by the search
+
+
+class TrajectoryPlanner:
+	"""
+	Plans collision-free trajectories for formation transitions by prioritised planning over a space-time grid.
+	Drones are planned one after another, every planned path reserves its cells and all cells around them in time so the
+	following drones have to plan around it. Two planned drones are therefore always at least two cells apart along one
+	axis at every step, and at least sqrt(2) cells apart while moving from one step to the next.
+	Drones that can not be planned fall back to a straight line, the avoidance forces are still active.
+	"""
+
+	CELL_SIZE = .25  # Edge length of a grid cell, small enough that sqrt(2) cells are more than MIN_SEPARATION
+	STEP_TIME = .3  # Time to fly from one cell to a neighbouring one
+	MIN_SEPARATION = .2  # Distance two planned drones keep, two collision spheres
+	WALL_CLEARANCE = .2  # Cells whose centre is closer to a wall are not used
+	MAX_STEPS_FACTOR = 4  # The search gives up after this many times the grid extent in time steps
+
+	# Every move within a step: waiting and all 26 neighbouring cells
+	MOVES = list(itertools.product((-1, 0, 1), repeat=3))
+
+	def __init__(self, lower, upper, blocked=None, cell_size=CELL_SIZE, step_time=STEP_TIME):
+		"""
+		:param lower: Lower corner of the space to plan in, array of shape (3,).
+		:param upper: Upper corner of the space to plan in, array of shape (3,).
+		:param blocked: Boolean grid of cells that can not be used, None if all cells are free.
+		:param cell_size: Edge length of a grid cell.
+		:param step_time: Time to fly from one cell to a neighbouring one.
+		"""
+		self.lower = np.asarray(lower, dtype=float)
+		self.cell_size = cell_size
+		self.step_time = step_time
+		self.shape = tuple(np.maximum(np.floor((np.asarray(upper) - self.lower) / cell_size), 1).astype(int))
+		self.blocked = blocked if blocked is not None else np.zeros(self.shape, dtype=bool)
+		self.max_steps = self.MAX_STEPS_FACTOR * max(self.shape)
+
+	@classmethod
+	def from_room(cls, room_sdf, cell_size=CELL_SIZE, step_time=STEP_TIME):
+		"""
+		Create a planner for the room, cells too close to a wall are blocked.
+		:param room_sdf: Distance field of the room.
+		"""
+		planner = cls(room_sdf.lower, room_sdf.upper, cell_size=cell_size, step_time=step_time)
+		centres = np.stack(np.meshgrid(*[np.arange(n) for n in planner.shape], indexing="ij"), axis=-1).reshape(-1, 3)
+		distances = room_sdf.distance(planner._cell_centres(centres))
+		planner.blocked = (distances < cls.WALL_CLEARANCE).reshape(planner.shape)
+		return planner
+
+	def _cell_centres(self, cells):
+		"""
+		Convert grid cells to the positions of their centres.
+		"""
+		return self.lower + (np.asarray(cells) + .5) * self.cell_size
+
+	def _cell(self, position):
+		"""
+		Get the grid cell containing a position, clamped to the grid.
+		"""
+		cell = np.floor((position - self.lower) / self.cell_size).astype(int)
+		return tuple(np.clip(cell, 0, np.array(self.shape) - 1))
+
+	def plan(self, starts, goals):
+		"""
+		Plan trajectories for all drones.
+		:param starts: Current positions of the drones, shape (N, 3).
+		:param goals: Positions in the new formation, shape (N, 3).
+		:return: PlanResult containing one trajectory per drone.
+		"""
+		start_time = time.perf_counter()
+		starts = np.asarray(starts, dtype=float)
+		goals = np.asarray(goals, dtype=float)
+
+		occupied = set()  # (cell, step) for every cell a planned drone is in or next to
+		parked = {}  # cell -> step from which on a planned drone stays in or next to this cell
+		latest = {}  # cell -> last step the cell is used by or next to any planned drone
+		waiting = {}  # cell -> amount of drones not planned yet in or next to this cell, they are there until step 1
+
+		for start in starts:
+			for cell in self._neighbourhood(self._cell(start)):
+				waiting[cell] = waiting.get(cell, 0) + 1
+
+		# Drones with the longest way go first, they are the hardest to plan around
+		order = np.argsort(-np.linalg.norm(goals - starts, axis=1), kind="stable")
+
+		trajectories = [None] * len(starts)
+		straight = []
+		expanded = 0
+
+		for i in order:
+			start_cell, goal_cell = self._cell(starts[i]), self._cell(goals[i])
+			# The drone does not have to keep away from itself
+			for cell in self._neighbourhood(start_cell):
+				waiting[cell] -= 1
+
+			path = None
+			# Two drones can not end up next to each other, no need to search in that case
+			if goal_cell not in parked:
+				path, nodes = self._search(start_cell, goal_cell, occupied, parked, latest, waiting)
+				expanded += nodes
+
+			if path is None:
+				# No collision free path, fly straight and rely on the avoidance forces, the cells it passes are still
+				# reserved so the following drones plan around it
+				straight.append(i)
+				steps = int(np.ceil(max(np.linalg.norm(goals[i] - starts[i]) / self.cell_size, 1)))
+				fractions = np.arange(steps + 1)[:, np.newaxis] / steps
+				self._reserve([self._cell(position) for position in starts[i] + (goals[i] - starts[i]) * fractions],
+					occupied, parked, latest)
+				trajectories[i] = Trajectory(np.array([0, steps * self.step_time]), np.array([starts[i], goals[i]]))
+				continue
+
+			# Reserve the path for all drones that are planned afterwards
+			self._reserve(path, occupied, parked, latest)
+
+			# Replace the cell centres at both ends with the exact positions
+			positions = self._cell_centres(path)
+			positions[0] = starts[i]
+			positions[-1] = goals[i]
+			trajectories[i] = Trajectory(np.arange(len(path)) * self.step_time, positions)
+
+		return PlanResult(trajectories, time.perf_counter() - start_time, straight, expanded)
+
+	@classmethod
+	def _neighbourhood(cls, cell):
+		"""
+		Get a cell and all 26 cells around it.
+		"""
+		return [(cell[0] + move[0], cell[1] + move[1], cell[2] + move[2]) for move in cls.MOVES]
+
+	@classmethod
+	def _reserve(cls, path, occupied, parked, latest):
+		"""
+		Reserve the cells of a path (one per step) and all cells around them for all drones that are planned afterwards.
+		"""
+		for step, cell in enumerate(path):
+			for neighbour in cls._neighbourhood(cell):
+				occupied.add((neighbour, step))
+				latest[neighbour] = max(latest.get(neighbour, 0), step)
+		for neighbour in cls._neighbourhood(path[-1]):
+			parked[neighbour] = min(parked.get(neighbour, len(path) - 1), len(path) - 1)
+
+	@staticmethod
+	def _is_free(cell, step, occupied, parked, waiting):
+		"""
+		Check if a drone can be in a cell at a certain step.
+		"""
+		if (cell, step) in occupied:
+			return False
+		if cell in parked and step >= parked[cell]:
+			return False
+		return step > 1 or not waiting.get(cell, 0)
+
+	def _search(self, start, goal, occupied, parked, latest, waiting):
+		"""
+		A* search through space and time from the start to the goal cell.
+		:return: Tuple of the path as a list of cells (one per step) or None if no path was found, and the amount of
+		expanded nodes.
+		"""
+		# The goal can not be stayed at before the last step another drone passes next to it
+		goal_free = latest.get(goal, 0)
+
+		def heuristic(cell, step):
+			return max(abs(cell[0] - goal[0]), abs(cell[1] - goal[1]), abs(cell[2] - goal[2]), goal_free - step)
+
+		size_x, size_y, size_z = self.shape
+		counter = itertools.count()  # Tie breaker so cells never have to be compared
+		# Nodes with the same cost are taken closest to the goal first
+		queue = [(heuristic(start, 0), heuristic(start, 0), next(counter), start, 0, None)]
+		parents = {}
+		expanded = 0
+
+		while queue:
+			_, _, _, cell, step, parent = heapq.heappop(queue)
+			if (cell, step) in parents:
+				continue
+			parents[(cell, step)] = parent
+			expanded += 1
+
+			# Only stay at the goal once no other drone passes through it anymore
+			if cell == goal and step >= goal_free:
+				path = [cell]
+				while parent is not None:
+					path.append(parent[0])
+					parent = parents[parent]
+				return path[::-1], expanded
+
+			if step >= self.max_steps:
+				continue
+
+			for move in self.MOVES:
+				neighbour = (cell[0] + move[0], cell[1] + move[1], cell[2] + move[2])
+				if not (0 <= neighbour[0] < size_x and 0 <= neighbour[1] < size_y and 0 <= neighbour[2] < size_z):
+					continue
+				if self.blocked[neighbour] and neighbour != goal:
+					continue
+				if (neighbour, step + 1) in parents:
+					continue
+				if not self._is_free(neighbour, step + 1, occupied, parked, waiting):
+					continue
+				remaining = heuristic(neighbour, step + 1)
+				heapq.heappush(queue, (step + 1 + remaining, remaining, next(counter), neighbour, step + 1, (cell, step)))
+
+		return None, expanded
+
+
+if __name__ == "__main__":
+	# Print planning time metrics and the closest approach of planned drones for growing swarms in a room sized space
+	lower = np.array([-2.4, -1.8, 0])
+	upper = np.array([2.4, 1.8, 2.6])
+	planner = TrajectoryPlanner(lower, upper)
+	random.seed(0)
+
+	def random_positions(amount, spacing=.6):
+		positions = []
+		while len(positions) < amount:
+			position = np.array([random.uniform(lower[axis] + .3, upper[axis] - .3) for axis in range(3)])
+			if all(np.linalg.norm(position - other) >= spacing for other in positions):
+				positions.append(position)
+		return np.array(positions)
+
+	def report(name, starts, goals):
+		result = planner.plan(starts, goals)
+		planned = [trajectory for i, trajectory in enumerate(result.trajectories) if i not in result.straight]
+		print("{:>20}: {:7.3f} s, {:3d} fallbacks, {:7d} expanded nodes, planned drones {:.3f} apart".format(
+			name, result.planning_time, result.fallbacks, result.expanded, closest_approach(planned).min()))
+
+	for amount in (5, 10, 25, 50, 100):
+		report("{} drones".format(amount), random_positions(amount), random_positions(amount))
+
+	# Drones on a tight grid swapping their places
+	grid = np.array([[(x - 3.5) * .5, (y - 2) * .5, 1] for x in range(8) for y in range(5)])
+	report("40 drones on a grid", grid, grid[np.random.default_rng(0).permutation(len(grid))])